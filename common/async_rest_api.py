@@ -0,0 +1,144 @@
+from typing import Any, Awaitable, Optional
+import asyncio
+import logging
+import httpx
+
+from common.models import FailedSymbol, FetchResult
+
+RETRY_STATUS_CODES = {429, 503}
+
+
+async def gather_results(requests: dict[Any, Awaitable]) -> FetchResult:
+    """Await requests keyed by symbol (or conid) concurrently. A failed request
+    is reported in `failed_symbols` and does not cancel the others."""
+    results = await asyncio.gather(*requests.values(), return_exceptions=True)
+    fetch_result = FetchResult(data=[])
+    for key, result in zip(requests, results):
+        if isinstance(result, Exception):
+            fetch_result.failed_symbols.append(
+                FailedSymbol(
+                    symbol=str(key), error=str(result), error_type=type(result).__name__
+                )
+            )
+        else:
+            fetch_result.data.append(result)
+    return fetch_result
+
+
+class AsyncRestAPI:
+    """Async counterpart of RestAPI sharing one pooled keep-alive client.
+
+    At most `max_in_flight` requests are outstanding at once. When the server
+    answers 429/503 every request pauses for a backoff delay that doubles on
+    each throttled response and halves again on successes.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 16,
+        max_retries: int = 5,
+        min_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        timeout: float = 30.0,
+    ):
+        self.base_url = ""
+        self.endpoints = {}
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._backoff = 0.0
+        self._resume_at = 0.0
+
+    async def __aenter__(self):
+        self._client = httpx.AsyncClient(
+            verify=False,
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.max_in_flight,
+                max_keepalive_connections=self.max_in_flight,
+            ),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._client.aclose()
+        self._client = None
+
+    async def _wait_for_backoff(self) -> None:
+        loop = asyncio.get_running_loop()
+        while (delay := self._resume_at - loop.time()) > 0:
+            await asyncio.sleep(delay)
+
+    def _throttled(self, response: httpx.Response) -> None:
+        self._backoff = min(max(self._backoff * 2, self.min_backoff), self.max_backoff)
+        delay = self._backoff
+        retry_after = response.headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        loop = asyncio.get_running_loop()
+        self._resume_at = max(self._resume_at, loop.time() + delay)
+        logging.warning(
+            f"{response.url} returned {response.status_code}, backing off {delay}s"
+        )
+
+    async def fetch_response(
+        self,
+        endpoint: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        path_params: Optional[dict] = None,
+    ) -> httpx.Response:
+        if self._client is None:
+            raise RuntimeError(f"Use {type(self).__name__} as an async context manager")
+
+        url = self.base_url + self.endpoints[endpoint].format(**(path_params or {}))
+        for _ in range(self.max_retries + 1):
+            await self._wait_for_backoff()
+            async with self._semaphore:
+                response = await self._client.get(url, params=params, headers=headers)
+            if response.status_code not in RETRY_STATUS_CODES:
+                self._backoff /= 2
+                return response
+            self._throttled(response)
+        response.raise_for_status()
+
+    async def fetch_status_code(
+        self,
+        endpoint: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        path_params: Optional[dict] = None,
+    ):
+        response = await self.fetch_response(
+            endpoint, headers=headers, params=params, path_params=path_params
+        )
+        return response.status_code
+
+    async def fetch_response_text(
+        self,
+        endpoint: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        path_params: Optional[dict] = None,
+    ):
+        response = await self.fetch_response(
+            endpoint, headers=headers, params=params, path_params=path_params
+        )
+        return response.text
+
+    async def fetch_response_json(
+        self,
+        endpoint: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        path_params: Optional[dict] = None,
+    ):
+        response = await self.fetch_response(
+            endpoint, headers=headers, params=params, path_params=path_params
+        )
+        return response.json()
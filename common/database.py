@@ -1,12 +1,144 @@
+import itertools
+import queue
 import sqlite3
-from common.dt import format_datetime
-from pandas import DataFrame, read_sql, read_sql_query
-from typing import Optional
-from datetime import datetime
+import threading
+import weakref
+from pathlib import Path
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date
+from common.dt import EPOCH, epoch_seconds
+from pandas import DataFrame, read_sql_query
+from typing import Any, Iterator, Mapping, Optional, Sequence, Union
+import logging
+import numpy as np
+import pandas as pd
+import pyarrow as pa
 from abc import ABC, abstractmethod
 
 DATABASE_FILE = "database/sqlite3db"
 
+SQLITE_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024,  # negative values are KiB
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,
+}
+
+CHUNK_SIZE = 100_000
+BULK_BATCH_SIZE = 50_000
+# Rows per multi-row INSERT; beyond ~1000 rows statements stop getting faster
+BULK_ROWS_PER_STATEMENT = 1000
+MAX_BOUND_VARIABLES = 32766 if sqlite3.sqlite_version_info >= (3, 32) else 999
+
+ColumnarData = Union[DataFrame, Mapping[str, Union[np.ndarray, Sequence]]]
+
+
+@dataclass
+class Range:
+    """Inclusive range filter; either bound may be left open."""
+
+    low: Any = None
+    high: Any = None
+
+
+def build_where(
+    filters: Optional[dict[str, Any]] = None,
+    date_range: Optional[tuple[date, date]] = None,
+    date_column: str = "date",
+) -> tuple[str, list]:
+    """WHERE clause with bound parameters: scalars become `=`, lists, tuples
+    and sets `IN` and `Range` values `BETWEEN`-style bounds. `date_range` is
+    an inclusive range on an epoch-day date column."""
+    filters = dict(filters or {})
+    if date_range:
+        start, end = date_range
+        filters[date_column] = Range((start - EPOCH).days, (end - EPOCH).days)
+    conditions, params = [], []
+    for column, value in filters.items():
+        column = f'"{column}"'
+        if isinstance(value, Range):
+            if value.low is not None:
+                conditions.append(f"{column} >= ?")
+                params.append(value.low)
+            if value.high is not None:
+                conditions.append(f"{column} <= ?")
+                params.append(value.high)
+        elif isinstance(value, (list, tuple, set)):
+            values = list(value)
+            if not values:
+                conditions.append("0")
+                continue
+            conditions.append(f"{column} IN ({', '.join('?' for _ in values)})")
+            params.extend(values)
+        elif value is None:
+            conditions.append(f"{column} IS NULL")
+        else:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where, params
+
+
+def build_select(
+    source: str,
+    columns: Optional[list[str]] = None,
+    filters: Optional[dict[str, Any]] = None,
+    distinct: bool = False,
+    date_range: Optional[tuple[date, date]] = None,
+    limit: Optional[int] = None,
+    order_by: Optional[list[str]] = None,
+) -> tuple[str, list]:
+    select = ", ".join(f'"{col}"' for col in columns) if columns else "*"
+    where, params = build_where(filters, date_range)
+    query = f"SELECT {'DISTINCT ' if distinct else ''}{select} FROM {source} {where}"
+    if order_by:
+        query += " ORDER BY " + ", ".join(f'"{col}"' for col in order_by)
+    if limit:
+        query += " LIMIT ?"
+        params.append(limit)
+    return query, params
+
+
+def _column_values(values: np.ndarray) -> list:
+    """Python scalars sqlite3 can bind, with missing values as None."""
+    if values.dtype.kind in "iub":
+        return values.tolist()
+    if values.dtype.kind == "M":
+        return [
+            None if pd.isna(value) else value.isoformat(" ")
+            for value in pd.to_datetime(values)
+        ]
+    missing = pd.isna(values)
+    if missing.any():
+        values = values.astype(object)
+        values[missing] = None
+    return values.tolist()
+
+
+def iter_row_batches(
+    data: ColumnarData, batch_size: int = BULK_BATCH_SIZE
+) -> Iterator[list[tuple]]:
+    """Rows of columnar data as tuples, converted one batch at a time so only
+    a batch of Python objects exists at once."""
+    columns = [np.asarray(values) for values in data.values()]
+    length = len(columns[0]) if columns else 0
+    for start in range(0, length, batch_size):
+        stop = start + batch_size
+        yield list(zip(*(_column_values(values[start:stop]) for values in columns)))
+
+
+def _flatten(rows: list[tuple]) -> list:
+    return list(itertools.chain.from_iterable(rows))
+
+
+def _with_ts(data: ColumnarData) -> dict[str, Any]:
+    columns = dict(data.items())
+    length = len(next(iter(columns.values()))) if columns else 0
+    columns["_ts"] = np.full(length, epoch_seconds(), dtype=np.int64)
+    return columns
+
 
 class DBConnection(ABC):
     @abstractmethod
@@ -29,6 +161,10 @@ class DBConnection(ABC):
     def df_to_sql_table(self):
         ...
 
+    @abstractmethod
+    def upsert_df_to_sql_table(self):
+        ...
+
     @abstractmethod
     def sql_table_to_df(self) -> DataFrame:
         ...
@@ -37,23 +173,118 @@ class DBConnection(ABC):
     def sql_query_to_df(self) -> DataFrame:
         ...
 
+    @abstractmethod
+    def iter_sql_table_chunks(self) -> Iterator[Union[DataFrame, pa.RecordBatch]]:
+        ...
+
+    @abstractmethod
+    def iter_sql_query_chunks(self) -> Iterator[Union[DataFrame, pa.RecordBatch]]:
+        ...
+
     @abstractmethod
     def deduplicate_table(self):
         ...
 
 
+class _ThreadReader:
+    """Pins a pooled reader to the current thread and hands it back to the
+    pool once the thread (and with it its thread-local state) is gone."""
+
+    def __init__(self, conn: sqlite3.Connection, pool: queue.SimpleQueue):
+        self.conn = conn
+        weakref.finalize(self, pool.put, conn)
+
+
+class SQLiteConnectionManager:
+    """Long-lived SQLite connections for one database file.
+
+    Each thread keeps a persistent read-only connection taken from a shared
+    pool, so Dash callbacks stop reconnecting on every query. All writes go
+    through a single writer connection serialized by a lock. With WAL
+    journaling, readers keep reading the last committed snapshot while the
+    ETL writes.
+    """
+
+    def __init__(self, db_file: str, pragmas: Optional[dict] = None):
+        self.db_file = db_file
+        self.pragmas = {**SQLITE_PRAGMAS, **(pragmas or {})}
+        self._local = threading.local()
+        self._idle_readers = queue.SimpleQueue()
+        self._readers: list[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.RLock()
+
+    def _configure(self, conn: sqlite3.Connection) -> sqlite3.Connection:
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def _writer_connection(self) -> sqlite3.Connection:
+        with self._writer_lock:
+            if self._writer is None:
+                conn = sqlite3.connect(self.db_file, check_same_thread=False)
+                conn.execute("PRAGMA journal_mode = WAL")
+                self._writer = self._configure(conn)
+            return self._writer
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """Serialized write access; commits on success, rolls back on error."""
+        with self._writer_lock:
+            conn = self._writer_connection()
+            with conn:
+                yield conn
+
+    def _open_reader(self) -> sqlite3.Connection:
+        # The writer switches the file to WAL before the first read-only open
+        if self._writer is None:
+            self._writer_connection()
+        uri = f"{Path(self.db_file).absolute().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn = self._configure(conn)
+        conn.execute("PRAGMA query_only = 1")
+        with self._readers_lock:
+            self._readers.append(conn)
+        return conn
+
+    def reader(self) -> sqlite3.Connection:
+        if self.db_file == ":memory:":
+            return self._writer_connection()
+        thread_reader = getattr(self._local, "reader", None)
+        if thread_reader is None:
+            try:
+                conn = self._idle_readers.get_nowait()
+            except queue.Empty:
+                conn = self._open_reader()
+            thread_reader = _ThreadReader(conn, self._idle_readers)
+            self._local.reader = thread_reader
+        return thread_reader.conn
+
+    def close(self) -> None:
+        self._local = threading.local()
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        self._idle_readers = queue.SimpleQueue()
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
 class SQLDBConnection(DBConnection):
     def __init__(self, db_file: str):
         self.db_file = db_file
+        self.connections = SQLiteConnectionManager(db_file)
 
     def _fetch_cursor(self):
-        with sqlite3.connect(self.db_file) as db_conn:
-            return db_conn.cursor()
+        return self.connections.reader().cursor()
 
-    def execute_query(self, query):
-        cursor = self._fetch_cursor()
-        cursor.execute(query)
-        return cursor.fetchall()
+    def execute_query(self, query, params: Sequence = ()):
+        with self.connections.writer() as db_conn:
+            return db_conn.execute(query, params).fetchall()
 
     def fetch_tables_in_db(self) -> list[str]:
         query = """ SELECT name
@@ -70,27 +301,170 @@ class SQLDBConnection(DBConnection):
         schema: Optional[str] = None,
         if_exists: str = "append",
     ):
-        df["_ts"] = format_datetime(datetime.now())
-        with sqlite3.connect(self.db_file) as db_conn:
-            df.to_sql(
+        if if_exists == "append" and schema is None and self.table_exists(table):
+            self.bulk_insert(df, table)
+            return
+        with self.connections.writer() as db_conn:
+            df.assign(_ts=epoch_seconds()).to_sql(
                 name=table, schema=schema, con=db_conn, if_exists=if_exists, index=False
             )
 
-    def sql_query_to_df(self, query: str) -> DataFrame:
-        with sqlite3.connect(self.db_file) as db_conn:
-            return read_sql_query(sql=query, con=db_conn)
+    def table_exists(self, table: str) -> bool:
+        query = "SELECT 1 FROM sqlite_schema WHERE type = 'table' AND name = ?"
+        return bool(self.execute_query(query, (table,)))
+
+    def bulk_insert(
+        self,
+        data: ColumnarData,
+        table: str,
+        batch_size: int = BULK_BATCH_SIZE,
+        journal_off: bool = False,
+    ) -> int:
+        """Insert a DataFrame or a dict of column arrays into an existing table.
+
+        Rows go through one prepared multi-row INSERT with executemany, which
+        halves the per-row overhead of single-row statements. Batches of
+        `batch_size` rows are committed in turn while the writer is held for
+        the whole load. `journal_off` disables the journal and fsyncs for
+        initial backfills: it needs the database to itself, and a crash
+        mid-load can corrupt it.
+        """
+        columns = _with_ts(data)
+        names = ", ".join(f'"{col}"' for col in columns)
+        row_values = f"({', '.join('?' for _ in columns)})"
+
+        def insert_query(row_count: int) -> str:
+            values = ", ".join(row_values for _ in range(row_count))
+            return f"INSERT INTO {table} ({names}) VALUES {values}"
+
+        per_statement = max(
+            1, min(BULK_ROWS_PER_STATEMENT, MAX_BOUND_VARIABLES // len(columns))
+        )
+        query = insert_query(per_statement)
+        rows = 0
+        with self.connections.writer() as db_conn:
+            if journal_off:
+                try:
+                    db_conn.execute("PRAGMA journal_mode = OFF")
+                except sqlite3.OperationalError as e:
+                    # Leaving WAL needs exclusive access; other readers are open
+                    logging.warning(f"Could not disable the journal: {e}")
+                db_conn.execute("PRAGMA synchronous = OFF")
+            try:
+                for batch in iter_row_batches(columns, batch_size):
+                    full = len(batch) - len(batch) % per_statement
+                    db_conn.executemany(
+                        query,
+                        (
+                            _flatten(batch[i : i + per_statement])
+                            for i in range(0, full, per_statement)
+                        ),
+                    )
+                    if full < len(batch):
+                        db_conn.execute(
+                            insert_query(len(batch) - full),
+                            _flatten(batch[full:]),
+                        )
+                    db_conn.commit()
+                    rows += len(batch)
+            finally:
+                if journal_off:
+                    db_conn.commit()
+                    db_conn.execute("PRAGMA journal_mode = WAL")
+                    synchronous = self.connections.pragmas["synchronous"]
+                    db_conn.execute(f"PRAGMA synchronous = {synchronous}")
+        return rows
+
+    def upsert_df_to_sql_table(self, df: DataFrame, table: str, key: str = "id") -> int:
+        """Insert rows, updating existing rows that collide on `key`."""
+        columns = _with_ts(df)
+        quoted = [f'"{col}"' for col in columns]
+        updates = ", ".join(
+            f"{col} = excluded.{col}" for col in quoted if col != f'"{key}"'
+        )
+        query = f"""INSERT INTO {table} ({", ".join(quoted)})
+                    VALUES ({", ".join("?" for _ in quoted)})
+                    ON CONFLICT({key}) DO UPDATE SET {updates}"""
+        rows = itertools.chain.from_iterable(iter_row_batches(columns))
+        with self.connections.writer() as db_conn:
+            db_conn.executemany(query, rows)
+        return len(df)
+
+    def sql_query_to_df(
+        self,
+        query: str,
+        params: Optional[Sequence] = None,
+        columns: Optional[list[str]] = None,
+        filters: Optional[dict[str, Any]] = None,
+        distinct: bool = False,
+        date_range: Optional[tuple[date, date]] = None,
+    ) -> DataFrame:
+        """Run `query`; projection and filters are applied around it as a
+        subquery, which SQLite flattens so indexes on the base tables apply."""
+        if columns or filters or distinct or date_range:
+            query, outer_params = build_select(
+                f"({query})", columns, filters, distinct, date_range
+            )
+            params = [*(params or []), *outer_params]
+        return read_sql_query(sql=query, con=self.connections.reader(), params=params)
 
     def sql_table_to_df(
-        self, table: str, schema: Optional[str] = None, limit: Optional[int] = None
+        self,
+        table: str,
+        schema: Optional[str] = None,
+        limit: Optional[int] = None,
+        columns: Optional[list[str]] = None,
+        filters: Optional[dict[str, Any]] = None,
+        distinct: bool = False,
+        date_range: Optional[tuple[date, date]] = None,
     ) -> DataFrame:
         table = ".".join([schema, table]) if schema else table
-        limit = f"LIMIT {limit}" if limit else ""
-        query = f"SELECT * FROM {table} {limit}"
-        with sqlite3.connect(self.db_file) as db_conn:
-            return read_sql(
-                sql=query,
-                con=db_conn,
-            )
+        query, params = build_select(
+            table, columns, filters, distinct, date_range, limit
+        )
+        return read_sql_query(sql=query, con=self.connections.reader(), params=params)
+
+    def iter_sql_query_chunks(
+        self,
+        query: str,
+        params: Optional[Sequence] = None,
+        chunksize: int = CHUNK_SIZE,
+        arrow: bool = False,
+    ) -> Iterator[Union[DataFrame, pa.RecordBatch]]:
+        """Stream the result of `query` as DataFrames (or Arrow record batches)
+        of at most `chunksize` rows, so only one chunk is held in memory."""
+        cursor = self.connections.reader().execute(query, params or ())
+        names = [column[0] for column in cursor.description]
+        try:
+            while True:
+                rows = cursor.fetchmany(chunksize)
+                if not rows:
+                    break
+                if arrow:
+                    yield pa.RecordBatch.from_arrays(
+                        [pa.array(values) for values in zip(*rows)], names=names
+                    )
+                else:
+                    yield DataFrame.from_records(rows, columns=names)
+        finally:
+            cursor.close()
+
+    def iter_sql_table_chunks(
+        self,
+        table: str,
+        schema: Optional[str] = None,
+        chunksize: int = CHUNK_SIZE,
+        columns: Optional[list[str]] = None,
+        filters: Optional[dict[str, Any]] = None,
+        date_range: Optional[tuple[date, date]] = None,
+        order_by: Optional[list[str]] = None,
+        arrow: bool = False,
+    ) -> Iterator[Union[DataFrame, pa.RecordBatch]]:
+        table = ".".join([schema, table]) if schema else table
+        query, params = build_select(
+            table, columns, filters, date_range=date_range, order_by=order_by
+        )
+        return self.iter_sql_query_chunks(query, params, chunksize, arrow)
 
     def deduplicate_table(self, table: str, column: str = "id") -> None:
         query = f"""DELETE FROM {table}
@@ -98,7 +472,6 @@ class SQLDBConnection(DBConnection):
                         SELECT MIN(rowid)
                         FROM {table}
                         GROUP BY {column}
-                        HAVING COUNT(*) > 1
                     )"""
         self.execute_query(query)
 
@@ -1,5 +1,33 @@
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from typing import Optional
+import time
+import numpy as np
+import pandas as pd
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%S"
+EPOCH = date(1970, 1, 1)
 
 
 def format_datetime(_dt: datetime) -> datetime:
     return _dt.isoformat(timespec="seconds")
+
+
+def format_datetimes(values, format: Optional[str] = None) -> pd.Series:
+    """Column-wise format_datetime, optionally parsing strings with `format` first.
+    Missing values become "NaT", as NaT.isoformat() returns."""
+    datetimes = pd.Series(pd.to_datetime(values, format=format))
+    return datetimes.dt.strftime(ISO_FORMAT).fillna("NaT")
+
+
+def epoch_seconds() -> int:
+    return int(time.time())
+
+
+def to_epoch_days(values, format: Optional[str] = None) -> np.ndarray:
+    """Days since 1970-01-01 for a column of datetimes, as stored in date columns."""
+    datetimes = pd.Series(pd.to_datetime(values, format=format)).values
+    return datetimes.astype("datetime64[D]").astype(np.int64)
+
+
+def from_epoch_days(days: int) -> date:
+    return EPOCH + timedelta(days=int(days))
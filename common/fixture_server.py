@@ -0,0 +1,105 @@
+"""Local stand-in for the IB gateway that serves JSON fixtures.
+
+Run `python -m common.fixture_server` and point the API at it with
+`InteractiveBrokersApi(base_url="http://localhost:5001/v1/api/")`.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+import argparse
+import json
+import os
+import re
+import threading
+
+from common.interactive_brokers import IB_POSITIONS_PAGE_SIZE
+
+API_PREFIX = "/v1/api/"
+POSITIONS_PATH = re.compile(r"^portfolio/(?P<account>[^/]+)/positions/(?P<page>\d+)$")
+
+
+class FixtureServer:
+    """Serves `<directory>/<path>.json` for every GET under /v1/api/.
+
+    Positions are paged from `<directory>/positions.json` the same way the
+    gateway pages `portfolio/{account}/positions/{pageId}`.
+    """
+
+    def __init__(self, directory: str = "data", host: str = "localhost", port: int = 0):
+        self.directory = directory
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def _load(self, name: str):
+        with open(os.path.join(self.directory, f"{name}.json")) as f:
+            return json.load(f)
+
+    def _positions_page(self, account: str, page: int) -> list[dict]:
+        positions = [p for p in self._load("positions") if p["acctId"] == account]
+        start = page * IB_POSITIONS_PAGE_SIZE
+        return positions[start : start + IB_POSITIONS_PAGE_SIZE]
+
+    def resolve(self, path: str):
+        path = path.split("?")[0][len(API_PREFIX) :].strip("/")
+        match = POSITIONS_PATH.match(path)
+        if match:
+            return self._positions_page(match["account"], int(match["page"]))
+        if path == "portfolio/accounts":
+            return self._load("accounts")
+        if ".." in path.split("/"):
+            raise FileNotFoundError(path)
+        return self._load(path)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                try:
+                    body = json.dumps(server.resolve(self.path)).encode("utf-8")
+                    status = 200
+                except FileNotFoundError:
+                    body, status = b'{"error": "not found"}', 404
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "FixtureServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FixtureServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--directory", default="data")
+    parser.add_argument("--port", type=int, default=5001)
+    args = parser.parse_args()
+    server = FixtureServer(directory=args.directory, port=args.port)
+    print(f"Serving fixtures from {args.directory} at {server.base_url}")
+    server._server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
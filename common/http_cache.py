@@ -0,0 +1,139 @@
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import requests
+
+HTTP_CACHE_DIR = "data/http_cache"
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+
+@dataclass
+class CachedResponse:
+    url: str
+    status_code: int
+    content: bytes
+    headers: dict = field(default_factory=dict)
+    from_cache: bool = False
+
+    @property
+    def text(self) -> str:
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+@dataclass
+class CacheEntry:
+    url: str
+    params: Optional[dict]
+    status_code: int
+    headers: dict
+    fetched_at: float
+
+    def _header(self, name: str) -> Optional[str]:
+        return next(
+            (v for k, v in self.headers.items() if k.lower() == name.lower()), None
+        )
+
+    @property
+    def etag(self) -> Optional[str]:
+        return self._header("ETag")
+
+    @property
+    def last_modified(self) -> Optional[str]:
+        return self._header("Last-Modified")
+
+
+class HttpCache:
+    """On-disk cache for GET requests, keyed by URL and query parameters.
+
+    Entries younger than `ttl` seconds are served without touching the network.
+    Stale entries are revalidated with If-None-Match / If-Modified-Since and
+    kept when the server answers 304 Not Modified.
+    """
+
+    def __init__(self, directory: str = HTTP_CACHE_DIR):
+        self.directory = directory
+
+    def _key(self, url: str, params: Optional[dict]) -> str:
+        raw = json.dumps([url, params or {}], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str) -> tuple[str, str]:
+        base = os.path.join(self.directory, key)
+        return f"{base}.json", f"{base}.body"
+
+    def _load(self, key: str) -> tuple[Optional[CacheEntry], Optional[bytes]]:
+        meta_path, body_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                entry = CacheEntry(**json.load(f))
+            with open(body_path, "rb") as f:
+                return entry, f.read()
+        except (FileNotFoundError, json.JSONDecodeError, TypeError):
+            return None, None
+
+    def _store(self, key: str, entry: CacheEntry, body: Optional[bytes]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path, body_path = self._paths(key)
+        # Write to temp files and rename, so concurrent readers never see partial files
+        if body is not None:
+            _atomic_write(body_path, body)
+        _atomic_write(meta_path, json.dumps(asdict(entry)).encode("utf-8"))
+
+    def get(
+        self,
+        url: str,
+        params: Optional[dict] = None,
+        headers: Optional[dict] = None,
+        ttl: float = 0,
+        **request_kwargs,
+    ) -> CachedResponse:
+        key = self._key(url, params)
+        entry, body = self._load(key)
+        if entry and time.time() - entry.fetched_at < ttl:
+            return CachedResponse(url, entry.status_code, body, entry.headers, True)
+
+        headers = dict(headers or {})
+        if entry and entry.etag:
+            headers["If-None-Match"] = entry.etag
+        if entry and entry.last_modified:
+            headers["If-Modified-Since"] = entry.last_modified
+
+        response = requests.get(url, params=params, headers=headers, **request_kwargs)
+        if response.status_code == 304 and entry:
+            logging.debug(f"Revalidated cached response for {url}")
+            entry.fetched_at = time.time()
+            self._store(key, entry, None)
+            return CachedResponse(url, entry.status_code, body, entry.headers, True)
+
+        response_headers = dict(response.headers)
+        if response.status_code == 200:
+            entry = CacheEntry(
+                url=url,
+                params=params,
+                status_code=response.status_code,
+                headers=response_headers,
+                fetched_at=time.time(),
+            )
+            self._store(key, entry, response.content)
+        return CachedResponse(
+            url, response.status_code, response.content, response_headers
+        )
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+http_cache = HttpCache()
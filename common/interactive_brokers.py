@@ -1,10 +1,13 @@
-from typing import Union
+from typing import Iterator, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
 from common.rest_api import RestAPI
+from common.async_rest_api import AsyncRestAPI, gather_results
+from common.http_cache import HttpCache, http_cache, HOUR, DAY
 from common.models import (
     StockContract,
     StockHistory,
-    StockHistoryRecord,
     Account,
+    FetchResult,
     Position,
 )
 import json
@@ -72,20 +75,51 @@ class Portfolio:
         return df
 
 
+IB_BASE_URL = "https://localhost:5001/v1/api/"
+IB_ENDPOINTS = {
+    "user": "one/user",
+    "tickle": "tickle",
+    "validate": "portal/sso/validate",
+    "accounts": "portfolio/accounts",
+    "positions": "portfolio/{account}/positions/{pageId}",
+    "trades": "iserver/account/trades",
+    "market-data": "iserver/marketdata/snapshot",
+    "stock-contracts": "trsrv/stocks",
+    "market-data-history": "iserver/marketdata/history",
+}
+# The gateway returns at most this many positions per page
+IB_POSITIONS_PAGE_SIZE = 100
+IB_CACHE_TTLS = {
+    "stock-contracts": 7 * DAY,
+    "market-data-history": HOUR,
+}
+
+
+def parse_stock_contracts(symbol: str, response: dict) -> list[StockContract]:
+    return [
+        StockContract(
+            symbol=symbol,
+            name=stock["name"],
+            chineseName=stock["chineseName"],
+            assetClass=stock["assetClass"],
+            conid=contract["conid"],
+            exchange=contract["exchange"],
+            isUS=contract["isUS"],
+        )
+        for stock in response[symbol]
+        for contract in stock["contracts"]
+    ]
+
+
+def parse_stock_history(conid: int, response: dict) -> StockHistory:
+    return StockHistory(**{**response, "conid": conid})
+
+
 class InteractiveBrokersApi(RestAPI):
-    def __init__(self):
-        self.base_url = "https://localhost:5001/v1/api/"
-        self.endpoints = {
-            "user": "one/user",
-            "tickle": "tickle",
-            "validate": "portal/sso/validate",
-            "accounts": "portfolio/accounts",
-            "positions": "portfolio/{account}/positions/{pageId}",
-            "trades": "iserver/account/trades",
-            "market-data": "iserver/marketdata/snapshot",
-            "stock-contracts": "trsrv/stocks",
-            "market-data-history": "iserver/marketdata/history",
-        }
+    def __init__(self, cache: Optional[HttpCache] = None, base_url: str = IB_BASE_URL):
+        super().__init__(cache=cache, ttls=IB_CACHE_TTLS)
+        self.base_url = base_url
+        self.endpoints = IB_ENDPOINTS
 
     def fetch_stock_contracts(
         self, symbols: Union[str, list[str]]
@@ -96,36 +130,24 @@ class InteractiveBrokersApi(RestAPI):
             response = self.fetch_response_json(
                 endpoint="stock-contracts", params={"symbols": symbol}
             )
-            stock_contracts.extend(
-                [
-                    StockContract(
-                        symbol=symbol,
-                        name=stock["name"],
-                        chineseName=stock["chineseName"],
-                        assetClass=stock["assetClass"],
-                        conid=contract["conid"],
-                        exchange=contract["exchange"],
-                        isUS=contract["isUS"],
-                    )
-                    for stock in response[symbol]
-                    for contract in stock["contracts"]
-                ]
-            )
+            stock_contracts.extend(parse_stock_contracts(symbol, response))
         return stock_contracts
 
-    def fetch_stock_price_history(
+    def iter_stock_price_history(
         self, conids: Union[list[int], int], period: str = "1y", bar: str = "1m"
-    ) -> list[StockHistory]:
+    ) -> Iterator[StockHistory]:
         conids = [conids] if isinstance(conids, int) else conids
-        responses = []
         for conid in conids:
-            record = self.fetch_response_json(
+            response = self.fetch_response_json(
                 endpoint="market-data-history",
                 params={"conid": conid, "period": period, "bar": bar},
             )
-            record["conid"] = conid
-            responses.append(record)
-        return [StockHistory(**stock) for stock in responses]
+            yield parse_stock_history(conid, response)
+
+    def fetch_stock_price_history(
+        self, conids: Union[list[int], int], period: str = "1y", bar: str = "1m"
+    ) -> list[StockHistory]:
+        return list(self.iter_stock_price_history(conids, period=period, bar=bar))
 
     def fetch_accounts(self) -> list[Account]:
         # response = self.fetch_response_json(endpoint="accounts")
@@ -134,19 +156,30 @@ class InteractiveBrokersApi(RestAPI):
             response = json.load(f)
             return [Account(**account) for account in response]
 
-    def fetch_account_positions(self, accounts: list[Account]) -> list[Account]:
-        for account in accounts:
-            # TODO requires paging
-            # response = self.fetch_response_json(
-            #     endpoint="positions", params={"account": account.id}
-            # )
-            with open("data/positions.json") as f:
-                response = json.load(f)
-
-            for position in response:
-                if position["acctId"] == account.accountId:
-                    account.positions.append(Position(**position))
-
+    def iter_account_position_pages(self, account: Account) -> Iterator[list[dict]]:
+        page_id = 0
+        while True:
+            page = self.fetch_response_json(
+                endpoint="positions",
+                path_params={"account": account.accountId, "pageId": page_id},
+            )
+            if page:
+                yield page
+            if len(page) < IB_POSITIONS_PAGE_SIZE:
+                return
+            page_id += 1
+
+    def _fetch_positions_into(self, account: Account) -> Account:
+        for page in self.iter_account_position_pages(account):
+            account.positions.extend(Position(**position) for position in page)
+        return account
+
+    def fetch_account_positions(
+        self, accounts: list[Account], max_workers: int = 4
+    ) -> list[Account]:
+        # Accounts page independently, so fetch them concurrently
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(self._fetch_positions_into, accounts))
         return accounts
 
     def fetch_portfolio(self) -> Portfolio:
@@ -155,4 +188,50 @@ class InteractiveBrokersApi(RestAPI):
         return Portfolio(accounts=accounts_with_positions)
 
 
-ib_api = InteractiveBrokersApi()
+class AsyncInteractiveBrokersApi(AsyncRestAPI):
+    """Async InteractiveBrokersApi; use as `async with AsyncInteractiveBrokersApi()`.
+
+    Batch fetches return a FetchResult: a symbol (or conid) whose request
+    fails is reported there while the other requests carry on.
+    """
+
+    def __init__(self, max_in_flight: int = 16, base_url: str = IB_BASE_URL, **kwargs):
+        super().__init__(max_in_flight=max_in_flight, **kwargs)
+        self.base_url = base_url
+        self.endpoints = IB_ENDPOINTS
+
+    async def _fetch_stock_contracts(self, symbol: str) -> list[StockContract]:
+        response = await self.fetch_response_json(
+            endpoint="stock-contracts", params={"symbols": symbol}
+        )
+        return parse_stock_contracts(symbol, response)
+
+    async def fetch_stock_contracts(
+        self, symbols: Union[str, list[str]]
+    ) -> FetchResult:
+        symbols = [symbols] if isinstance(symbols, str) else symbols
+        result = await gather_results(
+            {symbol: self._fetch_stock_contracts(symbol) for symbol in symbols}
+        )
+        result.data = [contract for contracts in result.data for contract in contracts]
+        return result
+
+    async def _fetch_stock_price_history(
+        self, conid: int, period: str, bar: str
+    ) -> StockHistory:
+        response = await self.fetch_response_json(
+            endpoint="market-data-history",
+            params={"conid": conid, "period": period, "bar": bar},
+        )
+        return parse_stock_history(conid, response)
+
+    async def fetch_stock_price_history(
+        self, conids: Union[list[int], int], period: str = "1y", bar: str = "1m"
+    ) -> FetchResult:
+        conids = [conids] if isinstance(conids, int) else conids
+        return await gather_results(
+            {c: self._fetch_stock_price_history(c, period, bar) for c in conids}
+        )
+
+
+ib_api = InteractiveBrokersApi(cache=http_cache)
@@ -1,4 +1,5 @@
 from dataclasses import dataclass, field, asdict
+import numpy as np
 import pandas as pd
 
 
@@ -52,35 +53,24 @@ class StockHistory:
 
 
 @dataclass
-class StockHistoryRecord:
-    id: int
-    conid: int
-    serverId: str
-    symbol: str
-    text: str
-    price_open: float
-    price_close: float
-    price_high: float
-    price_low: float
-    volume: int
-    datetime: str
-    priceFactor: int = None
-    chartAnnotations: str = None
-    startTime: str = None
-    high: str = None
-    low: str = None
-    timePeriod: str = None
-    barLength: int = None
-    mdAvailability: str = None
-    mktDataDelay: int = None
-    outsideRth: bool = None
-    volumeFactor: int = None
-    priceDisplayRule: int = None
-    priceDisplayValue: str = None
-    negativeCapable: bool = None
-    messageVersion: int = None
-    points: int = None
-    travelTime: int = None
+class StockHistoryBatch:
+    """Columnar bars of a single StockHistory response, with its series
+    metadata (everything except `data`) kept once instead of per bar."""
+
+    series: dict
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+    timestamp: np.ndarray
+
+    @property
+    def conid(self) -> int:
+        return self.series["conid"]
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
 
 
 @dataclass
@@ -146,3 +136,42 @@ class Account:
 
     # Added
     positions: list[Position] = field(default_factory=list)
+
+
+@dataclass
+class FailedSymbol:
+    symbol: str
+    error: str
+    error_type: str
+
+
+@dataclass
+class FetchResult:
+    """Results of concurrent per-symbol requests, with the requests that
+    failed reported instead of cancelling the others."""
+
+    data: list
+    failed_symbols: list[FailedSymbol] = field(default_factory=list)
+
+
+@dataclass
+class SymbolLoad:
+    data: pd.DataFrame
+    failed_symbols: list[FailedSymbol] = field(default_factory=list)
+
+    @property
+    def failed_symbols_as_df(self) -> pd.DataFrame:
+        return pd.DataFrame(
+            [asdict(failed) for failed in self.failed_symbols],
+            columns=["symbol", "error", "error_type"],
+        )
+
+
+@dataclass
+class StockPriceHistoryLoad(SymbolLoad):
+    pass
+
+
+@dataclass
+class StockContractLoad(SymbolLoad):
+    pass
@@ -0,0 +1,307 @@
+"""DBConnection that stores each table as a (hive-partitioned) Parquet dataset.
+
+StockHistory is partitioned by symbol_id and by the year of its epoch-day
+date, so symbol and date filters skip whole directories. Every partition is a
+single file that is only ever replaced atomically: a new version is written to
+a hidden temporary file next to it and renamed over the old one, so a failed
+write leaves the previous rows in place. Arbitrary SQL is not supported; reads
+go through sql_table_to_df and iter_sql_table_chunks.
+"""
+from contextlib import contextmanager
+from datetime import date
+from typing import Any, Iterator, Optional, Union
+import os
+import shutil
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow.fs import LocalFileSystem
+from pandas import DataFrame
+
+from common.database import CHUNK_SIZE, DBConnection, Range
+from common.dt import EPOCH, epoch_seconds
+
+PARQUET_ROOT = "database/parquet"
+PARTITION_FILE = "part-0.parquet"
+
+# Hive partition columns per table; `year` is derived from the epoch-day date
+PARTITIONING = {
+    "StockHistory": pa.schema([("symbol_id", pa.int64()), ("year", pa.int32())]),
+}
+DERIVED_PARTITION_COLUMNS = {"year"}
+
+
+def _epoch_days(value: date) -> int:
+    return (value - EPOCH).days
+
+
+def build_filter(
+    filters: Optional[dict[str, Any]] = None,
+    date_range: Optional[tuple[date, date]] = None,
+    partitioned_by_year: bool = False,
+) -> Optional[ds.Expression]:
+    """Same filter semantics as common.database.build_where, as an Arrow
+    expression: scalars, IN for lists/tuples/sets, `Range` bounds and an
+    inclusive range on the epoch-day `date` column."""
+    expressions = []
+    for column, value in (filters or {}).items():
+        if isinstance(value, Range):
+            if value.low is not None:
+                expressions.append(pc.field(column) >= value.low)
+            if value.high is not None:
+                expressions.append(pc.field(column) <= value.high)
+        elif isinstance(value, (list, tuple, set)):
+            expressions.append(pc.field(column).isin(list(value)))
+        elif value is None:
+            expressions.append(pc.field(column).is_null())
+        else:
+            expressions.append(pc.field(column) == value)
+    if date_range:
+        start, end = date_range
+        expressions.append(pc.field("date") >= _epoch_days(start))
+        expressions.append(pc.field("date") <= _epoch_days(end))
+        if partitioned_by_year:
+            # Lets the scanner skip whole year directories
+            expressions.append(pc.field("year") >= start.year)
+            expressions.append(pc.field("year") <= end.year)
+    if not expressions:
+        return None
+    expression = expressions[0]
+    for other in expressions[1:]:
+        expression = expression & other
+    return expression
+
+
+def _write_file(df: DataFrame, path: str) -> None:
+    """Write `df` to `path` through a temporary file and an atomic rename."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    # Hidden, so dataset scans ignore it while it is being written
+    tmp_path = os.path.join(directory, f".tmp-{uuid.uuid4().hex}.parquet")
+    try:
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+class ParquetDBConnection(DBConnection):
+    """Reads push column projection and filters down to the scanner, so only
+    the matching partitions, row groups and columns are read, through
+    memory-mapped files."""
+
+    def __init__(self, root: str = PARQUET_ROOT):
+        self.root = root
+        self.filesystem = LocalFileSystem(use_mmap=True)
+
+    def _table_path(self, table: str, schema: Optional[str] = None) -> str:
+        return os.path.join(self.root, *([schema] if schema else []), table)
+
+    def _dataset(self, table: str, schema: Optional[str] = None) -> ds.Dataset:
+        partitioning = PARTITIONING.get(table)
+        return ds.dataset(
+            self._table_path(table, schema),
+            format="parquet",
+            filesystem=self.filesystem,
+            partitioning=(
+                ds.partitioning(partitioning, flavor="hive") if partitioning else None
+            ),
+        )
+
+    def _partitions(self, df: DataFrame, table: str) -> Iterator[tuple[str, DataFrame]]:
+        """Rows of `df` per partition directory (relative to the table), with
+        the partition columns dropped since the directory names hold them."""
+        partitioning = PARTITIONING.get(table)
+        if not partitioning:
+            yield "", df
+            return
+        if "year" in partitioning.names:
+            df = df.assign(year=pd.to_datetime(df["date"], unit="D").dt.year)
+        names = partitioning.names
+        for values, rows in df.groupby(names, sort=False):
+            values = values if isinstance(values, tuple) else (values,)
+            directory = os.path.join(
+                *(f"{name}={value}" for name, value in zip(names, values))
+            )
+            yield directory, rows.drop(columns=names)
+
+    def _merge(
+        self, table_path: str, df: DataFrame, table: str, key: Optional[str] = None
+    ) -> None:
+        """Rewrite each partition `df` touches with its rows added, replacing
+        existing rows that collide on `key` when given."""
+        for directory, rows in self._partitions(df, table):
+            path = os.path.join(table_path, directory, PARTITION_FILE)
+            if os.path.exists(path):
+                existing = pq.read_table(path, memory_map=True).to_pandas()
+                rows = pd.concat([existing, rows], ignore_index=True)
+                if key is not None:
+                    rows = rows.drop_duplicates(subset=key, keep="last")
+            _write_file(rows, path)
+
+    @contextmanager
+    def _replacing(self, table: str) -> Iterator[str]:
+        """Directory to write a new version of `table` into; it replaces the
+        table once the block completes and is discarded if it raises."""
+        path = self._table_path(table)
+        staging = os.path.join(self.root, f".{table}-{uuid.uuid4().hex}")
+        try:
+            yield staging
+            os.makedirs(staging, exist_ok=True)
+            if os.path.exists(path):
+                old = os.path.join(self.root, f".{table}-{uuid.uuid4().hex}")
+                os.rename(path, old)
+                os.rename(staging, path)
+                shutil.rmtree(old)
+            else:
+                os.rename(staging, path)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def _fetch_cursor(self):
+        raise NotImplementedError("Parquet tables are not accessed through cursors")
+
+    def execute_query(self, query: str):
+        raise NotImplementedError("ParquetDBConnection does not execute SQL")
+
+    def sql_query_to_df(self, query: str) -> DataFrame:
+        raise NotImplementedError(
+            "ParquetDBConnection does not execute SQL, use sql_table_to_df filters"
+        )
+
+    def iter_sql_query_chunks(self, query: str):
+        raise NotImplementedError(
+            "ParquetDBConnection does not execute SQL, use iter_sql_table_chunks"
+        )
+
+    def fetch_tables_in_db(self) -> list[tuple[str]]:
+        if not os.path.isdir(self.root):
+            return []
+        return [
+            (name,)
+            for name in sorted(os.listdir(self.root))
+            if not name.startswith(".")
+        ]
+
+    def table_exists(self, table: str) -> bool:
+        return os.path.isdir(self._table_path(table))
+
+    def df_to_sql_table(
+        self,
+        df: DataFrame,
+        table: str,
+        schema: Optional[str] = None,
+        if_exists: str = "append",
+    ):
+        if schema is not None:
+            raise NotImplementedError("ParquetDBConnection has no schemas")
+        df = df.assign(_ts=epoch_seconds())
+        if self.table_exists(table):
+            if if_exists == "fail":
+                raise ValueError(f"Table '{table}' already exists.")
+            if if_exists == "append":
+                self._merge(self._table_path(table), df, table)
+                return
+        with self._replacing(table) as staging:
+            self._merge(staging, df, table)
+
+    def upsert_df_to_sql_table(self, df: DataFrame, table: str, key: str = "id") -> int:
+        """Merge rows into the partitions they touch, newest row winning on
+        `key`. Rows sharing a key must map to the same partition."""
+        self._merge(self._table_path(table), df.assign(_ts=epoch_seconds()), table, key)
+        return len(df)
+
+    def copy_table(
+        self, source: DBConnection, table: str, chunksize: int = CHUNK_SIZE
+    ) -> int:
+        """Replace `table` with its rows in `source`, streamed in chunks ordered
+        by the partition columns so each partition is written at most twice."""
+        partitioning = PARTITIONING.get(table)
+        order_by = [
+            name
+            for name in (partitioning.names if partitioning else [])
+            if name not in DERIVED_PARTITION_COLUMNS
+        ]
+        rows = 0
+        with self._replacing(table) as staging:
+            for chunk in source.iter_sql_table_chunks(
+                table, chunksize=chunksize, order_by=order_by + ["date"]
+            ):
+                self._merge(staging, chunk, table)
+                rows += len(chunk)
+        return rows
+
+    def _columns(self, dataset: ds.Dataset, columns: Optional[list[str]]):
+        if columns is not None:
+            return columns
+        return [
+            name
+            for name in dataset.schema.names
+            if name not in DERIVED_PARTITION_COLUMNS
+        ]
+
+    def _filter(self, table: str, filters, date_range) -> Optional[ds.Expression]:
+        partitioning = PARTITIONING.get(table)
+        return build_filter(
+            filters,
+            date_range,
+            partitioned_by_year=bool(partitioning) and "year" in partitioning.names,
+        )
+
+    def sql_table_to_df(
+        self,
+        table: str,
+        schema: Optional[str] = None,
+        limit: Optional[int] = None,
+        columns: Optional[list[str]] = None,
+        filters: Optional[dict[str, Any]] = None,
+        distinct: bool = False,
+        date_range: Optional[tuple[date, date]] = None,
+    ) -> DataFrame:
+        """Read `table`; partition columns come after the stored columns."""
+        dataset = self._dataset(table, schema)
+        columns = self._columns(dataset, columns)
+        expression = self._filter(table, filters, date_range)
+        if limit and not distinct:
+            arrow_table = dataset.head(limit, columns=columns, filter=expression)
+        else:
+            arrow_table = dataset.to_table(columns=columns, filter=expression)
+        if distinct:
+            arrow_table = arrow_table.group_by(columns).aggregate([])
+            if limit:
+                arrow_table = arrow_table.slice(0, limit)
+        return arrow_table.to_pandas(split_blocks=True, self_destruct=True)
+
+    def iter_sql_table_chunks(
+        self,
+        table: str,
+        schema: Optional[str] = None,
+        chunksize: int = CHUNK_SIZE,
+        columns: Optional[list[str]] = None,
+        filters: Optional[dict[str, Any]] = None,
+        date_range: Optional[tuple[date, date]] = None,
+        order_by: Optional[list[str]] = None,
+        arrow: bool = False,
+    ) -> Iterator[Union[DataFrame, pa.RecordBatch]]:
+        if order_by:
+            raise NotImplementedError("Parquet scans do not guarantee a row order")
+        dataset = self._dataset(table, schema)
+        for batch in dataset.to_batches(
+            columns=self._columns(dataset, columns),
+            filter=self._filter(table, filters, date_range),
+            batch_size=chunksize,
+        ):
+            if batch.num_rows:
+                yield batch if arrow else batch.to_pandas()
+
+    def deduplicate_table(self, table: str, column: str = "id") -> None:
+        for directory, _, files in os.walk(self._table_path(table)):
+            if PARTITION_FILE in files:
+                path = os.path.join(directory, PARTITION_FILE)
+                df = pq.read_table(path, memory_map=True).to_pandas()
+                _write_file(df.drop_duplicates(subset=column, keep="last"), path)
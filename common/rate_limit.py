@@ -0,0 +1,28 @@
+import threading
+import time
+from typing import Optional
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces out calls to a single data source."""
+
+    def __init__(self, calls_per_second: Optional[float] = None):
+        self.interval = 1 / calls_per_second if calls_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_call = 0.0
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_until = max(self._next_call, now)
+            self._next_call = wait_until + self.interval
+        delay = wait_until - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+rate_limiters = {
+    "yahoo": RateLimiter(calls_per_second=5),
+}
@@ -1,21 +1,34 @@
 from typing import Optional
+from common.http_cache import HttpCache
 import requests
 import json
 
 
 class RestAPI:
-    def __init__(self):
+    def __init__(
+        self, cache: Optional[HttpCache] = None, ttls: Optional[dict[str, float]] = None
+    ):
         self.base_url = ""
         self.endpoints = {}
+        # Only endpoints with a TTL (in seconds) go through the cache
+        self.cache = cache
+        self.ttls = ttls or {}
 
     def fetch_response(
         self,
         endpoint: str,
         params: Optional[dict] = None,
         headers: Optional[dict] = None,
+        path_params: Optional[dict] = None,
     ):
+        url = self.base_url + self.endpoints[endpoint].format(**(path_params or {}))
+        ttl = self.ttls.get(endpoint)
+        if self.cache and ttl is not None:
+            return self.cache.get(
+                url, params=params, headers=headers, ttl=ttl, verify=False
+            )
         return requests.get(
-            self.base_url + self.endpoints[endpoint],
+            url,
             headers=headers,
             params=params,
             verify=False,
@@ -26,23 +39,32 @@ class RestAPI:
         endpoint: str,
         params: Optional[dict] = None,
         headers: Optional[dict] = None,
+        path_params: Optional[dict] = None,
     ):
-        return self.fetch_response(endpoint, headers=headers, params=params).status_code
+        return self.fetch_response(
+            endpoint, headers=headers, params=params, path_params=path_params
+        ).status_code
 
     def fetch_response_text(
         self,
         endpoint: str,
         params: Optional[dict] = None,
         headers: Optional[dict] = None,
+        path_params: Optional[dict] = None,
     ):
-        return self.fetch_response(endpoint, headers=headers, params=params).text
+        return self.fetch_response(
+            endpoint, headers=headers, params=params, path_params=path_params
+        ).text
 
     def fetch_response_json(
         self,
         endpoint: str,
         params: Optional[dict] = None,
         headers: Optional[dict] = None,
+        path_params: Optional[dict] = None,
     ):
         return json.loads(
-            self.fetch_response(endpoint, headers=headers, params=params).text
+            self.fetch_response(
+                endpoint, headers=headers, params=params, path_params=path_params
+            ).text
         )
@@ -1,34 +1,109 @@
+from datetime import date
+from typing import Union
 import pandas as pd
 
-from common.database import sqlite3_conn
+from common.database import build_select, sqlite3_conn
+from common.dt import EPOCH
 
+FACTOR_PORTFOLIO_RETURNS = """
+    SELECT strftime('%Y-%m', date * 86400, 'unixepoch') as Date,
+    mkt_rf, smb, hml, cma, rf
+    FROM FFFactors
+    WHERE date >= ?
+    GROUP BY date, mkt_rf, smb, hml, cma, rf"""
 
-def get_factor_portfolio_returns() -> pd.DataFrame:
+PORTFOLIO_RETURNS = """
+    SELECT strftime('%Y-%m', m.month * 86400, 'unixepoch') as Date,
+    s.symbol, m.price_open, m.price_close
+    FROM StockHistoryMonthly m
+    JOIN DimSymbol s ON s.symbol_id = m.symbol_id
+    WHERE s.symbol IN ({symbols})"""
+
+MONTHLY_CLOSE_PRICES = """
+    SELECT strftime('%Y-%m', m.month * 86400, 'unixepoch') as Date,
+    s.symbol, m.price_close
+    FROM StockHistoryMonthly m
+    JOIN DimSymbol s ON s.symbol_id = m.symbol_id
+    WHERE s.symbol IN ({symbols})
+    AND m.month >= ?"""
+
+# StockHistory rows of one (symbol_id, month, next_month) parameter row;
+# months are epoch days of the first day of the month
+_MONTH_BARS = "FROM StockHistory WHERE symbol_id = ?1 AND date >= ?2 AND date < ?3"
+
+# Recomputes the monthly bar of one touched month. Run with executemany: every
+# part of it is an index seek on StockHistory (symbol_id, date)
+STOCK_HISTORY_MONTHLY_ROLLUP = f"""
+    INSERT INTO StockHistoryMonthly (
+        symbol_id, month, price_open, price_high, price_low,
+        price_close, price_adjclose, volume, _ts
+    )
+    SELECT symbol_id, ?2,
+    (SELECT price_open {_MONTH_BARS} ORDER BY date LIMIT 1),
+    MAX(price_high), MIN(price_low),
+    (SELECT price_close {_MONTH_BARS} ORDER BY date DESC LIMIT 1),
+    (SELECT price_adjclose {_MONTH_BARS} ORDER BY date DESC LIMIT 1),
+    SUM(volume), CAST(strftime('%s', 'now') AS INTEGER)
+    {_MONTH_BARS}
+    GROUP BY symbol_id
+    ON CONFLICT(symbol_id, month) DO UPDATE SET
+    price_open = excluded.price_open,
+    price_high = excluded.price_high,
+    price_low = excluded.price_low,
+    price_close = excluded.price_close,
+    price_adjclose = excluded.price_adjclose,
+    volume = excluded.volume,
+    _ts = excluded._ts"""
+
+
+def placeholders(values: list) -> str:
+    return ", ".join("?" for _ in values)
+
+
+# Query shapes with example parameters, checked by migration/check_query_plans.py
+QUERY_PLAN_CHECKS = {
+    "factor_portfolio_returns": (FACTOR_PORTFOLIO_RETURNS, [0]),
+    "portfolio_returns": (
+        PORTFOLIO_RETURNS.format(symbols=placeholders(["AAPL", "MSFT"])),
+        ["AAPL", "MSFT"],
+    ),
+    "monthly_close_prices": (
+        MONTHLY_CLOSE_PRICES.format(symbols=placeholders(["AAPL", "MSFT"])),
+        ["AAPL", "MSFT", 0],
+    ),
+    "stock_history_monthly_rollup": (STOCK_HISTORY_MONTHLY_ROLLUP, [1, 0, 31]),
+    "stock_history_by_date": build_select(
+        "StockHistory",
+        ["symbol_id", "date", "price_close"],
+        date_range=(EPOCH, EPOCH),
+        order_by=["date", "symbol_id"],
+    ),
+}
+
+
+def get_factor_portfolio_returns(start_date: date = EPOCH) -> pd.DataFrame:
     df = sqlite3_conn.sql_query_to_df(
-        """ SELECT strftime('%Y-%m',date) as Date,
-            mkt_rf, smb, hml, cma, rf
-            FROM FFFactors
-            GROUP BY strftime('%Y-%m',date), mkt_rf, smb, hml, cma, rf"""
+        FACTOR_PORTFOLIO_RETURNS, params=[(start_date - EPOCH).days]
     )
     df.set_index("Date", inplace=True)
-    for col in df.columns:
-        if df[col].dtype == "object":
-            df[col] = df[col].astype(float)
-
     return df
 
 
 def get_portfolio_returns(
-    symbols: list[str],
+    symbols: Union[list[str], str],
 ) -> pd.DataFrame:
+    symbols = [symbols] if isinstance(symbols, str) else symbols
+    return sqlite3_conn.sql_query_to_df(
+        PORTFOLIO_RETURNS.format(symbols=placeholders(symbols)), params=symbols
+    )
 
-    symbols_str = symbols
-    if isinstance(symbols, list):
-        symbols_str = "','".join(symbols)
 
-    return sqlite3_conn.sql_query_to_df(
-        f"""SELECT strftime('%Y-%m',date) as Date,
-            id, symbol, price_open, price_close
-            FROM stockhistory
-        WHERE symbol IN ('{symbols_str}')"""
+def get_monthly_close_prices(
+    symbols: list[str], start_date: date = EPOCH
+) -> pd.DataFrame:
+    """Monthly closes from the StockHistoryMonthly rollup, a column per symbol."""
+    df = sqlite3_conn.sql_query_to_df(
+        MONTHLY_CLOSE_PRICES.format(symbols=placeholders(symbols)),
+        params=[*symbols, (start_date - EPOCH).days],
     )
+    return df.pivot(index="Date", columns="symbol", values="price_close")
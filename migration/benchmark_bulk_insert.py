@@ -0,0 +1,69 @@
+"""Compare DataFrame.to_sql with SQLDBConnection.bulk_insert on StockHistory rows.
+
+Run `python -m migration.benchmark_bulk_insert --rows 1000000`; each path
+writes into a fresh temporary database.
+"""
+from typing import Callable
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from pandas import DataFrame
+
+from common.database import SQLDBConnection
+from migration.tables import StockHistory
+
+
+def make_stock_history(rows: int, seed: int = 0) -> DataFrame:
+    rng = np.random.default_rng(seed)
+    prices = rng.uniform(1, 500, size=rows)
+    return DataFrame(
+        {
+            "id": [f"{i:032x}" for i in range(rows)],
+            "symbol_id": rng.integers(1, 500, size=rows),
+            "date": rng.integers(15_000, 20_000, size=rows),
+            "price_open": prices,
+            "price_low": prices * 0.99,
+            "price_high": prices * 1.01,
+            "price_close": prices,
+            "price_adjclose": prices,
+            "volume": rng.integers(0, 10**8, size=rows),
+        }
+    )
+
+
+def to_sql(db_conn: SQLDBConnection, df: DataFrame) -> None:
+    # The previous df_to_sql_table path
+    with db_conn.connections.writer() as conn:
+        df.assign(_ts=0).to_sql("StockHistory", conn, if_exists="append", index=False)
+
+
+def time_load(name: str, load: Callable[[SQLDBConnection, DataFrame], None], df):
+    with tempfile.TemporaryDirectory() as directory:
+        db_conn = SQLDBConnection(os.path.join(directory, "benchmark.db"))
+        db_conn.execute_query(StockHistory)
+        start = time.perf_counter()
+        load(db_conn, df)
+        seconds = time.perf_counter() - start
+        db_conn.connections.close()
+    print(f"{name:<28}{seconds:>8.2f}s{len(df) / seconds:>14,.0f} rows/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+    df = make_stock_history(args.rows)
+    time_load("DataFrame.to_sql", to_sql, df)
+    time_load("bulk_insert", lambda db, df: db.bulk_insert(df, "StockHistory"), df)
+    time_load(
+        "bulk_insert(journal_off)",
+        lambda db, df: db.bulk_insert(df, "StockHistory", journal_off=True),
+        df,
+    )
+
+
+if __name__ == "__main__":
+    main()
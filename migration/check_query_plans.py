@@ -0,0 +1,54 @@
+"""Fail when a query in common/sql_queries.py would fall back to a full scan
+or sort its rows in a temporary B-tree instead of reading them in index order.
+
+Run against a migrated database: `python -m migration.check_query_plans`.
+"""
+import logging
+import sys
+
+from common.database import SQLDBConnection, sqlite3_conn
+from common.sql_queries import QUERY_PLAN_CHECKS
+
+
+def is_full_scan(detail: str) -> bool:
+    # SEARCH uses an index seek; SCAN walks a whole table or index
+    return detail.startswith("SCAN ") and detail != "SCAN CONSTANT ROW"
+
+
+def is_temp_sort(detail: str) -> bool:
+    # With temp_store = MEMORY the whole result would be sorted in RAM
+    return detail == "USE TEMP B-TREE FOR ORDER BY"
+
+
+def find_plan_details(db_conn: SQLDBConnection, match) -> dict[str, list[str]]:
+    found = {}
+    for name, (query, params) in QUERY_PLAN_CHECKS.items():
+        plan = db_conn.sql_query_to_df(f"EXPLAIN QUERY PLAN {query}", params=params)
+        details = [detail for detail in plan["detail"] if match(detail)]
+        if details:
+            found[name] = details
+    return found
+
+
+def find_full_scans(db_conn: SQLDBConnection) -> dict[str, list[str]]:
+    return find_plan_details(db_conn, is_full_scan)
+
+
+def find_temp_sorts(db_conn: SQLDBConnection) -> dict[str, list[str]]:
+    return find_plan_details(db_conn, is_temp_sort)
+
+
+def main():
+    full_scans = find_full_scans(sqlite3_conn)
+    for name, scans in full_scans.items():
+        logging.error(f"Query {name} does a full scan: {'; '.join(scans)}")
+    temp_sorts = find_temp_sorts(sqlite3_conn)
+    for name in temp_sorts:
+        logging.error(f"Query {name} sorts its rows in a temporary B-tree")
+    if full_scans or temp_sorts:
+        sys.exit(1)
+    logging.info(f"All {len(QUERY_PLAN_CHECKS)} query plans use index searches")
+
+
+if __name__ == "__main__":
+    main()
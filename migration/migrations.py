@@ -0,0 +1,294 @@
+from dataclasses import dataclass
+from typing import Callable
+import logging
+import re
+import sqlite3
+
+from common.database import SQLDBConnection
+from common.sql_queries import STOCK_HISTORY_MONTHLY_ROLLUP
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    apply: Callable[[sqlite3.Connection], None]
+
+
+def _table_columns(conn: sqlite3.Connection, table: str) -> dict[str, str]:
+    rows = conn.execute(f"PRAGMA table_info({table})").fetchall()
+    return {name.lower(): _type.upper() for _, name, _type, _, _, _ in rows}
+
+
+# SQL expressions converting legacy ISO-8601 text into the typed representation.
+# Legacy `_ts` values are naive local times (datetime.now()); the 'utc' modifier
+# makes SQLite read them as local time before taking the epoch seconds.
+ISO_TO_EPOCH_DAYS = "CAST(julianday(substr({col}, 1, 10)) - 2440587.5 AS INTEGER)"
+ISO_TO_EPOCH_SECONDS = "CAST(strftime('%s', {col}, 'utc') AS INTEGER)"
+
+
+def typed_stock_history_and_ff_factors(conn: sqlite3.Connection) -> None:
+    """Store dates as epoch days, prices as REAL, `_ts` as epoch seconds and
+    StockHistory symbols as DimSymbol keys."""
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS DimSymbol (
+            symbol_id INTEGER PRIMARY KEY,
+            symbol VARCHAR(15) NOT NULL UNIQUE,
+            _ts INTEGER NOT NULL
+        )"""
+    )
+
+    if "symbol" in _table_columns(conn, "StockHistory"):
+        conn.execute(
+            """INSERT OR IGNORE INTO DimSymbol (symbol, _ts)
+                SELECT DISTINCT symbol, CAST(strftime('%s', 'now') AS INTEGER)
+                FROM StockHistory"""
+        )
+        conn.execute(
+            """CREATE TABLE StockHistory_typed (
+                id VARCHAR(40) NOT NULL PRIMARY KEY,
+                symbol_id INTEGER NOT NULL REFERENCES DimSymbol (symbol_id),
+                date INTEGER NOT NULL,
+                price_open REAL NOT NULL,
+                price_low REAL NOT NULL,
+                price_high REAL NOT NULL,
+                price_close REAL NOT NULL,
+                price_adjclose REAL NOT NULL,
+                volume INTEGER NOT NULL,
+                _ts INTEGER NOT NULL
+            )"""
+        )
+        conn.execute(
+            f"""INSERT OR REPLACE INTO StockHistory_typed
+                SELECT h.id, s.symbol_id, {ISO_TO_EPOCH_DAYS.format(col="h.date")},
+                    CAST(h.price_open AS REAL), CAST(h.price_low AS REAL),
+                    CAST(h.price_high AS REAL), CAST(h.price_close AS REAL),
+                    CAST(h.price_adjclose AS REAL), CAST(h.volume AS INTEGER),
+                    {ISO_TO_EPOCH_SECONDS.format(col="h._ts")}
+                FROM StockHistory h
+                JOIN DimSymbol s ON s.symbol = h.symbol
+                ORDER BY h.rowid"""
+        )
+        conn.execute("DROP TABLE StockHistory")
+        conn.execute("ALTER TABLE StockHistory_typed RENAME TO StockHistory")
+
+    if _table_columns(conn, "FFFactors").get("date", "INTEGER") != "INTEGER":
+        conn.execute(
+            """CREATE TABLE FFFactors_typed (
+                id VARCHAR(40) NOT NULL PRIMARY KEY,
+                date INTEGER NOT NULL,
+                mkt_rf REAL NOT NULL,
+                smb REAL NOT NULL,
+                hml REAL NOT NULL,
+                rmw REAL NOT NULL,
+                cma REAL NOT NULL,
+                rf REAL NOT NULL,
+                _ts INTEGER NOT NULL
+            )"""
+        )
+        conn.execute(
+            f"""INSERT OR REPLACE INTO FFFactors_typed
+                SELECT id, {ISO_TO_EPOCH_DAYS.format(col="date")},
+                    CAST(mkt_rf AS REAL), CAST(smb AS REAL), CAST(hml AS REAL),
+                    CAST(rmw AS REAL), CAST(cma AS REAL), CAST(rf AS REAL),
+                    {ISO_TO_EPOCH_SECONDS.format(col="_ts")}
+                FROM FFFactors
+                ORDER BY rowid"""
+        )
+        conn.execute("DROP TABLE FFFactors")
+        conn.execute("ALTER TABLE FFFactors_typed RENAME TO FFFactors")
+
+    # Remaining tables keep their declared types, but `_ts` is now written as
+    # epoch seconds everywhere, so convert the ISO values already stored
+    tables = conn.execute(
+        "SELECT name FROM sqlite_schema WHERE type = 'table'"
+    ).fetchall()
+    for (table,) in tables:
+        if "_ts" in _table_columns(conn, table):
+            conn.execute(
+                f"""UPDATE {table}
+                    SET _ts = {ISO_TO_EPOCH_SECONDS.format(col="_ts")}
+                    WHERE _ts LIKE '____-__-__%'"""
+            )
+
+
+def hot_query_indexes(conn: sqlite3.Connection) -> None:
+    """Composite indexes for the query shapes in common/sql_queries.py and the
+    ETL lookups. StockContract leads with isUS so both the symbol-filtered and
+    the unfiltered US conid lookups can seek, and includes conid to cover them.
+
+    The tables must exist (migration/tables.py creates them before migrating):
+    recording this version without its indexes would leave them out for good."""
+    indexes = {
+        "StockHistory": "ix_StockHistory_symbol_id_date (symbol_id, date)",
+        "StockContract": "ix_StockContract_isUS_symbol (isUS, symbol, conid)",
+        "FFFactors": "ix_FFFactors_date (date)",
+    }
+    missing = [table for table in indexes if not _table_columns(conn, table)]
+    if missing:
+        raise RuntimeError(f"Cannot index missing tables: {', '.join(missing)}")
+    for table, index in indexes.items():
+        name, columns = index.split(" ", 1)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} {columns}")
+
+
+EPOCH_DAYS_TO_MONTH = (
+    "CAST(julianday(date({col} * 86400, 'unixepoch', 'start of month'{shift}))"
+    " - 2440587.5 AS INTEGER)"
+)
+
+
+def stock_history_monthly(conn: sqlite3.Connection) -> None:
+    """Add the StockHistoryMonthly rollup and fill it from all stored bars;
+    the ETL keeps it current from then on."""
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS StockHistoryMonthly (
+            symbol_id INTEGER NOT NULL REFERENCES DimSymbol (symbol_id),
+            month INTEGER NOT NULL,
+            price_open REAL NOT NULL,
+            price_high REAL NOT NULL,
+            price_low REAL NOT NULL,
+            price_close REAL NOT NULL,
+            price_adjclose REAL NOT NULL,
+            volume INTEGER NOT NULL,
+            _ts INTEGER NOT NULL,
+            PRIMARY KEY (symbol_id, month)
+        )"""
+    )
+    if not _table_columns(conn, "StockHistory"):
+        return
+    month = EPOCH_DAYS_TO_MONTH.format(col="date", shift="")
+    next_month = EPOCH_DAYS_TO_MONTH.format(col="date", shift=", '+1 month'")
+    touched = conn.execute(
+        f"SELECT DISTINCT symbol_id, {month}, {next_month} FROM StockHistory"
+    ).fetchall()
+    conn.executemany(STOCK_HISTORY_MONTHLY_ROLLUP, touched)
+
+
+def reference_table_snapshots(conn: sqlite3.Connection) -> None:
+    """Reference tables now hold only the latest snapshot: dedupe the ticker
+    rows appended to Symbol on every run and keep one SP500 row per symbol."""
+    if _table_columns(conn, "Symbol"):
+        conn.execute(
+            """CREATE TABLE Symbol_keyed (
+                symbol VARCHAR(15) NOT NULL,
+                source VARCHAR(15) NOT NULL,
+                _ts INTEGER NOT NULL,
+                PRIMARY KEY (symbol, source)
+            )"""
+        )
+        conn.execute(
+            """INSERT INTO Symbol_keyed (symbol, source, _ts)
+                SELECT symbol, source, MAX(_ts)
+                FROM Symbol
+                WHERE symbol IS NOT NULL AND source IS NOT NULL
+                GROUP BY symbol, source"""
+        )
+        conn.execute("DROP TABLE Symbol")
+        conn.execute("ALTER TABLE Symbol_keyed RENAME TO Symbol")
+    if _table_columns(conn, "SP500"):
+        conn.execute(
+            """DELETE FROM SP500
+                WHERE rowid NOT IN (SELECT MAX(rowid) FROM SP500 GROUP BY symbol)"""
+        )
+
+
+def stock_history_date_index(conn: sqlite3.Connection) -> None:
+    """Index StockHistory by (date, symbol_id) so streams ordered by date (see
+    src/analysis/streaming.py) walk the index instead of sorting the table."""
+    if not _table_columns(conn, "StockHistory"):
+        raise RuntimeError("Cannot index missing tables: StockHistory")
+    conn.execute(
+        """CREATE INDEX IF NOT EXISTS ix_StockHistory_date_symbol_id
+            ON StockHistory (date, symbol_id)"""
+    )
+
+
+def integer_ts_columns(conn: sqlite3.Connection) -> None:
+    """Rebuild tables that still declare `_ts` as VARCHAR with `_ts INTEGER`.
+    Their TEXT affinity stored the epoch seconds as text, so they compared and
+    sorted as strings; indexes are recreated after the rebuild."""
+    tables = conn.execute(
+        "SELECT name, sql FROM sqlite_schema WHERE type = 'table'"
+    ).fetchall()
+    for table, create_query in tables:
+        columns = _table_columns(conn, table)
+        if columns.get("_ts", "INTEGER") == "INTEGER":
+            continue
+        indexes = conn.execute(
+            """SELECT sql FROM sqlite_schema
+                WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL""",
+            (table,),
+        ).fetchall()
+        create_query = re.sub(
+            r"\b_ts\s+\w+(\s*\([^)]*\))?", "_ts INTEGER", create_query, count=1
+        )
+        conn.execute(create_query.replace(table, f"{table}_typed", 1))
+        ts = f"""CASE WHEN _ts LIKE '____-__-__%'
+            THEN {ISO_TO_EPOCH_SECONDS.format(col="_ts")}
+            ELSE CAST(_ts AS INTEGER) END"""
+        select = ", ".join(ts if column == "_ts" else column for column in columns)
+        conn.execute(
+            f"""INSERT INTO {table}_typed
+                SELECT {select} FROM {table} ORDER BY rowid"""
+        )
+        conn.execute(f"DROP TABLE {table}")
+        conn.execute(f"ALTER TABLE {table}_typed RENAME TO {table}")
+        for (index,) in indexes:
+            conn.execute(index)
+
+
+MIGRATIONS = [
+    Migration(
+        1, "typed_stock_history_and_ff_factors", typed_stock_history_and_ff_factors
+    ),
+    Migration(2, "hot_query_indexes", hot_query_indexes),
+    Migration(3, "stock_history_monthly", stock_history_monthly),
+    Migration(4, "reference_table_snapshots", reference_table_snapshots),
+    Migration(5, "stock_history_date_index", stock_history_date_index),
+    Migration(6, "integer_ts_columns", integer_ts_columns),
+]
+
+CREATE_SCHEMA_VERSION_TABLE = """
+CREATE TABLE IF NOT EXISTS SchemaVersion (
+version INTEGER NOT NULL PRIMARY KEY,
+name VARCHAR(100) NOT NULL,
+_ts INTEGER NOT NULL
+);"""
+
+
+def applied_versions(conn: sqlite3.Connection) -> set[int]:
+    conn.execute(CREATE_SCHEMA_VERSION_TABLE)
+    return {row[0] for row in conn.execute("SELECT version FROM SchemaVersion")}
+
+
+def apply_migrations(db_conn: SQLDBConnection) -> list[int]:
+    """Apply pending migrations in version order, each in its own transaction.
+
+    Applied versions are recorded in the SchemaVersion table, so re-running is
+    a no-op; migrations themselves are also written to be idempotent.
+    """
+    conn = sqlite3.connect(db_conn.db_file, isolation_level=None)
+    applied = []
+    try:
+        done = applied_versions(conn)
+        for migration in sorted(MIGRATIONS, key=lambda m: m.version):
+            if migration.version in done:
+                continue
+            conn.execute("BEGIN")
+            try:
+                migration.apply(conn)
+                conn.execute(
+                    """INSERT OR REPLACE INTO SchemaVersion (version, name, _ts)
+                        VALUES (?, ?, CAST(strftime('%s', 'now') AS INTEGER))""",
+                    (migration.version, migration.name),
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(migration.version)
+            logging.info(f"Applied migration {migration.version}: {migration.name}")
+        return applied
+    finally:
+        conn.close()
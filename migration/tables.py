@@ -1,11 +1,12 @@
 from dataclasses import dataclass
 from typing import Union
 from common.database import SQLDBConnection, sqlite3_conn
+from migration.migrations import apply_migrations
 import logging
 
 StockContract = """
 CREATE TABLE IF NOT EXISTS StockContract (
-id VARCHAR(40) NOT NULL,
+id VARCHAR(40) NOT NULL PRIMARY KEY,
 conid INT NOT NULL,
 symbol VARCHAR(5) NOT NULL,
 name VARCHAR(15) NOT NULL,
@@ -13,58 +14,97 @@ chineseName VARCHAR(15) NULL,
 assetClass VARCHAR(15) NOT NULL,
 exchange VARCHAR(15) NULL,
 isUS INT NULL,
-_ts VARCHAR(30) NOT NULL
+_ts INTEGER NOT NULL
 );"""
 
+DimSymbol = """
+CREATE TABLE IF NOT EXISTS DimSymbol (
+symbol_id INTEGER PRIMARY KEY,
+symbol VARCHAR(15) NOT NULL UNIQUE,
+_ts INTEGER NOT NULL
+);"""
+
+# date: days since 1970-01-01, _ts: unix epoch seconds
 StockHistory = """
 CREATE TABLE IF NOT EXISTS StockHistory (
-id VARCHAR(40) NOT NULL,
-date VARCHAR(20) NOT NULL,
+id VARCHAR(40) NOT NULL PRIMARY KEY,
+symbol_id INTEGER NOT NULL REFERENCES DimSymbol (symbol_id),
+date INTEGER NOT NULL,
+price_open REAL NOT NULL,
+price_low REAL NOT NULL,
+price_high REAL NOT NULL,
+price_close REAL NOT NULL,
+price_adjclose REAL NOT NULL,
+volume INTEGER NOT NULL,
+_ts INTEGER NOT NULL
+);"""
+
+# month: days since 1970-01-01 of the first day of the month
+StockHistoryMonthly = """
+CREATE TABLE IF NOT EXISTS StockHistoryMonthly (
+symbol_id INTEGER NOT NULL REFERENCES DimSymbol (symbol_id),
+month INTEGER NOT NULL,
+price_open REAL NOT NULL,
+price_high REAL NOT NULL,
+price_low REAL NOT NULL,
+price_close REAL NOT NULL,
+price_adjclose REAL NOT NULL,
+volume INTEGER NOT NULL,
+_ts INTEGER NOT NULL,
+PRIMARY KEY (symbol_id, month)
+);"""
+
+StockContractHistory = """
+CREATE TABLE IF NOT EXISTS StockContractHistory (
+id VARCHAR(40) NOT NULL PRIMARY KEY,
+conid INT NOT NULL,
+datetime VARCHAR(20) NOT NULL,
+price_open DECIMAL(6,2) NOT NULL,
+price_high DECIMAL(6,2) NOT NULL,
+price_low DECIMAL(6,2) NOT NULL,
+price_close DECIMAL(6,2) NOT NULL,
+volume DECIMAL(6,2) NOT NULL,
+_ts INTEGER NOT NULL
+);"""
+
+StockContractHistorySeries = """
+CREATE TABLE IF NOT EXISTS StockContractHistorySeries (
+id VARCHAR(40) NOT NULL PRIMARY KEY,
+conid INT NOT NULL,
+symbol VARCHAR(15) NOT NULL,
+text VARCHAR(15) NOT NULL,
+serverId VARCHAR(15) NULL,
+priceFactor INT NULL,
+chartAnnotations VARCHAR(100) NULL,
+startTime VARCHAR(20) NULL,
+high VARCHAR(50) NULL,
+low VARCHAR(50) NULL,
+timePeriod VARCHAR(15) NULL,
+barLength INT NULL,
+mdAvailability VARCHAR(15) NULL,
+mktDataDelay INT NULL,
+outsideRth INT NULL,
+volumeFactor INT NULL,
+priceDisplayRule INT NULL,
+priceDisplayValue VARCHAR(15) NULL,
+negativeCapable INT NULL,
+messageVersion INT NULL,
+points INT NULL,
+travelTime INT NULL,
+_ts INTEGER NOT NULL
+);"""
+
+Symbol = """
+CREATE TABLE IF NOT EXISTS Symbol (
 symbol VARCHAR(15) NOT NULL,
-price_open DECIMAL(6,5) NOT NULL,
-price_low DECIMAL(6,5) NOT NULL,
-price_high DECIMAL(6,5) NOT NULL,
-price_close DECIMAL(6,5) NOT NULL,
-price_adjclose DECIMAL(6,5) NOT NULL,
-volume DECIMAL(6,5) NOT NULL,
-_ts VARCHAR(20) NOT NULL
+source VARCHAR(15) NOT NULL,
+_ts INTEGER NOT NULL,
+PRIMARY KEY (symbol, source)
 );"""
-# StockHistory = """
-# CREATE TABLE IF NOT EXISTS StockHistory (
-# id VARCHAR(40) NOT NULL,
-# conid INT NOT NULL,
-# serverId VARCHAR(15) NULL,
-# symbol VARCHAR(15) NOT NULL,
-# text VARCHAR(15) NOT NULL,
-# priceFactor INT NULL,
-# chartAnnotations VARCHAR(100) NULL,
-# startTime VARCHAR(20) NOT NULL,
-# high VARCHAR(50) NOT NULL,
-# low VARCHAR(50) NOT NULL,
-# timePeriod VARCHAR(15) NOT NULL,
-# barLength INT NOT NULL,
-# mdAvailability VARCHAR(15) NULL,
-# mktDataDelay INT NULL,
-# outsideRth INT NULL,
-# volumeFactor INT NULL,
-# priceDisplayRule INT NULL,
-# priceDisplayValue VARCHAR(15) NULL,
-# negativeCapable INT NULL,
-# messageVersion INT NULL,
-# price_open DECIMAL(6,2) NOT NULL,
-# price_close DECIMAL(6,2) NOT NULL,
-# price_high DECIMAL(6,2) NOT NULL,
-# price_low DECIMAL(6,2) NOT NULL,
-# volume DECIMAL(6,2) NOT NULL,
-# datetime VARCHAR(20) NOT NULL,
-# points INT NOT NULL,
-# travelTime INT NOT NULL,
-# _ts VARCHAR(20) NOT NULL
-# );"""
 
 SP500 = """
 CREATE TABLE IF NOT EXISTS SP500 (
-id VARCHAR(40) NOT NULL,
+id VARCHAR(40) NOT NULL PRIMARY KEY,
 symbol VARCHAR(5) NOT NULL,
 security VARCHAR(15) NOT NULL,
 sec_filings VARCHAR(15) NULL,
@@ -75,20 +115,20 @@ date_added VARCHAR(20) NULL,
 date_first_added VARCHAR(20) NULL,
 cik VARCHAR(30) NULL,
 founded VARCHAR(10) NULL,
-_ts VARCHAR(20) NOT NULL
+_ts INTEGER NOT NULL
 );"""
 
 FFFactors = """
 CREATE TABLE IF NOT EXISTS FFFactors (
-id VARCHAR(40) NOT NULL,
-date VARCHAR(20) NOT NULL,
-mkt_rf DECIMAL(10,2) NOT NULL,
-smb DECIMAL(10,2) NOT NULL,
-hml DECIMAL(10,2) NOT NULL,
-rmw DECIMAL(10,2) NOT NULL,
-cma DECIMAL(10,2) NOT NULL,
-rf DECIMAL(10,2) NOT NULL,
-_ts VARCHAR(30) NOT NULL
+id VARCHAR(40) NOT NULL PRIMARY KEY,
+date INTEGER NOT NULL,
+mkt_rf REAL NOT NULL,
+smb REAL NOT NULL,
+hml REAL NOT NULL,
+rmw REAL NOT NULL,
+cma REAL NOT NULL,
+rf REAL NOT NULL,
+_ts INTEGER NOT NULL
 );"""
 
 
@@ -108,15 +148,37 @@ def create_database_tables(
         logging.debug(f"Created database table: {table.name}")
 
 
+def add_primary_key_index(db_conn: SQLDBConnection, table: DatabaseTable) -> None:
+    """Give tables created before `id` was a primary key a unique index on it,
+    which is what upserts (ON CONFLICT(id)) rely on."""
+    columns = db_conn.execute_query(f"PRAGMA table_info({table.name})")
+    id_columns = [pk for _, name, _, _, _, pk in columns if name == "id"]
+    if not id_columns or id_columns[0]:
+        return
+    db_conn.deduplicate_table(table.name)
+    db_conn.execute_query(
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{table.name}_id ON {table.name} (id)"
+    )
+    logging.debug(f"Added unique id index to database table: {table.name}")
+
+
 def main():
     table_definitions = {
         "StockContract": StockContract,
+        "DimSymbol": DimSymbol,
         "StockHistory": StockHistory,
+        "StockHistoryMonthly": StockHistoryMonthly,
+        "StockContractHistory": StockContractHistory,
+        "StockContractHistorySeries": StockContractHistorySeries,
+        "Symbol": Symbol,
         "SP500": SP500,
         "FFFactors": FFFactors,
     }
     db_tables = [DatabaseTable(k, v) for k, v in table_definitions.items()]
     create_database_tables(sqlite3_conn, db_tables)
+    for table in db_tables:
+        add_primary_key_index(sqlite3_conn, table)
+    apply_migrations(sqlite3_conn)
 
 
 if __name__ == "__main__":
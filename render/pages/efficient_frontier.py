@@ -71,7 +71,7 @@ def create_efficient_frontier_graph(df: pd.DataFrame):
     # )
     fig.update_layout(coloraxis_colorbar=dict(yanchor="top", ticks="outside"))
     fig.update_layout(
-        title="Simulated portfolios - efficient frontier",
+        title="Efficient frontier",
         xaxis_title="annualized volatility",
         yaxis_title="annualized returns",
     )
@@ -222,7 +222,7 @@ def calculate_efficient_frontier(symbols: list[str]):
     if not symbols:
         symbols = ["VOO", "VTI", "VTIP", "VNQ"]
 
-    df = ef.calculate_efficient_frontier(symbols)
+    df = ef.calculate_efficient_frontier(symbols, method="exact")
 
     max_sharpe = df.iloc[df["sharpe_ratio"].idxmax()]
     max_sharpe = max_sharpe.reset_index()
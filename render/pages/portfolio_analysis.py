@@ -3,6 +3,7 @@
 
 from dash import Dash, html, dcc, dash_table, register_page, callback
 import plotly.express as px
+from src.analysis.factor_regression import SUMMARY_COLUMNS
 from src.analysis.portfolio_analysis import PortfolioAnalysis
 from src.analysis.stock_returns import fetch_stock_returns
 from src.etl import get_available_symbols
@@ -115,17 +116,7 @@ layout = html.Div(
                                     "name": i,
                                     "id": i,
                                 }
-                                for i in (
-                                    [
-                                        "var",
-                                        "coef",
-                                        "std err",
-                                        "t",
-                                        "P>|t|",
-                                        "[0.025",
-                                        "0.975]",
-                                    ]
-                                )
+                                for i in SUMMARY_COLUMNS
                             ],
                             style_table={
                                 "maxHeight": "300px",
@@ -1,65 +1,87 @@
 import pandas as pd
 import numpy as np
-import datetime as dt
-import yfinance as yf
-import plotly.express as px
-import pandas as pd
-import numpy as np
-import datetime as dt
-import matplotlib.pyplot as plt
-import plotly.express as px
+from typing import Callable, Iterator, Optional, Sequence, Union
+import warnings
+from scipy.optimize import minimize
+from scipy.stats import qmc
+from src.analysis.rolling import rolling_moments
 from src.analysis.stock_returns import (
     fetch_stock_returns,
 )
 
-# Define function to calculate returns, volatility
-def portfolio_annualized_performance(
-    weights: int, mean_returns: pd.Series, cov_matrix: pd.DataFrame
-):
-    # Monte Carlo Method
-    mc_sims = 400  # number of simulations
-    T = 100  # timeframe in days
-    meanM = np.full(shape=(T, len(weights)), fill_value=mean_returns)
-    meanM = meanM.T
-    portfolio_sims = np.full(shape=(T, mc_sims), fill_value=0.0)
-    initialPortfolio = 10000
-
-    for m in range(mc_sims):
-        Z = np.random.normal(size=(T, len(weights)))  # uncorrelated RV's
-        L = np.linalg.cholesky(
-            cov_matrix
-        )  # Cholesky decomposition to Lower Triangular Matrix
-        daily_returns = meanM + np.inner(
-            L, Z
-        )  # Correlated daily returns for individual stocks
-        portfolio_sims[:, m] = (
-            np.cumprod(np.inner(weights, daily_returns.T) + 1) * initialPortfolio
+TRADING_DAYS = 252
+PORTFOLIO_CHUNK_SIZE = 100_000
+# "uniform" (the default, kept so seeded runs reproduce) normalizes uniform
+# draws, which crowds weights towards equal weighting; the others are uniform
+# on the simplex (flat Dirichlet), the quasi-random ones via scrambled
+# Sobol/Halton points
+WEIGHT_SAMPLERS = ("uniform", "dirichlet", "sobol", "halton")
+
+
+def _weight_sampler(
+    sampler: str, n_assets: int, rng: np.random.Generator
+) -> Callable[[int], np.ndarray]:
+    """Return a function drawing (n x assets) long-only weights summing to 1."""
+    if sampler == "uniform":
+        draw = lambda n: rng.random((n, n_assets))
+    elif sampler == "dirichlet":
+        draw = lambda n: rng.standard_exponential((n, n_assets))
+    elif sampler in ("sobol", "halton"):
+        engine_class = qmc.Sobol if sampler == "sobol" else qmc.Halton
+        engine = engine_class(d=n_assets, scramble=True, seed=rng)
+
+        def draw(n: int) -> np.ndarray:
+            with warnings.catch_warnings():
+                warnings.filterwarnings("ignore", message="The balance properties")
+                # Exponential spacings of uniform points are Dirichlet(1, ..., 1)
+                return -np.log1p(-engine.random(n))
+
+    else:
+        raise ValueError(
+            f"Unknown sampler {sampler!r}, expected one of {WEIGHT_SAMPLERS}"
         )
-        print(portfolio_sims)
-    # return std, returns
+
+    def weights(n: int) -> np.ndarray:
+        w = draw(n)
+        return w / w.sum(axis=1, keepdims=True)
+
+    return weights
 
 
 def portfolio_annualized_performance(
-    weights: int, mean_returns: pd.Series, cov_matrix: pd.DataFrame
+    weights: np.ndarray, mean_returns: pd.Series, cov_matrix: pd.DataFrame
 ):
-    # Given the avg returns, weights of equities calc. the portfolio return
-    returns = np.sum(mean_returns * weights) * 252
-    # Standard deviation of portfolio (using dot product against covariance, weights)
-    # 252 trading days
-    std = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights))) * np.sqrt(252)
+    """Annualized volatility and return for one weight vector, or for every
+    row of a (portfolios x assets) weight matrix at once."""
+    weights = np.asarray(weights, dtype=float)
+    returns = weights @ np.asarray(mean_returns, dtype=float) * TRADING_DAYS
+    # Row-wise w' C w as one matrix product instead of a loop over portfolios
+    variance = ((weights @ np.asarray(cov_matrix, dtype=float)) * weights).sum(axis=-1)
+    std = np.sqrt(variance * TRADING_DAYS)
     return std, returns
 
 
-# # Define function to calculate returns, volatility
-# def portfolio_annualized_performance(
-#     weights: int, mean_returns: pd.Series, cov_matrix: pd.DataFrame
-# ):
-#     # Given the avg returns, weights of equities calc. the portfolio return
-#     returns = np.sum(mean_returns * weights) * 252
-#     # Standard deviation of portfolio (using dot product against covariance, weights)
-#     # 252 trading days
-#     std = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights))) * np.sqrt(252)
-#     return std, returns
+def iter_random_portfolio_chunks(
+    num_portfolios: int,
+    mean_returns: pd.Series,
+    cov_matrix: pd.DataFrame,
+    risk_free_rate: float,
+    chunk_size: int = PORTFOLIO_CHUNK_SIZE,
+    seed: Optional[int] = None,
+    sampler: str = "uniform",
+) -> Iterator[tuple[np.ndarray, np.ndarray]]:
+    """Random long-only portfolios in chunks of `chunk_size`, as a weight
+    matrix and a (std, return, sharpe) matrix, so memory stays bounded by the
+    chunk size rather than `num_portfolios`. `sampler` is one of
+    WEIGHT_SAMPLERS."""
+    draw = _weight_sampler(sampler, len(mean_returns), np.random.default_rng(seed))
+    for start in range(0, num_portfolios, chunk_size):
+        weights = draw(min(chunk_size, num_portfolios - start))
+        std, returns = portfolio_annualized_performance(
+            weights, mean_returns, cov_matrix
+        )
+        sharpe = (returns - risk_free_rate) / std
+        yield weights, np.column_stack([std, returns, sharpe])
 
 
 def generate_random_portfolios(
@@ -67,32 +89,65 @@ def generate_random_portfolios(
     mean_returns: pd.Series,
     cov_matrix: pd.DataFrame,
     risk_free_rate: float,
+    chunk_size: int = PORTFOLIO_CHUNK_SIZE,
+    seed: Optional[int] = None,
+    sampler: str = "uniform",
 ) -> pd.DataFrame:
-    # Initialize array of shape 3 x N to store our results,
-    # where N is the number of portfolios we're going to simulate
-    results = np.zeros((3, num_portfolios))
-    # Array to store the weights of each equity
-    weight_array = []
-    for i in range(num_portfolios):
-        # Randomly assign floats to our 4 equities
-        weights = np.random.random(len(mean_returns))
-        # Convert the randomized floats to percentages (summing to 100)
-        weights /= np.sum(weights)
-        # Add to our portfolio weight array
-        weight_array.append(weights)
-        # Pull the standard deviation, returns from our function above using
-        # the weights, mean returns generated in this function
-        portfolio_std_dev, portfolio_return = portfolio_annualized_performance(
-            weights, mean_returns, cov_matrix
+    # One row per portfolio: asset weights, then std, return and sharpe
+    chunks = [
+        np.hstack([weights, results])
+        for weights, results in iter_random_portfolio_chunks(
+            num_portfolios,
+            mean_returns,
+            cov_matrix,
+            risk_free_rate,
+            chunk_size,
+            seed,
+            sampler,
         )
-        # Store output
-        results[0, i] = portfolio_std_dev
-        results[1, i] = portfolio_return
-        # Sharpe ratio
-        results[2, i] = (portfolio_return - risk_free_rate) / portfolio_std_dev
-    weights = pd.DataFrame(weight_array)
-    results = pd.DataFrame(results).T
-    return pd.concat([weights, results], axis=1)
+    ]
+    return pd.DataFrame(np.vstack(chunks))
+
+
+def simulate_frontier(
+    num_portfolios: int,
+    mean_returns: pd.Series,
+    cov_matrix: pd.DataFrame,
+    risk_free_rate: float,
+    bins: int = 500,
+    chunk_size: int = PORTFOLIO_CHUNK_SIZE,
+    seed: Optional[int] = None,
+    sampler: str = "uniform",
+) -> pd.DataFrame:
+    """Sample millions of portfolios but keep only the frontier: the highest
+    return portfolio per volatility bin plus the max Sharpe portfolio."""
+    # Long-only portfolio volatility never exceeds the most volatile asset
+    max_std = np.sqrt(np.diag(np.asarray(cov_matrix, dtype=float)).max())
+    max_std *= np.sqrt(TRADING_DAYS)
+    best = np.full((bins + 1, len(mean_returns) + 3), np.nan)
+    for weights, results in iter_random_portfolio_chunks(
+        num_portfolios,
+        mean_returns,
+        cov_matrix,
+        risk_free_rate,
+        chunk_size,
+        seed,
+        sampler,
+    ):
+        rows = np.hstack([weights, results])
+        std, returns, sharpe = results.T
+        bin_ids = np.minimum((std / max_std * bins).astype(int), bins - 1)
+        # The last row per bin after sorting by (bin, return) is its best
+        order = np.lexsort((returns, bin_ids))
+        last = np.r_[bin_ids[order][1:] != bin_ids[order][:-1], True]
+        candidates = order[last]
+        for bin_id, row in zip(bin_ids[candidates], rows[candidates]):
+            if not row[-2] <= best[bin_id, -2]:
+                best[bin_id] = row
+        top = np.argmax(sharpe)
+        if not sharpe[top] <= best[bins, -1]:
+            best[bins] = rows[top]
+    return pd.DataFrame(best[~np.isnan(best[:, -1])])
 
 
 def simulate_portfolios(
@@ -101,12 +156,16 @@ def simulate_portfolios(
     cov_matrix: pd.DataFrame,
     num_portfolios: int,
     risk_free_rate: float,
+    seed: Optional[int] = None,
+    sampler: str = "uniform",
 ) -> pd.DataFrame:
     df = generate_random_portfolios(
         num_portfolios=num_portfolios,
         mean_returns=mean_returns,
         cov_matrix=cov_matrix,
         risk_free_rate=risk_free_rate,
+        seed=seed,
+        sampler=sampler,
     )
     cols = list(returns.columns)
     cols.extend(
@@ -120,14 +179,260 @@ def simulate_portfolios(
     return df
 
 
+# (low, high) for every asset, or one (low, high) per asset; None allows any
+# long or short position and uses the closed-form frontier
+WeightBounds = Optional[Union[tuple[float, float], Sequence[tuple[float, float]]]]
+LONG_ONLY = (0.0, 1.0)
+
+
+def _asset_bounds(bounds: WeightBounds, n_assets: int):
+    if bounds is None:
+        return None
+    if np.isscalar(bounds[0]):
+        bounds = [bounds] * n_assets
+    bounds = [(float(low), float(high)) for low, high in bounds]
+    lows, highs = zip(*bounds)
+    if sum(lows) > 1 or sum(highs) < 1:
+        raise ValueError(f"Weight bounds {bounds} cannot sum to 1")
+    return bounds
+
+
+def _annualized(mean_returns: pd.Series, cov_matrix: pd.DataFrame):
+    mu = np.asarray(mean_returns, dtype=float) * TRADING_DAYS
+    cov = np.asarray(cov_matrix, dtype=float) * TRADING_DAYS
+    return mu, cov
+
+
+def _max_return_weights(mu: np.ndarray, bounds) -> np.ndarray:
+    """Highest-return portfolio within bounds: fill the best assets first."""
+    weights = np.array([low for low, _ in bounds])
+    remaining = 1 - weights.sum()
+    for i in np.argsort(-mu):
+        add = min(bounds[i][1] - weights[i], remaining)
+        weights[i] += add
+        remaining -= add
+    return weights
+
+
+def _min_variance_weights(
+    mu: np.ndarray,
+    cov: np.ndarray,
+    bounds,
+    target_return: Optional[float] = None,
+    x0: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    ones = np.ones(len(mu))
+    constraints = [{"type": "eq", "fun": lambda w: w.sum() - 1, "jac": lambda w: ones}]
+    if target_return is not None:
+        constraints.append(
+            {"type": "eq", "fun": lambda w: w @ mu - target_return, "jac": lambda w: mu}
+        )
+    result = minimize(
+        lambda w: w @ cov @ w,
+        ones / len(mu) if x0 is None else x0,
+        jac=lambda w: 2 * cov @ w,
+        bounds=bounds,
+        constraints=constraints,
+        method="SLSQP",
+        options={"ftol": 1e-12, "maxiter": 500},
+    )
+    if not result.success:
+        raise ValueError(f"Minimum variance solve failed: {result.message}")
+    return result.x
+
+
+def _analytic_frontier(mu: np.ndarray, cov: np.ndarray):
+    """Closed-form minimum variance weights for a target return when any
+    long or short position is allowed: w = g + h * target."""
+    inv_ones = np.linalg.solve(cov, np.ones(len(mu)))
+    inv_mu = np.linalg.solve(cov, mu)
+    a, b, c = inv_ones.sum(), inv_mu.sum(), mu @ inv_mu
+    d = a * c - b**2
+    return (c * inv_ones - b * inv_mu) / d, (a * inv_mu - b * inv_ones) / d
+
+
+def _has_tangency(
+    mu: np.ndarray, cov: np.ndarray, risk_free_rate: float, bounds
+) -> bool:
+    if bounds is None:
+        # Otherwise the closed form lands on the inefficient branch
+        return np.linalg.solve(cov, mu - risk_free_rate).sum() > 0
+    return (mu - risk_free_rate).max() > 0
+
+
+def min_variance_portfolio(
+    mean_returns: pd.Series, cov_matrix: pd.DataFrame, bounds: WeightBounds = LONG_ONLY
+) -> pd.Series:
+    mu, cov = _annualized(mean_returns, cov_matrix)
+    asset_bounds = _asset_bounds(bounds, len(mu))
+    if asset_bounds is None:
+        inv_ones = np.linalg.solve(cov, np.ones(len(mu)))
+        weights = inv_ones / inv_ones.sum()
+    else:
+        weights = _min_variance_weights(mu, cov, asset_bounds)
+    return pd.Series(weights, index=mean_returns.index)
+
+
+def tangency_portfolio(
+    mean_returns: pd.Series,
+    cov_matrix: pd.DataFrame,
+    risk_free_rate: float,
+    bounds: WeightBounds = LONG_ONLY,
+    x0: Optional[np.ndarray] = None,
+) -> pd.Series:
+    """The maximum Sharpe ratio portfolio."""
+    mu, cov = _annualized(mean_returns, cov_matrix)
+    asset_bounds = _asset_bounds(bounds, len(mu))
+    if not _has_tangency(mu, cov, risk_free_rate, asset_bounds):
+        raise ValueError("No fully invested portfolio has a positive Sharpe ratio")
+    excess = mu - risk_free_rate
+    if asset_bounds is None:
+        inv_excess = np.linalg.solve(cov, excess)
+        return pd.Series(inv_excess / inv_excess.sum(), index=mean_returns.index)
+
+    # Maximizing the Sharpe ratio is convex after substituting y = k * w:
+    # minimize y'Cy subject to excess'y = 1, sum(y) = k and k * low <= y <= k * high
+    n_assets = len(mu)
+    lows = np.array([low for low, _ in asset_bounds])
+    highs = np.array([high for _, high in asset_bounds])
+    if x0 is None:
+        x0 = np.ones(n_assets) / n_assets
+    scale = 1 / max(x0 @ excess, excess.max() / n_assets)
+    result = minimize(
+        lambda yk: yk[:-1] @ cov @ yk[:-1],
+        np.append(x0 * scale, scale),
+        jac=lambda yk: np.append(2 * cov @ yk[:-1], 0.0),
+        bounds=[(None, None)] * n_assets + [(0, None)],
+        constraints=[
+            {
+                "type": "eq",
+                "fun": lambda yk: yk[:-1] @ excess - 1,
+                "jac": lambda yk: np.append(excess, 0.0),
+            },
+            {
+                "type": "eq",
+                "fun": lambda yk: yk[:-1].sum() - yk[-1],
+                "jac": lambda yk: np.append(np.ones(n_assets), -1.0),
+            },
+            {
+                "type": "ineq",
+                "fun": lambda yk: yk[:-1] - lows * yk[-1],
+                "jac": lambda yk: np.hstack([np.eye(n_assets), -lows[:, None]]),
+            },
+            {
+                "type": "ineq",
+                "fun": lambda yk: highs * yk[-1] - yk[:-1],
+                "jac": lambda yk: np.hstack([-np.eye(n_assets), highs[:, None]]),
+            },
+        ],
+        method="SLSQP",
+        options={"ftol": 1e-12, "maxiter": 500},
+    )
+    if not result.success:
+        raise ValueError(f"Tangency portfolio solve failed: {result.message}")
+    weights = result.x[:-1] / result.x[-1]
+    return pd.Series(weights, index=mean_returns.index)
+
+
+def efficient_frontier_portfolios(
+    mean_returns: pd.Series,
+    cov_matrix: pd.DataFrame,
+    risk_free_rate: float,
+    n_points: int = 50,
+    bounds: WeightBounds = LONG_ONLY,
+) -> pd.DataFrame:
+    """Exact frontier from the minimum variance to the maximum return
+    portfolio, followed by the tangency portfolio as the last row.
+
+    Each frontier solve starts from the previous point's weights, which are
+    already close to optimal for the next target return.
+    """
+    mu, cov = _annualized(mean_returns, cov_matrix)
+    asset_bounds = _asset_bounds(bounds, len(mu))
+    min_variance = min_variance_portfolio(mean_returns, cov_matrix, bounds).to_numpy()
+    if asset_bounds is None:
+        g, h = _analytic_frontier(mu, cov)
+        targets = np.linspace(min_variance @ mu, mu.max(), n_points)
+        weights = g + np.outer(targets, h)
+    else:
+        max_return = _max_return_weights(mu, asset_bounds)
+        targets = np.linspace(min_variance @ mu, max_return @ mu, n_points)
+        weights = [min_variance]
+        for target in targets[1:-1]:
+            weights.append(
+                _min_variance_weights(mu, cov, asset_bounds, target, x0=weights[-1])
+            )
+        weights = np.vstack(weights + [max_return][: n_points - 1])
+
+    std, returns = portfolio_annualized_performance(weights, mean_returns, cov_matrix)
+    best = weights[np.argmax((returns - risk_free_rate) / std)]
+    if _has_tangency(mu, cov, risk_free_rate, asset_bounds):
+        best = tangency_portfolio(
+            mean_returns, cov_matrix, risk_free_rate, bounds, x0=best
+        ).to_numpy()
+    weights = np.vstack([weights, best])
+    std, returns = portfolio_annualized_performance(weights, mean_returns, cov_matrix)
+    df = pd.DataFrame(weights, columns=mean_returns.index)
+    df["portfolio_std_dev"] = std
+    df["portfolio_return"] = returns
+    df["sharpe_ratio"] = (returns - risk_free_rate) / std
+    return df
+
+
+def frontier_over_time(
+    returns: pd.DataFrame,
+    window: int = TRADING_DAYS,
+    halflife: Optional[float] = None,
+    step: int = 21,
+    risk_free_rate: float = 0.018,
+    n_points: int = 20,
+    bounds: WeightBounds = LONG_ONLY,
+) -> pd.DataFrame:
+    """Exact frontiers every `step` dates (ending at the last date), from the
+    rolling `window` moments or, with `halflife`, exponentially weighted ones.
+    Rows are efficient_frontier_portfolios output with a `date` column."""
+    moments = rolling_moments(returns, None if halflife else window, halflife)
+    dates = moments.valid_dates()[::-1][::step][::-1]
+    frames = [
+        efficient_frontier_portfolios(
+            moments.mean(date),
+            moments.covariance(date),
+            risk_free_rate,
+            n_points,
+            bounds,
+        ).assign(date=date)
+        for date in dates
+    ]
+    return pd.concat(frames, ignore_index=True)
+
+
 def calculate_efficient_frontier(
-    symbols: list[str], num_portfolios: int = 10_000, risk_free_rate: float = 0.018
+    symbols: list[str],
+    num_portfolios: int = 10_000,
+    risk_free_rate: float = 0.018,
+    seed: Optional[int] = None,
+    method: str = "simulate",  # simulate, exact
+    n_points: int = 50,
+    bounds: WeightBounds = LONG_ONLY,
+    sampler: str = "uniform",
+    halflife: Optional[float] = None,
 ) -> pd.DataFrame:
 
     df = fetch_stock_returns(symbols, return_format="percentage")
     # df = convert_absolute_returns_to_perc(df)
-    mean_returns = df.mean()
-    cov_matrix = df.cov()
+    if halflife is None:
+        mean_returns = df.mean()
+        cov_matrix = df.cov()
+    else:
+        # Weight recent returns more, via the last exponentially weighted moments
+        moments = rolling_moments(df, halflife=halflife)
+        mean_returns, cov_matrix = moments.mean(), moments.covariance()
+    if method == "exact":
+        return efficient_frontier_portfolios(
+            mean_returns, cov_matrix, risk_free_rate, n_points, bounds
+        )
+    elif method != "simulate":
+        raise ValueError("Invalid method")
     return simulate_portfolios(
-        df, mean_returns, cov_matrix, num_portfolios, risk_free_rate
+        df, mean_returns, cov_matrix, num_portfolios, risk_free_rate, seed, sampler
     )
@@ -0,0 +1,149 @@
+"""Ordinary least squares for many dependent series against one set of
+regressors (e.g. every S&P 500 symbol against the Fama-French factors).
+
+All series sharing a missing-value pattern are fitted with one multi-target
+least-squares solve, and the inference statistics are computed as arrays.
+"""
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+from scipy import stats
+
+# Columns of the pf_analysis DataTable, as in a statsmodels summary table
+SUMMARY_COLUMNS = ["var", "coef", "std err", "t", "P>|t|", "[0.025", "0.975]"]
+# Decimals statsmodels prints per column. Except for P>|t|, values below 1e-4
+# or from 1e4 up are printed with that many significant digits instead
+SUMMARY_DECIMALS = {
+    "coef": 4,
+    "std err": 3,
+    "t": 3,
+    "P>|t|": 3,
+    "[0.025": 3,
+    "0.975]": 3,
+}
+FIXED_DECIMAL_COLUMNS = {"P>|t|"}
+
+
+def _round_like_summary(df: DataFrame, decimals: dict[str, int]) -> DataFrame:
+    """Round as a parsed statsmodels summary table, formatting each value the
+    way statsmodels' forg does and reading it back."""
+    df = df.copy()
+    for column, precision in decimals.items():
+        fixed = column in FIXED_DECIMAL_COLUMNS
+        df[column] = [
+            float(f"{value:.{precision}f}")
+            if fixed or 1e-4 <= abs(value) < 1e4
+            else float(f"{value:.{precision}g}")
+            for value in df[column]
+        ]
+    return df
+
+
+@dataclass
+class OLSResult:
+    """Per-regressor (rows) and per-series (columns) estimates."""
+
+    names: pd.Index
+    series: pd.Index
+    params: np.ndarray
+    bse: np.ndarray
+    tvalues: np.ndarray
+    pvalues: np.ndarray
+    conf_low: np.ndarray
+    conf_high: np.ndarray
+    nobs: np.ndarray
+    df_resid: np.ndarray
+
+    def summary(
+        self, series=None, decimals: Optional[dict[str, int]] = SUMMARY_DECIMALS
+    ) -> DataFrame:
+        """Coefficient table for one series (default: the first)."""
+        j = 0 if series is None else self.series.get_loc(series)
+        df = DataFrame(
+            {
+                "var": self.names,
+                "coef": self.params[:, j],
+                "std err": self.bse[:, j],
+                "t": self.tvalues[:, j],
+                "P>|t|": self.pvalues[:, j],
+                "[0.025": self.conf_low[:, j],
+                "0.975]": self.conf_high[:, j],
+            }
+        )
+        return _round_like_summary(df, decimals) if decimals else df
+
+    def table(self, decimals: Optional[dict[str, int]] = None) -> DataFrame:
+        """Coefficient tables of all series stacked, with a leading `series`
+        column."""
+        n_names, n_series = self.params.shape
+        df = DataFrame(
+            {
+                "series": np.repeat(self.series, n_names),
+                "var": np.tile(self.names, n_series),
+                "coef": self.params.T.ravel(),
+                "std err": self.bse.T.ravel(),
+                "t": self.tvalues.T.ravel(),
+                "P>|t|": self.pvalues.T.ravel(),
+                "[0.025": self.conf_low.T.ravel(),
+                "0.975]": self.conf_high.T.ravel(),
+            }
+        )
+        return _round_like_summary(df, decimals) if decimals else df
+
+
+def fit_ols(
+    y: Union[Series, DataFrame],
+    X: DataFrame,
+    add_constant: bool = True,
+    alpha: float = 0.05,
+) -> OLSResult:
+    """Regress every column of `y` on `X`, dropping missing rows per series
+    like statsmodels' missing="drop". The constant is appended as `const`."""
+    Y = y.to_frame() if isinstance(y, Series) else y
+    X, Y = X.align(Y, join="inner", axis=0)
+    if add_constant:
+        X = X.assign(const=1.0)
+    x = X.to_numpy(dtype=float)
+    values = Y.to_numpy(dtype=float)
+    observed = ~np.isnan(values) & ~np.isnan(x).any(axis=1, keepdims=True)
+
+    n_names, n_series = x.shape[1], values.shape[1]
+    params, bse = np.full((2, n_names, n_series), np.nan)
+    nobs, df_resid = np.zeros((2, n_series), dtype=np.int64)
+    # One solve per distinct missing-value pattern; a balanced panel is one
+    patterns, group = np.unique(observed.T, axis=0, return_inverse=True)
+    for pattern, rows in enumerate(patterns):
+        columns = np.flatnonzero(group.ravel() == pattern)
+        design, targets = x[rows], values[rows][:, columns]
+        nobs[columns] = rows.sum()
+        rank = np.linalg.matrix_rank(design) if rows.any() else 0
+        dof = rows.sum() - rank
+        if dof <= 0:
+            # Too few observations (e.g. an all-NaN series): leave it NaN
+            continue
+        coefficients = np.linalg.lstsq(design, targets, rcond=None)[0]
+        residuals = targets - design @ coefficients
+        sigma2 = (residuals**2).sum(axis=0) / dof
+        unscaled = np.diag(np.linalg.pinv(design.T @ design))
+        params[:, columns] = coefficients
+        bse[:, columns] = np.sqrt(np.outer(unscaled, sigma2))
+        df_resid[columns] = dof
+
+    tvalues = params / bse
+    pvalues = 2 * stats.t.sf(np.abs(tvalues), df_resid)
+    margin = stats.t.ppf(1 - alpha / 2, df_resid) * bse
+    return OLSResult(
+        X.columns,
+        Y.columns,
+        params,
+        bse,
+        tvalues,
+        pvalues,
+        params - margin,
+        params + margin,
+        nobs,
+        df_resid,
+    )
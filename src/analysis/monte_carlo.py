@@ -1,47 +1,403 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Iterator, Optional, Sequence, Union
+import os
+import warnings
+
 import numpy as np
 import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import datetime as dt
-from pandas_datareader import data as pdr
-
-# # import data
-# def get_data(stocks, start, end):
-#     stockData = pdr.get_data_yahoo(stocks, start, end)
-#     stockData = stockData["Close"]
-#     returns = stockData.pct_change()
-#     meanReturns = returns.mean()
-#     covMatrix = returns.cov()
-#     return meanReturns, covMatrix
-
-
-# stockList = ["CBA", "BHP", "TLS", "NAB", "WBC", "STO"]
-# stocks = [stock + ".AX" for stock in stockList]
-# endDate = dt.datetime.now()
-# startDate = endDate - dt.timedelta(days=300)
-# meanReturns, covMatrix = get_data(stocks, startDate, endDate)
-# weights = np.random.random(len(meanReturns))
-# weights /= np.sum(weights)
-
-
-def monte_carlo(weights: int, mean_returns: pd.Series, cov_matrix: pd.DataFrame):
-    # Monte Carlo Method
-    mc_sims = 400  # number of simulations
-    T = 100  # timeframe in days
-    meanM = np.full(shape=(T, len(weights)), fill_value=mean_returns)
-    meanM = meanM.T
-    portfolio_sims = np.full(shape=(T, mc_sims), fill_value=0.0)
-    initialPortfolio = 10000
-
-    for m in range(mc_sims):
-        Z = np.random.normal(size=(T, len(weights)))  # uncorrelated RV's
-        L = np.linalg.cholesky(
-            cov_matrix
-        )  # Cholesky decomposition to Lower Triangular Matrix
-        dailyReturns = meanM + np.inner(
-            L, Z
-        )  # Correlated daily returns for individual stocks
-        portfolio_sims[:, m] = (
-            np.cumprod(np.inner(weights, dailyReturns.T) + 1) * initialPortfolio
+from scipy.special import ndtri
+from scipy.stats import qmc
+
+MC_SIMS = 400
+MC_DAYS = 100
+INITIAL_PORTFOLIO = 10_000
+PERCENTILES = (5, 25, 50, 75, 95)
+# Upper bound on the (paths x days x assets) shock tensor drawn at once
+SHOCK_CHUNK_ELEMENTS = 10_000_000
+# "antithetic" pairs each draw Z with -Z in consecutive paths; "sobol" and
+# "halton" are scrambled quasi-random sequences mapped to normals
+SAMPLERS = ("pseudo", "antithetic", "sobol", "halton")
+# Most dimensions one scrambled sequence covers: scipy's Sobol limit, and far
+# fewer for Halton, whose setup cost grows and uniformity fades with dimension
+QMC_MAX_DIMENSIONS = {"sobol": 21201, "halton": 120}
+
+
+def _shock_sampler(
+    sampler: str, T: int, n_assets: int, rng: np.random.Generator
+) -> Callable[[int], np.ndarray]:
+    """Return a function drawing (n x T * n_assets) standard normal shocks,
+    ordered day by day."""
+    dims = T * n_assets
+    if sampler == "pseudo":
+        return lambda n: rng.standard_normal((n, dims))
+    if sampler == "antithetic":
+
+        def draw(n: int) -> np.ndarray:
+            half = rng.standard_normal((n // 2, dims))
+            shocks = np.empty((n, dims))
+            shocks[0::2], shocks[1::2] = half, -half
+            return shocks
+
+        return draw
+    if sampler in ("sobol", "halton"):
+        max_dimensions = QMC_MAX_DIMENSIONS[sampler]
+        if sampler == "sobol" and n_assets > max_dimensions:
+            raise ValueError(f"Sobol sampling supports at most {max_dimensions} assets")
+        # Long horizons exceed one sequence's dimensions: cover the days in
+        # blocks, each an independently scrambled sequence over whole days
+        days_per_engine = max(1, max_dimensions // n_assets)
+        engine_class = qmc.Sobol if sampler == "sobol" else qmc.Halton
+        engines = [
+            engine_class(
+                d=min(days_per_engine, T - start) * n_assets, scramble=True, seed=rng
+            )
+            for start in range(0, T, days_per_engine)
+        ]
+
+        def draw(n: int) -> np.ndarray:
+            with warnings.catch_warnings():
+                # Chunks are not powers of two; the sequence stays contiguous
+                warnings.filterwarnings("ignore", message="The balance properties")
+                return ndtri(np.hstack([engine.random(n) for engine in engines]))
+
+        return draw
+    raise ValueError(f"Unknown sampler {sampler!r}, expected one of {SAMPLERS}")
+
+
+@dataclass
+class PathStatistics:
+    """Count, mean and sum of squared deviations of the portfolio value per
+    day. Partials from disjoint sets of paths merge with the pairwise update
+    of Chan et al., as in src/analysis/streaming.py."""
+
+    count: int
+    mean: np.ndarray
+    m2: np.ndarray
+
+    @classmethod
+    def from_paths(cls, paths: np.ndarray) -> "PathStatistics":
+        mean = paths.mean(axis=0)
+        return cls(len(paths), mean, ((paths - mean) ** 2).sum(axis=0))
+
+    def merge(self, other: "PathStatistics") -> "PathStatistics":
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        return PathStatistics(
+            count,
+            self.mean + delta * other.count / count,
+            self.m2 + other.m2 + delta**2 * self.count * other.count / count,
         )
-    return
+
+    @property
+    def std(self) -> np.ndarray:
+        return np.sqrt(self.m2 / (self.count - 1))
+
+
+@dataclass
+class MonteCarloResult:
+    """Simulated portfolio values, one row per path and one column per day."""
+
+    paths: np.ndarray
+    initial_value: float
+    percentiles: Sequence[float] = PERCENTILES
+    statistics: Optional[PathStatistics] = field(default=None, repr=False)
+    sampler: str = "pseudo"
+    # Known mean of the daily portfolio return, used as a control variate
+    expected_daily_return: Optional[float] = None
+
+    def __post_init__(self):
+        if self.statistics is None:
+            self.statistics = PathStatistics.from_paths(self.paths)
+
+    @property
+    def terminal_values(self) -> np.ndarray:
+        return self.paths[:, -1]
+
+    def percentile_bands(self) -> pd.DataFrame:
+        """Portfolio value percentiles per day (index 1..T)."""
+        bands = np.percentile(self.paths, self.percentiles, axis=0).T
+        return pd.DataFrame(
+            bands,
+            index=pd.RangeIndex(1, self.paths.shape[1] + 1, name="day"),
+            columns=[f"p{p:g}" for p in self.percentiles],
+        )
+
+    def value_at_risk(
+        self, alpha: float = 0.05, horizon: Optional[int] = None
+    ) -> tuple[float, float]:
+        """VaR and CVaR (expected shortfall) in currency, as losses against the
+        initial value at `horizon` days (default: the last simulated day)."""
+        values = self.paths[:, (horizon or self.paths.shape[1]) - 1]
+        cutoff = np.quantile(values, alpha)
+        var = self.initial_value - cutoff
+        cvar = self.initial_value - values[values <= cutoff].mean()
+        return var, cvar
+
+    def expected_terminal_value(
+        self, control_variate: bool = False
+    ) -> tuple[float, float]:
+        """Mean terminal value and its standard error.
+
+        Antithetic pairs are averaged before estimating the error. With
+        `control_variate`, the estimate is corrected by each path's summed
+        daily returns, whose expectation T * expected_daily_return is known.
+        For sobol/halton the i.i.d. error formula is conservative.
+        """
+        values = self.terminal_values
+        if control_variate:
+            if self.expected_daily_return is None:
+                raise ValueError("No expected daily return to use as control")
+            previous = np.column_stack(
+                [np.full(len(self.paths), self.initial_value), self.paths[:, :-1]]
+            )
+            control = (self.paths / previous).sum(axis=1) - self.paths.shape[1]
+            control_mean = self.paths.shape[1] * self.expected_daily_return
+        if self.sampler == "antithetic":
+            values = (values[0::2] + values[1::2]) / 2
+            if control_variate:
+                control = (control[0::2] + control[1::2]) / 2
+        # Antithetic pairs cancel the control exactly, leaving nothing to fit
+        if control_variate and control.std() > 1e-12:
+            beta = np.cov(values, control)[0, 1] / control.var(ddof=1)
+            values = values - beta * (control - control_mean)
+        return values.mean(), values.std(ddof=1) / np.sqrt(len(values))
+
+    def terminal_distribution(self, bins: int = 50) -> pd.DataFrame:
+        counts, edges = np.histogram(self.terminal_values, bins=bins)
+        return pd.DataFrame(
+            {
+                "lower": edges[:-1],
+                "upper": edges[1:],
+                "count": counts,
+                "probability": counts / counts.sum(),
+            }
+        )
+
+
+def _return_chunks(
+    drift: float,
+    loadings: np.ndarray,
+    mc_sims: int,
+    T: int,
+    rng: np.random.Generator,
+    chunk_size: Optional[int] = None,
+    sampler: str = "pseudo",
+) -> Iterator[np.ndarray]:
+    n_assets = len(loadings)
+    if chunk_size is None:
+        chunk_size = max(1, SHOCK_CHUNK_ELEMENTS // (T * n_assets))
+    if sampler == "antithetic":
+        if mc_sims % 2:
+            raise ValueError("Antithetic sampling needs an even number of paths")
+        # Keep pairs within a chunk
+        chunk_size = max(2, chunk_size - chunk_size % 2)
+    draw = _shock_sampler(sampler, T, n_assets, rng)
+    for start in range(0, mc_sims, chunk_size):
+        size = min(chunk_size, mc_sims - start)
+        Z = draw(size).reshape(size, T, n_assets)  # uncorrelated RV's
+        yield drift + Z @ loadings
+
+
+def _fill_paths(
+    paths: np.ndarray, chunks: Iterator[np.ndarray], initial_value: float
+) -> None:
+    start = 0
+    for returns in chunks:
+        block = paths[start : start + len(returns)]
+        np.cumprod(returns + 1, axis=1, out=block)
+        block *= initial_value
+        start += len(returns)
+
+
+def iter_return_chunks(
+    weights: np.ndarray,
+    mean_returns: pd.Series,
+    cov_matrix: pd.DataFrame,
+    mc_sims: int = MC_SIMS,
+    T: int = MC_DAYS,
+    seed: Union[None, int, np.random.SeedSequence] = None,
+    chunk_size: Optional[int] = None,
+    sampler: str = "pseudo",
+) -> Iterator[np.ndarray]:
+    """Daily portfolio returns as (paths x T) blocks.
+
+    Each block draws its shocks as one (paths x T x assets) tensor, sized so it
+    stays under SHOCK_CHUNK_ELEMENTS unless `chunk_size` is given. Draws come
+    from one Generator or QMC sequence in order, so results do not depend on
+    the chunk size. `sampler` is one of SAMPLERS.
+    """
+    weights = np.asarray(weights, dtype=float)
+    # Factorize once; the portfolio only sees the shocks through L' w
+    L = np.linalg.cholesky(np.asarray(cov_matrix, dtype=float))
+    drift = weights @ np.asarray(mean_returns, dtype=float)
+    rng = np.random.default_rng(seed)
+    return _return_chunks(drift, L.T @ weights, mc_sims, T, rng, chunk_size, sampler)
+
+
+def monte_carlo(
+    weights: np.ndarray,
+    mean_returns: pd.Series,
+    cov_matrix: pd.DataFrame,
+    mc_sims: int = MC_SIMS,
+    T: int = MC_DAYS,
+    initial_value: float = INITIAL_PORTFOLIO,
+    seed: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    sampler: str = "pseudo",
+) -> MonteCarloResult:
+    """Simulate `mc_sims` portfolio value paths over `T` days with correlated
+    normal daily asset returns, drawn with `sampler` (see SAMPLERS). With
+    `workers`, the paths are split across a process pool (see
+    monte_carlo_parallel)."""
+    if mc_sims <= 0:
+        raise ValueError(f"mc_sims must be positive, got {mc_sims}")
+    if workers is not None:
+        return monte_carlo_parallel(
+            weights,
+            mean_returns,
+            cov_matrix,
+            mc_sims,
+            T,
+            initial_value,
+            seed,
+            workers,
+            chunk_size,
+            sampler,
+        )
+    paths = np.empty((mc_sims, T))
+    _fill_paths(
+        paths,
+        iter_return_chunks(
+            weights, mean_returns, cov_matrix, mc_sims, T, seed, chunk_size, sampler
+        ),
+        initial_value,
+    )
+    return MonteCarloResult(
+        paths,
+        initial_value,
+        sampler=sampler,
+        expected_daily_return=np.asarray(weights, dtype=float)
+        @ np.asarray(mean_returns, dtype=float),
+    )
+
+
+def _simulate_block(
+    inputs_name: str,
+    n_assets: int,
+    paths_name: str,
+    mc_sims: int,
+    T: int,
+    start: int,
+    stop: int,
+    initial_value: float,
+    seed: np.random.SeedSequence,
+    chunk_size: Optional[int],
+    sampler: str,
+) -> PathStatistics:
+    """Worker: simulate paths [start, stop) into the shared path matrix."""
+    inputs_shm = SharedMemory(name=inputs_name)
+    paths_shm = SharedMemory(name=paths_name)
+    try:
+        inputs = np.ndarray((n_assets + 2, n_assets), buffer=inputs_shm.buf)
+        weights, mean_returns, L = inputs[0], inputs[1], inputs[2:]
+        paths = np.ndarray((mc_sims, T), buffer=paths_shm.buf)[start:stop]
+        chunks = _return_chunks(
+            weights @ mean_returns,
+            L.T @ weights,
+            stop - start,
+            T,
+            np.random.default_rng(seed),
+            chunk_size,
+            sampler,
+        )
+        _fill_paths(paths, chunks, initial_value)
+        statistics = PathStatistics.from_paths(paths)
+        del inputs, weights, mean_returns, L, paths
+        return statistics
+    finally:
+        inputs_shm.close()
+        paths_shm.close()
+
+
+def monte_carlo_parallel(
+    weights: np.ndarray,
+    mean_returns: pd.Series,
+    cov_matrix: pd.DataFrame,
+    mc_sims: int = MC_SIMS,
+    T: int = MC_DAYS,
+    initial_value: float = INITIAL_PORTFOLIO,
+    seed: Optional[int] = None,
+    workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    sampler: str = "pseudo",
+) -> MonteCarloResult:
+    """Monte Carlo across a process pool.
+
+    Paths are split into one contiguous block per worker, each drawing from its
+    own SeedSequence.spawn child, so results are bit-reproducible for a given
+    seed and worker count (but differ from the single-process stream). Workers
+    read the weights, mean vector and Cholesky factor from shared memory and
+    write their paths into a shared matrix; their partial statistics are merged
+    in block order. For the quasi-random samplers each worker scrambles its
+    own sequence. Antithetic blocks hold whole pairs.
+    """
+    if mc_sims <= 0:
+        raise ValueError(f"mc_sims must be positive, got {mc_sims}")
+    workers = workers or os.cpu_count() or 1
+    weights = np.asarray(weights, dtype=float)
+    n_assets = len(weights)
+    L = np.linalg.cholesky(np.asarray(cov_matrix, dtype=float))
+    step = 2 if sampler == "antithetic" else 1
+    if mc_sims % step:
+        raise ValueError("Antithetic sampling needs an even number of paths")
+    bounds = np.linspace(0, mc_sims // step, workers + 1).astype(int) * step
+    seeds = np.random.SeedSequence(seed).spawn(workers)
+
+    inputs_shm = SharedMemory(create=True, size=(n_assets + 2) * n_assets * 8)
+    paths_shm = SharedMemory(create=True, size=max(1, mc_sims * T * 8))
+    try:
+        inputs = np.ndarray((n_assets + 2, n_assets), buffer=inputs_shm.buf)
+        inputs[0] = weights
+        inputs[1] = np.asarray(mean_returns, dtype=float)
+        inputs[2:] = L
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(
+                    _simulate_block,
+                    inputs_shm.name,
+                    n_assets,
+                    paths_shm.name,
+                    mc_sims,
+                    T,
+                    start,
+                    stop,
+                    initial_value,
+                    block_seed,
+                    chunk_size,
+                    sampler,
+                )
+                for start, stop, block_seed in zip(bounds[:-1], bounds[1:], seeds)
+                if stop > start
+            ]
+            partials = [future.result() for future in futures]
+        paths = np.ndarray((mc_sims, T), buffer=paths_shm.buf).copy()
+        del inputs
+    finally:
+        inputs_shm.close()
+        inputs_shm.unlink()
+        paths_shm.close()
+        paths_shm.unlink()
+
+    statistics = partials[0]
+    for partial in partials[1:]:
+        statistics = statistics.merge(partial)
+    return MonteCarloResult(
+        paths,
+        initial_value,
+        statistics=statistics,
+        sampler=sampler,
+        expected_daily_return=weights @ np.asarray(mean_returns, dtype=float),
+    )
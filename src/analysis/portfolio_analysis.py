@@ -7,8 +7,8 @@ from src.analysis.stock_returns import (
     fetch_stock_returns,
     convert_perc_returns_to_cumulative_perc_returns,
 )
-from pandas import DataFrame, Series, to_numeric, read_html
-import statsmodels.api as sm
+from src.analysis.factor_regression import OLSResult, fit_ols
+from pandas import DataFrame, Series, to_numeric
 from typing import Optional
 import logging
 import numpy as np
@@ -62,11 +62,7 @@ class PortfolioAnalysis:
         df = self.grouped_cumulative_returns.copy()
         df = df.merge(self.FF_factor_cumulative_returns, on="Date")
         X, y = split_df_into_X_and_y(df)
-        model = run_ols_regression(y, X)
-        summary = model.summary().tables[1].as_html()
-        self.analysis = read_html(summary, header=0)[0].rename(
-            columns={"Unnamed: 0": "var"}
-        )
+        self.analysis = run_ols_regression(y, X).summary()
         return self.analysis
 
 
@@ -98,10 +94,8 @@ def split_df_into_X_and_y(df: DataFrame) -> tuple[DataFrame, Series]:
     return X, y
 
 
-def run_ols_regression(y, X) -> sm.regression.linear_model.RegressionResults:
-    X = sm.add_constant(X, prepend=False)
-    model = sm.OLS(y, X, missing="drop")
-    res = model.fit()
+def run_ols_regression(y, X) -> OLSResult:
+    res = fit_ols(y, X)
     logging.debug(res.summary())
     return res
 
@@ -133,11 +127,7 @@ def main(symbols: Optional[list[str]] = None):
     pf_analysis.cumulative_returns = process_df(pf_analysis.cumulative_returns)
 
     X, y = split_df_into_X_and_y(pf_analysis.cumulative_returns)
-    model = run_ols_regression(y, X)
-    summary = model.summary().tables[1].as_html()
-    pf_analysis.analysis = read_html(summary, header=0)[0].rename(
-        columns={"Unnamed: 0": "var"}
-    )
+    pf_analysis.analysis = run_ols_regression(y, X).summary()
     return pf_analysis
 
 
@@ -0,0 +1,103 @@
+"""Rolling mean vectors and covariance matrices over a (dates x assets) returns
+panel, updated one observation at a time as the window slides.
+
+Sliding windows add the newest row and remove the oldest with the Welford
+update and its inverse, and exponentially weighted windows decay the previous
+estimate, so each date costs O(assets^2) regardless of the window length.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+
+@dataclass
+class RollingMoments:
+    """Per-date moments: `means` is (dates x assets) and `covariances` is
+    (dates x assets x assets). Dates before the window fills are NaN."""
+
+    index: pd.Index
+    columns: pd.Index
+    counts: np.ndarray
+    means: np.ndarray
+    covariances: np.ndarray
+
+    def _position(self, date) -> int:
+        return self.index.get_loc(date) if date is not None else len(self.index) - 1
+
+    def mean(self, date=None) -> pd.Series:
+        """Mean returns at `date` (default: the last date)."""
+        return pd.Series(self.means[self._position(date)], index=self.columns)
+
+    def covariance(self, date=None) -> DataFrame:
+        """Covariance matrix at `date` (default: the last date)."""
+        return DataFrame(
+            self.covariances[self._position(date)],
+            index=self.columns,
+            columns=self.columns,
+        )
+
+    def valid_dates(self) -> pd.Index:
+        return self.index[~np.isnan(self.means).any(axis=1)]
+
+
+def rolling_moments(
+    returns: DataFrame,
+    window: Optional[int] = None,
+    halflife: Optional[float] = None,
+    min_periods: Optional[int] = None,
+    dtype=np.float64,
+) -> RollingMoments:
+    """Mean and covariance of `returns` over a sliding window of `window` rows
+    (sample covariance, ddof=1) or an exponentially weighted window with the
+    given `halflife` in rows (matching pandas ewm(adjust=False) with
+    bias=True). Rows with a missing value are skipped, as in
+    RunningCovariance, so a full window may hold fewer rows; a date gets
+    moments once its window has filled and holds at least `min_periods`
+    (default 2) complete rows. Pass dtype=np.float32 to halve the output size.
+    """
+    if (window is None) == (halflife is None):
+        raise ValueError("Pass exactly one of window and halflife")
+    x = returns.to_numpy(dtype=float)
+    n_dates, n_assets = x.shape
+    complete = ~np.isnan(x).any(axis=1)
+    min_periods = max(2, min_periods or 2)
+    first = window - 1 if window is not None else 0
+    alpha = None if halflife is None else 1 - np.exp(-np.log(2) / halflife)
+
+    counts = np.zeros(n_dates, dtype=np.int64)
+    means = np.full((n_dates, n_assets), np.nan, dtype=dtype)
+    covariances = np.full((n_dates, n_assets, n_assets), np.nan, dtype=dtype)
+    count = 0
+    mean = np.zeros(n_assets)
+    comoment = np.zeros((n_assets, n_assets))
+    for t in range(n_dates):
+        if window is not None and t >= window and complete[t - window]:
+            # Inverse Welford update: drop the row leaving the window
+            old = x[t - window]
+            count -= 1
+            if count:
+                new_mean = mean - (old - mean) / count
+                comoment -= np.outer(old - new_mean, old - mean)
+                mean = new_mean
+            else:
+                mean, comoment = np.zeros(n_assets), np.zeros((n_assets, n_assets))
+        if complete[t]:
+            delta = x[t] - mean
+            count += 1
+            if alpha is None:
+                mean = mean + delta / count
+                comoment += np.outer(delta, x[t] - mean)
+            elif count == 1:
+                mean = x[t].copy()
+            else:
+                mean = mean + alpha * delta
+                # Exponentially weighted (biased) covariance, kept in comoment
+                comoment = (1 - alpha) * (comoment + alpha * np.outer(delta, delta))
+        counts[t] = count
+        if t >= first and count >= min_periods:
+            means[t] = mean
+            covariances[t] = comoment / (count - 1) if alpha is None else comoment
+    return RollingMoments(returns.index, returns.columns, counts, means, covariances)
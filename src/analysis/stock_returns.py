@@ -1,7 +1,10 @@
-import yfinance as yf
 import pandas as pd
 import datetime as dt
-from common.sql_queries import get_portfolio_returns, get_factor_portfolio_returns
+from common.sql_queries import (
+    get_portfolio_returns,
+    get_factor_portfolio_returns,
+    get_monthly_close_prices,
+)
 from common.calculations import calculcate_returns_percentage
 from common.database import sqlite3_conn
 
@@ -18,19 +21,19 @@ def convert_perc_returns_to_cumulative_perc_returns(df: pd.DataFrame) -> pd.Data
 
 
 def get_sp500_symbols() -> list[str]:
-    symbols = sqlite3_conn.sql_query_to_df("SELECT DISTINCT(symbol) FROM SP500")
-    return list(symbols["symbol"].unique())
+    symbols = sqlite3_conn.sql_table_to_df("SP500", columns=["symbol"], distinct=True)
+    return list(symbols["symbol"])
 
 
-def fetch_stock_returns(
-    symbols: list[str],
-    interval: str = "1d",
-    return_format: str = "absolute",  # absolute, percentage, cumulative_percentage
-) -> pd.DataFrame:
-    symbols = [symbols] if isinstance(symbols, str) else symbols
-    symbols = [s.upper() for s in symbols]
+RETURNS_START_DATE = dt.date(2018, 1, 1)
+
+
+def download_close_prices(symbols: list[str], interval: str) -> pd.DataFrame:
+    # Imported here so analysing stored returns does not need yfinance
+    import yfinance as yf
+
     df: pd.DataFrame = yf.download(
-        symbols, interval=interval, start="2018-01-01", end=dt.date.today()
+        symbols, interval=interval, start=RETURNS_START_DATE, end=dt.date.today()
     )["Close"]
 
     if isinstance(df, pd.Series):
@@ -39,6 +42,27 @@ def fetch_stock_returns(
 
     if interval == "1mo":
         df.index = df.index.strftime("%Y-%m")
+    return df
+
+
+def fetch_stock_returns(
+    symbols: list[str],
+    interval: str = "1d",
+    return_format: str = "absolute",  # absolute, percentage, cumulative_percentage
+) -> pd.DataFrame:
+    symbols = [symbols] if isinstance(symbols, str) else symbols
+    symbols = [s.upper() for s in symbols]
+    if interval == "1mo":
+        # Served from the StockHistoryMonthly rollup; only symbols the ETL has
+        # not loaded are downloaded
+        df = get_monthly_close_prices(symbols, start_date=RETURNS_START_DATE)
+        missing = [s for s in symbols if s not in df.columns]
+        if missing:
+            df = pd.concat([df, download_close_prices(missing, interval)], axis=1)
+        df = df.sort_index().reindex(columns=symbols)
+        df.index.name = "Date"
+    else:
+        df = download_close_prices(symbols, interval)
 
     if return_format == "absolute":
         return df
@@ -52,14 +76,13 @@ def fetch_stock_returns(
 
 
 def get_sp500_stockhistory_data():
-    symbols = get_sp500_symbols()
-    symbols_str = "','".join(symbols)
     return sqlite3_conn.sql_query_to_df(
-        f"""    SELECT strftime('%Y-%m',date) as date,
-                id, symbol, price_open, price_close
-                FROM stockhistory
-                WHERE symbol IN ('{symbols_str}')
-                """
+        """ SELECT strftime('%Y-%m', m.month * 86400, 'unixepoch') as date,
+            s.symbol, m.price_open, m.price_close
+            FROM StockHistoryMonthly m
+            JOIN DimSymbol s ON s.symbol_id = m.symbol_id
+            WHERE s.symbol IN (SELECT DISTINCT symbol FROM SP500)
+            """
     )
 
 
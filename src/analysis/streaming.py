@@ -0,0 +1,191 @@
+"""Reducers over chunked query results (see DBConnection.iter_sql_*_chunks).
+
+Each reducer keeps only per-symbol or per-asset state between chunks, so a
+universe-wide StockHistory pull never has to fit in memory at once.
+"""
+from typing import Iterable, Iterator, Optional, Union
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas import DataFrame
+
+from common.database import CHUNK_SIZE, DBConnection
+
+Chunk = Union[DataFrame, pa.RecordBatch]
+
+
+def _to_df(chunk: Chunk) -> DataFrame:
+    return chunk.to_pandas() if isinstance(chunk, pa.RecordBatch) else chunk
+
+
+def iter_stock_history(
+    db_conn: DBConnection,
+    symbol_ids: Optional[list[int]] = None,
+    columns: Optional[list[str]] = None,
+    date_range=None,
+    by_date: bool = False,
+    chunksize: int = CHUNK_SIZE,
+) -> Iterator[DataFrame]:
+    """Stream StockHistory ordered by symbol then date, or by date then symbol
+    (`by_date`) for reducers that need observations aligned across symbols.
+    Both orders are read from an index (migrations 2 and 5), not sorted."""
+    order_by = ["date", "symbol_id"] if by_date else ["symbol_id", "date"]
+    return db_conn.iter_sql_table_chunks(
+        "StockHistory",
+        chunksize=chunksize,
+        columns=columns or ["symbol_id", "date", "price_close"],
+        filters={"symbol_id": symbol_ids} if symbol_ids else None,
+        date_range=date_range,
+        order_by=order_by,
+    )
+
+
+def iter_returns(
+    chunks: Iterable[Chunk], key: str = "symbol_id", price: str = "price_close"
+) -> Iterator[DataFrame]:
+    """Add a simple `return` column to a stream ordered by date within each key.
+
+    The last price per key is carried over, so the first row of a key in a
+    chunk still gets its return against the previous chunk.
+    """
+    last_prices: dict = {}
+    for chunk in chunks:
+        df = _to_df(chunk)
+        previous = df.groupby(key, sort=False)[price].shift(1)
+        first_rows = ~df[key].duplicated()
+        previous[first_rows] = df.loc[first_rows, key].map(last_prices)
+        df = df.assign(**{"return": df[price] / previous - 1})
+        last_prices.update(df.groupby(key, sort=False)[price].last())
+        yield df
+
+
+def per_symbol_returns(
+    chunks: Iterable[Chunk], key: str = "symbol_id", price: str = "price_close"
+) -> DataFrame:
+    """Periods, mean and volatility of returns and total return per key.
+
+    Chunk statistics are merged with the pairwise update of Chan et al., which
+    stays numerically stable without a second pass over the data.
+    """
+    totals = DataFrame(columns=["periods", "mean", "m2", "log_growth"], dtype=float)
+    for df in iter_returns(chunks, key=key, price=price):
+        df = df.loc[df["return"].notna(), [key, "return"]]
+        if df.empty:
+            continue
+        grouped = df.assign(log_growth=np.log1p(df["return"])).groupby(key)
+        batch = DataFrame(
+            {
+                "periods": grouped["return"].count(),
+                "mean": grouped["return"].mean(),
+                "m2": grouped["return"].var(ddof=0) * grouped["return"].count(),
+                "log_growth": grouped["log_growth"].sum(),
+            }
+        )
+        index = totals.index.union(batch.index)
+        a = totals.reindex(index, fill_value=0.0)
+        b = batch.reindex(index, fill_value=0.0)
+        periods = a["periods"] + b["periods"]
+        delta = b["mean"] - a["mean"]
+        totals = DataFrame(
+            {
+                "periods": periods,
+                "mean": a["mean"] + delta * b["periods"] / periods,
+                "m2": a["m2"]
+                + b["m2"]
+                + delta**2 * a["periods"] * b["periods"] / periods,
+                "log_growth": a["log_growth"] + b["log_growth"],
+            }
+        )
+    totals.index.name = key
+    return DataFrame(
+        {
+            "periods": totals["periods"].astype(int),
+            "mean_return": totals["mean"],
+            "volatility": np.sqrt(totals["m2"] / (totals["periods"] - 1)),
+            "total_return": np.expm1(totals["log_growth"]),
+        }
+    )
+
+
+def iter_wide(
+    chunks: Iterable[Chunk],
+    index: str = "date",
+    columns: str = "symbol_id",
+    values: str = "return",
+) -> Iterator[DataFrame]:
+    """Pivot a stream ordered by `index` into wide frames. Rows of the last
+    index value are held back until the next chunk, as they may continue there."""
+    pending = None
+    for chunk in chunks:
+        df = _to_df(chunk)
+        if pending is not None:
+            df = pd.concat([pending, df], ignore_index=True)
+        last = df[index].iloc[-1]
+        pending = df.loc[df[index] == last]
+        ready = df.loc[df[index] != last]
+        if not ready.empty:
+            yield ready.pivot(index=index, columns=columns, values=values)
+    if pending is not None and not pending.empty:
+        yield pending.pivot(index=index, columns=columns, values=values)
+
+
+class RunningCovariance:
+    """Covariance between the columns of a stream of wide frames (one row per
+    observation), merged batch by batch. Rows with any missing value are
+    skipped, matching a complete-case covariance."""
+
+    def __init__(self, columns: Optional[list] = None):
+        self.columns = list(columns) if columns is not None else None
+        self.count = 0
+        self._mean: Optional[np.ndarray] = None
+        self._comoment: Optional[np.ndarray] = None
+
+    def update(self, df: DataFrame) -> "RunningCovariance":
+        if self.columns is None:
+            self.columns = list(df.columns)
+        x = df.reindex(columns=self.columns).dropna().to_numpy(dtype=float)
+        if not len(x):
+            return self
+        batch_count = len(x)
+        batch_mean = x.mean(axis=0)
+        centered = x - batch_mean
+        batch_comoment = centered.T @ centered
+        if self.count == 0:
+            self.count = batch_count
+            self._mean, self._comoment = batch_mean, batch_comoment
+            return self
+        count = self.count + batch_count
+        delta = batch_mean - self._mean
+        self._comoment = (
+            self._comoment
+            + batch_comoment
+            + np.outer(delta, delta) * self.count * batch_count / count
+        )
+        self._mean = self._mean + delta * batch_count / count
+        self.count = count
+        return self
+
+    @property
+    def mean(self) -> pd.Series:
+        return pd.Series(self._mean, index=self.columns)
+
+    def covariance(self, ddof: int = 1) -> DataFrame:
+        return DataFrame(
+            self._comoment / (self.count - ddof),
+            index=self.columns,
+            columns=self.columns,
+        )
+
+
+def running_covariance(
+    chunks: Iterable[Chunk],
+    columns: Optional[list] = None,
+    key: str = "symbol_id",
+    price: str = "price_close",
+) -> RunningCovariance:
+    """Return covariance for a long-format price stream ordered by date."""
+    covariance = RunningCovariance(columns)
+    returns = iter_returns(chunks, key=key, price=price)
+    for wide in iter_wide(returns, columns=key):
+        covariance.update(wide)
+    return covariance
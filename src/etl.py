@@ -1,26 +1,43 @@
 from common.models import (
     StockHistory,
-    StockHistoryRecord,
+    StockHistoryBatch,
     StockContract,
     StockContractRecord,
+    FailedSymbol,
+    FetchResult,
+    StockContractLoad,
+    StockPriceHistoryLoad,
 )
 from common.interactive_brokers import (
+    AsyncInteractiveBrokersApi,
     InteractiveBrokersApi,
     ib_api,
 )
-from common.database import DBConnection
-from typing import Union
+from common.database import DBConnection, SQLDBConnection
+from typing import Iterable, Iterator, Union
+from dataclasses import fields
+import numpy as np
 import pandas as pd
 from pandas import DataFrame, read_html, read_fwf, concat
 from common.database import sqlite3_conn
+from common.sql_queries import STOCK_HISTORY_MONTHLY_ROLLUP
 from typing import Optional
 from datetime import datetime, date, timedelta
 import hashlib
-from common.dt import format_datetime
-import requests
+from common.dt import format_datetimes, to_epoch_days, from_epoch_days
+from dateutil.tz import tzlocal
+from pandas.api.types import is_list_like
 from zipfile import ZipFile
-from io import BytesIO
+from io import BytesIO, StringIO
+from common.http_cache import HttpCache, http_cache, DAY
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from common.rate_limit import RateLimiter, rate_limiters
+from src.orchestrator import Stage, Orchestrator, CheckpointStore, COMPLETED
+from src.snapshots import ReferenceSnapshots, ReferenceTable
+import argparse
+import asyncio
 import logging
+import sys
 from yahoo_fin.stock_info import (
     get_data,
     tickers_sp500,
@@ -44,6 +61,22 @@ def get_hashed_id(*values) -> str:
     return hashlib.md5(_bytes).hexdigest()
 
 
+def _to_str_column(value, length: int) -> list[str]:
+    if is_list_like(value):
+        return [v if isinstance(v, str) else str(v) for v in value]
+    return [value if isinstance(value, str) else str(value)] * length
+
+
+def get_hashed_ids(*values) -> list[str]:
+    """Batch get_hashed_id over columns; scalar values are broadcast to every row."""
+    length = max((len(value) for value in values if is_list_like(value)), default=1)
+    columns = [_to_str_column(value, length) for value in values]
+    return [
+        hashlib.md5("".join(parts).encode("utf-8")).hexdigest()
+        for parts in zip(*columns)
+    ]
+
+
 def convert_stock_contracts_to_records(
     stock_contracts: list[StockContract],
 ) -> list[StockContractRecord]:
@@ -62,54 +95,89 @@ def convert_stock_contracts_to_records(
     ]
 
 
-def convert_stock_history_to_records(
-    stock_history: list[StockHistory],
-) -> list[StockHistoryRecord]:
-    records = []
+def iter_stock_history_batches(
+    stock_history: Iterable[StockHistory],
+) -> Iterator[StockHistoryBatch]:
     for stock in stock_history:
-        for datapoint in stock.data:
-            dt = format_datetime(datetime.fromtimestamp(datapoint["t"] / 1000))
-            records.append(
-                StockHistoryRecord(
-                    id=get_hashed_id(stock.conid, dt),
-                    conid=stock.conid,
-                    serverId=stock.serverId,
-                    symbol=stock.symbol,
-                    text=stock.text,
-                    priceFactor=stock.priceFactor,
-                    chartAnnotations=stock.chartAnnotations,
-                    startTime=stock.startTime,
-                    high=stock.high,
-                    low=stock.low,
-                    timePeriod=stock.timePeriod,
-                    barLength=stock.barLength,
-                    mdAvailability=stock.mdAvailability,
-                    mktDataDelay=stock.mktDataDelay,
-                    outsideRth=stock.outsideRth,
-                    volumeFactor=stock.volumeFactor,
-                    priceDisplayRule=stock.priceDisplayRule,
-                    priceDisplayValue=stock.priceDisplayValue,
-                    negativeCapable=stock.negativeCapable,
-                    messageVersion=stock.messageVersion,
-                    points=stock.points,
-                    travelTime=stock.travelTime,
-                    price_open=datapoint["o"],
-                    price_close=datapoint["c"],
-                    price_high=datapoint["h"],
-                    price_low=datapoint["l"],
-                    volume=datapoint["v"],
-                    datetime=dt,
+        # getattr, not asdict, so the bar payload is not deep-copied per contract
+        series = {
+            field.name: getattr(stock, field.name)
+            for field in fields(stock)
+            if field.name != "data"
+        }
+        n = len(stock.data)
+        yield StockHistoryBatch(
+            series=series,
+            **{
+                column: np.fromiter(
+                    (datapoint[key] for datapoint in stock.data), dtype=dtype, count=n
                 )
-            )
-    return records
+                for column, key, dtype in [
+                    ("open", "o", float),
+                    ("high", "h", float),
+                    ("low", "l", float),
+                    ("close", "c", float),
+                    ("volume", "v", float),
+                    ("timestamp", "t", np.int64),
+                ]
+            },
+        )
+
+
+def transform_stock_history_batch_to_sql_df(batch: StockHistoryBatch) -> DataFrame:
+    # Bars are stamped in local time, matching datetime.fromtimestamp
+    dt = (
+        pd.to_datetime(batch.timestamp, unit="ms", utc=True)
+        .tz_convert(tzlocal())
+        .tz_localize(None)
+    )
+    dt = format_datetimes(dt).values
+    return DataFrame(
+        {
+            "id": get_hashed_ids(batch.conid, dt),
+            "conid": batch.conid,
+            "datetime": dt,
+            "price_open": batch.open,
+            "price_high": batch.high,
+            "price_low": batch.low,
+            "price_close": batch.close,
+            "volume": batch.volume,
+        }
+    )
+
+
+def transform_stock_history_series_to_sql_df(
+    batches: list[StockHistoryBatch],
+) -> DataFrame:
+    df = DataFrame([batch.series for batch in batches])
+    df.insert(0, "id", get_hashed_ids(df["conid"], df["barLength"]))
+    return df
+
+
+def fetch_symbol_price_history(
+    symbol: str,
+    start_date: date,
+    end_date: date,
+    interval: str,
+    rate_limiter: Optional[RateLimiter] = None,
+) -> DataFrame:
+    if rate_limiter:
+        rate_limiter.wait()
+    return get_data(
+        symbol,
+        start_date=start_date,
+        end_date=end_date,
+        interval=interval,
+    )
 
 
 def transform_stock_history_to_sql_df(
     df: DataFrame,
 ) -> DataFrame:
     df.reset_index(inplace=True)
-    df["Date"] = df["index"].map(format_datetime)
-    df["id"] = df.apply(lambda x: get_hashed_id(x["ticker"], x["Date"]), axis=1)
+    # Ids keep hashing the ISO timestamp so they match previously loaded rows
+    df["id"] = get_hashed_ids(df["ticker"], format_datetimes(df["index"]))
+    df["date"] = to_epoch_days(df["index"])
     df = df.rename(
         columns={
             "ticker": "symbol",
@@ -122,7 +190,7 @@ def transform_stock_history_to_sql_df(
     )
     cols = [
         "id",
-        "Date",
+        "date",
         "symbol",
         "price_open",
         "price_low",
@@ -146,7 +214,7 @@ def transform_sp500_data_to_sql_df(
         "Date added": "date_added",
     }
     df = df.rename(columns=col_mapping)
-    df["id"] = df.apply(lambda x: get_hashed_id(x["Security"], date.today()), axis=1)
+    df["id"] = get_hashed_ids(df["Security"], date.today())
     return df
 
 
@@ -156,62 +224,172 @@ def transform_ff_factors_to_sql_df(
     df.reset_index(inplace=True)
     df.rename(columns={"Mkt-RF": "mkt_rf"}, inplace=True)
     split_index = df.index[df["index"] == "Annua"][0]
-    df = df.iloc[:split_index]
-    df["Date"] = df["index"].apply(
-        lambda x: format_datetime(datetime.strptime(x, "%Y%m"))
-    )
-    df["id"] = df["Date"].apply(lambda x: get_hashed_id(x))
+    df = df.iloc[:split_index].copy()
+    factor_cols = [col for col in df.columns if col != "index"]
+    df[factor_cols] = df[factor_cols].astype(float)
+    df["id"] = get_hashed_ids(format_datetimes(df["index"], format="%Y%m"))
+    df["date"] = to_epoch_days(df["index"], format="%Y%m")
     df = df.drop(columns="index")
     return df
 
 
+SP500_URL = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
+FF_FACTORS_URL = "http://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/F-F_Research_Data_5_Factors_2x3_TXT.zip"
+
+
+SYMBOL_REFERENCE = ReferenceTable("Symbol", min_rows=1_000)
+SP500_REFERENCE = ReferenceTable("SP500", min_rows=450, max_shrink=0.1)
+
+
 class ETL:
-    def __init__(self, db_conn: DBConnection, api: InteractiveBrokersApi):
+    def __init__(
+        self,
+        db_conn: DBConnection,
+        api: InteractiveBrokersApi,
+        cache: HttpCache = http_cache,
+        async_api: Optional[AsyncInteractiveBrokersApi] = None,
+    ):
         self.db_conn = db_conn
         self.api = api
-
-    def stock_contract(self, symbols: Union[list[str], str]) -> DataFrame:
+        self.cache = cache
+        self.async_api = async_api
+        self.snapshots = ReferenceSnapshots(db_conn)
+
+    async def _fetch_stock_contracts(self, symbols: list[str]) -> FetchResult:
+        async with self.async_api:
+            return await self.async_api.fetch_stock_contracts(symbols)
+
+    def stock_contract(self, symbols: Union[list[str], str]) -> StockContractLoad:
+        """Look up and upsert the contracts of `symbols`. With an `async_api`
+        the symbols are requested concurrently, and symbols whose request
+        fails are reported instead of aborting the load."""
         table = "StockContract"
-        api_data = self.api.fetch_stock_contracts(symbols)
-        records = convert_stock_contracts_to_records(api_data)
+        symbols = [symbols] if isinstance(symbols, str) else symbols
+        if self.async_api is None:
+            fetched = FetchResult(data=self.api.fetch_stock_contracts(symbols))
+        else:
+            fetched = asyncio.run(self._fetch_stock_contracts(symbols))
+        if fetched.failed_symbols:
+            logging.warning(
+                f"Failed to fetch stock contracts for {len(fetched.failed_symbols)} "
+                f"of {len(symbols)} symbols"
+            )
+        records = convert_stock_contracts_to_records(fetched.data)
         df = DataFrame(records)
-        self.db_conn.df_to_sql_table(df, table=table)
-        logging.info(f"Inserted {len(records)} stock contract records into {table}")
-        self.db_conn.deduplicate_table(table)
-        return df
+        if records:
+            self.db_conn.upsert_df_to_sql_table(df, table=table)
+        logging.info(f"Upserted {len(records)} stock contract records into {table}")
+        return StockContractLoad(data=df, failed_symbols=fetched.failed_symbols)
 
     def stock_price_history(
         self,
         symbols: Union[list[str], str],
         years: int = 3,
         interval: str = "1mo",
-    ) -> DataFrame:
+        max_workers: int = 8,
+        rate_limiter: Optional[RateLimiter] = rate_limiters["yahoo"],
+        incremental: bool = False,
+    ) -> StockPriceHistoryLoad:
 
         symbols = [symbols] if isinstance(symbols, str) else symbols
         table = "StockHistory"
         today = date.today()
-        df = DataFrame()
+        full_start_date = today - timedelta(days=365 * years)
+        start_dates = {symbol: full_start_date for symbol in symbols}
+        if incremental:
+            # Refetch from the latest stored bar so a partial period gets updated
+            latest_dates = get_latest_price_dates(self.db_conn, symbols)
+            start_dates.update(latest_dates)
+            logging.info(
+                f"Incremental load: {len(latest_dates)} of {len(symbols)} symbols "
+                f"have stored history in {table}"
+            )
+            # A bar dated today leaves an empty range, which Yahoo rejects
+            up_to_date = {s for s, latest in latest_dates.items() if latest >= today}
+            if up_to_date:
+                symbols = [s for s in symbols if s not in up_to_date]
+                logging.info(f"Skipping {len(up_to_date)} symbols stored up to today")
+        frames = []
         failed_symbols = []
-        for symbol in symbols:
-            try:
-                data = get_data(
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(
+                    fetch_symbol_price_history,
                     symbol,
-                    start_date=today - timedelta(days=365 * years),
+                    start_date=start_dates[symbol],
                     end_date=today,
                     interval=interval,
+                    rate_limiter=rate_limiter,
+                ): symbol
+                for symbol in symbols
+            }
+            for future in as_completed(futures):
+                symbol = futures[future]
+                try:
+                    frames.append(future.result())
+                except Exception as e:
+                    failed_symbols.append(
+                        FailedSymbol(
+                            symbol=symbol, error=str(e), error_type=type(e).__name__
+                        )
+                    )
+
+        if failed_symbols:
+            logging.warning(
+                f"Failed to fetch price history for {len(failed_symbols)} of "
+                f"{len(symbols)} symbols"
+            )
+        if not frames:
+            return StockPriceHistoryLoad(
+                data=DataFrame(), failed_symbols=failed_symbols
+            )
+
+        df = transform_stock_history_to_sql_df(concat(frames))
+        df = replace_symbols_with_ids(self.db_conn, df)
+        self.db_conn.upsert_df_to_sql_table(df, table=table)
+        logging.info(f"Upserted {len(df)} stock price records into {table}")
+        months = update_stock_history_monthly(self.db_conn, df)
+        logging.info(f"Refreshed {months} symbol months in StockHistoryMonthly")
+        return StockPriceHistoryLoad(data=df, failed_symbols=failed_symbols)
+
+    def stock_contract_price_history(
+        self,
+        conids: Union[list[int], int],
+        period: str = "1y",
+        bar: str = "1m",
+        chunk_size: int = 100_000,
+    ) -> int:
+        """Stream IB bar history into SQLite, writing at most ~chunk_size bars
+        at a time so memory stays flat regardless of the number of conids."""
+        table = "StockContractHistory"
+        series_table = "StockContractHistorySeries"
+        responses = self.api.iter_stock_price_history(conids, period=period, bar=bar)
+        pending, pending_rows, total_rows = [], 0, 0
+        for batch in iter_stock_history_batches(responses):
+            pending.append(batch)
+            pending_rows += len(batch)
+            if pending_rows >= chunk_size:
+                total_rows += self._write_stock_history_batches(
+                    pending, table, series_table
                 )
-                df = concat([df, data])
-            except Exception as e:
-                failed_symbols.append((symbol, e))
-
-        df = transform_stock_history_to_sql_df(df)
-        self.db_conn.df_to_sql_table(df, table=table)
-        logging.info(f"Inserted {len(df)} stock price records into {table}")
-        self.db_conn.deduplicate_table(table)
-        return df
+                pending, pending_rows = [], 0
+        if pending:
+            total_rows += self._write_stock_history_batches(
+                pending, table, series_table
+            )
+        logging.info(f"Upserted {total_rows} stock price bars into {table}")
+        return total_rows
+
+    def _write_stock_history_batches(
+        self, batches: list[StockHistoryBatch], table: str, series_table: str
+    ) -> int:
+        df = concat([transform_stock_history_batch_to_sql_df(b) for b in batches])
+        self.db_conn.upsert_df_to_sql_table(df, table=table)
+        series = transform_stock_history_series_to_sql_df(batches)
+        self.db_conn.upsert_df_to_sql_table(series, table=series_table)
+        return len(df)
 
     def fetch_stock_symbols(self) -> DataFrame:
-        table = "Symbol"
         df = pd.DataFrame()
         ticker_sources = {
             "sp500": tickers_sp500(),
@@ -225,75 +403,153 @@ class ETL:
             row["source"] = source
             df = pd.concat([df, row])
 
-        self.db_conn.df_to_sql_table(df, table=table)
-        df = self.db_conn.sql_table_to_df(table)
+        df = df.loc[df["symbol"].astype(bool)].drop_duplicates(["symbol", "source"])
+        self.snapshots.load(SYMBOL_REFERENCE, df)
         return df
 
     def sp500(self) -> DataFrame:
-        table = "SP500"
-        html = read_html("https://en.wikipedia.org/wiki/List_of_S%26P_500_companies")
+        response = self.cache.get(SP500_URL, ttl=DAY)
+        html = read_html(StringIO(response.text))
         df = transform_sp500_data_to_sql_df(html[0])
-        self.db_conn.df_to_sql_table(df, table=table)
-        logging.info(f"Inserted {len(df)} S&P500 records into {table}")
-        self.db_conn.deduplicate_table(table)
+        self.snapshots.load(SP500_REFERENCE, df)
         return df
 
     def fama_french_factors(self) -> DataFrame:
         table = "FFFactors"
-        url = "http://mba.tuck.dartmouth.edu/pages/faculty/ken.french/ftp/F-F_Research_Data_5_Factors_2x3_TXT.zip"
-        response = requests.get(url)
+        response = self.cache.get(FF_FACTORS_URL, ttl=7 * DAY)
         _zip = ZipFile(BytesIO(response.content))
         _bytes = _zip.read("F-F_Research_Data_5_Factors_2x3.txt")
         df = read_fwf(BytesIO(_bytes), skiprows=2, index_col=[0])
         df = transform_ff_factors_to_sql_df(df)
-        self.db_conn.df_to_sql_table(df, table=table)
-        logging.info(f"Inserted {len(df)} FF factors records into {table}")
-        self.db_conn.deduplicate_table(table)
+        self.db_conn.upsert_df_to_sql_table(df, table=table)
+        logging.info(f"Upserted {len(df)} FF factors records into {table}")
         return df
 
 
 def get_available_symbols() -> list[str]:
     db_conn: DBConnection = sqlite3_conn
-    df = db_conn.sql_table_to_df(table="Symbol")
-    return list(df["symbol"].unique())
+    df = db_conn.sql_table_to_df(table="Symbol", columns=["symbol"], distinct=True)
+    return list(df["symbol"])
 
 
 def get_sp500_symbols(db_conn: DBConnection) -> list[str]:
-    df = db_conn.sql_table_to_df(table="SP500")
-    return list(df["symbol"].unique())
+    df = db_conn.sql_table_to_df(table="SP500", columns=["symbol"], distinct=True)
+    return list(df["symbol"])
+
+
+def get_symbol_ids(db_conn: DBConnection, symbols: list[str]) -> dict[str, int]:
+    """Look up DimSymbol keys, registering symbols that are not in it yet."""
+    symbols = sorted(set(symbols))
+    db_conn.upsert_df_to_sql_table(
+        DataFrame({"symbol": symbols}), table="DimSymbol", key="symbol"
+    )
+    df = db_conn.sql_table_to_df(
+        table="DimSymbol",
+        columns=["symbol", "symbol_id"],
+        filters={"symbol": symbols},
+    )
+    return dict(zip(df["symbol"], df["symbol_id"]))
+
+
+def replace_symbols_with_ids(db_conn: DBConnection, df: DataFrame) -> DataFrame:
+    symbol_ids = get_symbol_ids(db_conn, list(df["symbol"].unique()))
+    df = df.copy()
+    df.insert(df.columns.get_loc("symbol"), "symbol_id", df["symbol"].map(symbol_ids))
+    return df.drop(columns="symbol")
+
+
+def get_latest_price_dates(
+    db_conn: DBConnection, symbols: Optional[list[str]] = None
+) -> dict[str, date]:
+    df = db_conn.sql_query_to_df(
+        """SELECT s.symbol, MAX(h.date) AS date
+            FROM StockHistory h
+            JOIN DimSymbol s ON s.symbol_id = h.symbol_id
+            GROUP BY s.symbol""",
+        filters={"symbol": symbols} if symbols else None,
+    )
+    return {
+        symbol: from_epoch_days(latest)
+        for symbol, latest in zip(df["symbol"], df["date"])
+    }
+
+
+def update_stock_history_monthly(db_conn: SQLDBConnection, df: DataFrame) -> int:
+    """Recompute StockHistoryMonthly for only the symbol months present in `df`,
+    a frame of StockHistory rows with `symbol_id` and epoch-day `date`."""
+    months = df["date"].to_numpy().astype("datetime64[D]").astype("datetime64[M]")
+    touched = DataFrame(
+        {
+            "symbol_id": df["symbol_id"].to_numpy(),
+            "month": months.astype("datetime64[D]").astype(np.int64),
+            "next_month": (months + 1).astype("datetime64[D]").astype(np.int64),
+        }
+    ).drop_duplicates()
+    with db_conn.connections.writer() as conn:
+        conn.executemany(STOCK_HISTORY_MONTHLY_ROLLUP, touched.to_numpy().tolist())
+    return len(touched)
 
 
 def get_conids_for_symbols(
     db_conn: DBConnection, symbols: Optional[list[str]] = None
 ) -> list[str]:
-    df = db_conn.sql_table_to_df(table="StockContract")
-    df = df.loc[df["isUS"] == 1]
+    filters = {"isUS": 1}
     if symbols:
-        df = df.loc[df["symbol"].isin(symbols)]
-    return list(df["conid"].unique())
-
-
-def main():
-    """Fetch data and write to sqlite3 database."""
-    etl = ETL(sqlite3_conn, ib_api)
+        filters["symbol"] = symbols
+    df = db_conn.sql_table_to_df(
+        table="StockContract", columns=["conid"], filters=filters, distinct=True
+    )
+    return list(df["conid"])
 
-    # # Fetch S&P 500 data
-    # etl.sp500()
 
-    # # Fetch Fama French factors data
-    # etl.fama_french_factors()
+def build_stages(etl: ETL) -> list[Stage]:
+    db_conn = etl.db_conn
+    return [
+        Stage("sp500", etl.sp500),
+        Stage("fama_french_factors", etl.fama_french_factors),
+        Stage("fetch_stock_symbols", etl.fetch_stock_symbols),
+        Stage(
+            "stock_contract",
+            lambda: etl.stock_contract(get_sp500_symbols(db_conn)),
+            depends_on=["sp500"],
+        ),
+        Stage(
+            "stock_price_history",
+            lambda: etl.stock_price_history(
+                get_sp500_symbols(db_conn), years=5, interval="1mo", incremental=True
+            ),
+            depends_on=["sp500"],
+        ),
+    ]
 
-    # Fetch stock contract data
-    # symbols = get_sp500_symbols(sqlite3_conn)
-    # etl.stock_contract(symbols)
 
-    # Fetch stock price history data
-    # symbols = ["ECNL"]
-    # conids = get_conids_for_symbols(sqlite3_conn)
-    # etl.stock_price_history(conids=conids, period="5y", bar="1m")
-    # etl.stock_price_history(symbols=symbols, years=5, interval="1mo")
+def main():
+    """Fetch data and write to sqlite3 database."""
+    etl = ETL(sqlite3_conn, ib_api, async_api=AsyncInteractiveBrokersApi())
+    stages = build_stages(etl)
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument(
+        "--stages",
+        nargs="+",
+        choices=[stage.name for stage in stages],
+        help="Stages to run, plus their dependencies (default: all)",
+    )
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--run-id", help="Run to resume or checkpoint under")
+    parser.add_argument(
+        "--resume", action="store_true", help="Resume the latest unfinished run"
+    )
+    args = parser.parse_args()
 
-    etl.fetch_stock_symbols()
+    orchestrator = Orchestrator(
+        stages, CheckpointStore(etl.db_conn), max_workers=args.concurrency
+    )
+    statuses = orchestrator.run(args.stages, run_id=args.run_id, resume=args.resume)
+    for stage, status in statuses.items():
+        logging.info(f"{stage}: {status}")
+    if any(status != COMPLETED for status in statuses.values()):
+        sys.exit(1)
 
 
 if __name__ == "__main__":
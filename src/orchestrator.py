@@ -0,0 +1,172 @@
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Optional
+import logging
+import uuid
+
+from pandas import DataFrame
+
+from common.database import DBConnection
+
+CHECKPOINT_TABLE = "EtlCheckpoint"
+
+CREATE_CHECKPOINT_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {CHECKPOINT_TABLE} (
+id VARCHAR(80) NOT NULL PRIMARY KEY,
+run_id VARCHAR(40) NOT NULL,
+stage VARCHAR(40) NOT NULL,
+status VARCHAR(10) NOT NULL,
+error VARCHAR(200) NULL,
+_ts INTEGER NOT NULL
+);"""
+
+COMPLETED = "completed"
+FAILED = "failed"
+# The stage ran but reported failed items (e.g. `failed_symbols` of a
+# StockPriceHistoryLoad); it is not checkpointed as done, so --resume reruns it
+PARTIAL = "partial"
+RUNNING = "running"
+SKIPPED = "skipped"
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[], Any]
+    depends_on: list[str] = field(default_factory=list)
+
+
+def failed_items(result: Any) -> list:
+    return list(getattr(result, "failed_symbols", None) or [])
+
+
+class CheckpointStore:
+    """Persists per-run stage statuses so a failed run can be resumed."""
+
+    def __init__(self, db_conn: DBConnection):
+        self.db_conn = db_conn
+        self.db_conn.execute_query(CREATE_CHECKPOINT_TABLE)
+
+    def _checkpoints(self) -> DataFrame:
+        return self.db_conn.sql_table_to_df(CHECKPOINT_TABLE)
+
+    def completed_stages(self, run_id: str) -> set[str]:
+        df = self._checkpoints()
+        df = df.loc[(df["run_id"] == run_id) & (df["status"] == COMPLETED)]
+        return set(df["stage"])
+
+    def latest_unfinished_run(self) -> Optional[str]:
+        df = self._checkpoints().sort_values("_ts")
+        unfinished = df.loc[df["status"] != COMPLETED, "run_id"]
+        return unfinished.iloc[-1] if len(unfinished) else None
+
+    def mark(
+        self, run_id: str, stage: str, status: str, error: Optional[str] = None
+    ) -> None:
+        df = DataFrame(
+            [
+                {
+                    "id": f"{run_id}:{stage}",
+                    "run_id": run_id,
+                    "stage": stage,
+                    "status": status,
+                    "error": error,
+                }
+            ]
+        )
+        self.db_conn.upsert_df_to_sql_table(df, table=CHECKPOINT_TABLE)
+
+
+class Orchestrator:
+    """Runs stages in dependency order, independent stages in parallel.
+
+    Stages run on worker threads, so their SQLite writes should go through the
+    SQLDBConnection of the checkpoint store, whose single writer serializes
+    them.
+    """
+
+    def __init__(
+        self, stages: list[Stage], checkpoints: CheckpointStore, max_workers: int = 1
+    ):
+        self.stages = {stage.name: stage for stage in stages}
+        self.checkpoints = checkpoints
+        self.max_workers = max_workers
+        for stage in stages:
+            unknown = set(stage.depends_on) - set(self.stages)
+            if unknown:
+                raise ValueError(f"Stage {stage.name} depends on unknown {unknown}")
+
+    def _with_dependencies(self, names: list[str]) -> list[str]:
+        selected, pending = [], list(names)
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage: {name}")
+            if name not in selected:
+                selected.append(name)
+                pending.extend(self.stages[name].depends_on)
+        return [name for name in self.stages if name in selected]
+
+    def run(
+        self,
+        stages: Optional[list[str]] = None,
+        run_id: Optional[str] = None,
+        resume: bool = False,
+    ) -> dict[str, str]:
+        if resume and run_id is None:
+            run_id = self.checkpoints.latest_unfinished_run()
+        if run_id is None:
+            run_id = f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:6]}"
+        logging.info(f"Starting ETL run {run_id}")
+
+        selected = self._with_dependencies(stages or list(self.stages))
+        completed = self.checkpoints.completed_stages(run_id)
+        statuses = {name: COMPLETED for name in completed}
+        if completed:
+            logging.info(f"Resuming {run_id}, skipping completed {sorted(completed)}")
+        todo = [name for name in selected if name not in statuses]
+
+        running: dict[Future, str] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while todo or running:
+                for name in list(todo):
+                    deps = [statuses.get(dep) for dep in self.stages[name].depends_on]
+                    if any(dep in (FAILED, PARTIAL, SKIPPED) for dep in deps):
+                        statuses[name] = SKIPPED
+                        todo.remove(name)
+                        self.checkpoints.mark(run_id, name, SKIPPED)
+                    elif all(dep == COMPLETED for dep in deps):
+                        todo.remove(name)
+                        self.checkpoints.mark(run_id, name, RUNNING)
+                        logging.info(f"[{run_id}] Starting stage {name}")
+                        running[executor.submit(self.stages[name].run)] = name
+
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    error = future.exception()
+                    failed = [] if error else failed_items(future.result())
+                    if failed:
+                        statuses[name] = PARTIAL
+                        message = f"{len(failed)} failed: " + ", ".join(
+                            str(getattr(item, "symbol", item)) for item in failed
+                        )
+                        self.checkpoints.mark(run_id, name, PARTIAL, message[:200])
+                        logging.warning(f"[{run_id}] Stage {name} partially failed")
+                    elif error is None:
+                        statuses[name] = COMPLETED
+                        self.checkpoints.mark(run_id, name, COMPLETED)
+                        logging.info(f"[{run_id}] Completed stage {name}")
+                    else:
+                        statuses[name] = FAILED
+                        self.checkpoints.mark(run_id, name, FAILED, str(error)[:200])
+                        logging.error(f"[{run_id}] Stage {name} failed: {error}")
+
+        for name in todo:
+            # Only reachable with cyclic dependencies
+            statuses[name] = SKIPPED
+            logging.error(f"[{run_id}] Stage {name} has unresolvable dependencies")
+        return {name: statuses[name] for name in selected}
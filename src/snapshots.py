@@ -0,0 +1,184 @@
+from dataclasses import dataclass
+from datetime import datetime
+import logging
+import re
+import sqlite3
+
+from pandas import DataFrame
+
+from common.database import SQLDBConnection
+
+SNAPSHOT_CATALOG_TABLE = "ReferenceSnapshot"
+
+CREATE_SNAPSHOT_CATALOG_TABLE = f"""
+CREATE TABLE IF NOT EXISTS {SNAPSHOT_CATALOG_TABLE} (
+table_name VARCHAR(40) NOT NULL,
+snapshot_id VARCHAR(40) NOT NULL,
+row_count INTEGER NOT NULL,
+_ts INTEGER NOT NULL,
+PRIMARY KEY (table_name, snapshot_id)
+);"""
+
+
+class SnapshotValidationError(ValueError):
+    pass
+
+
+@dataclass
+class ReferenceTable:
+    """A table that is fully replaced by each load, e.g. a ticker list.
+
+    A new snapshot must have at least `min_rows` rows and may not shrink the
+    live table by more than `max_shrink`, which catches truncated scrapes.
+    `retention` snapshots are kept in `<name>Snapshot`.
+    """
+
+    name: str
+    min_rows: int = 1
+    max_shrink: float = 0.5
+    retention: int = 30
+
+    @property
+    def staging_table(self) -> str:
+        return f"{self.name}Staging"
+
+    @property
+    def snapshot_table(self) -> str:
+        return f"{self.name}Snapshot"
+
+
+class ReferenceSnapshots:
+    """Loads reference tables through a staging table that is validated and
+    then swapped in within one transaction, so readers see either the old or
+    the new snapshot and the live table only ever holds one of them."""
+
+    def __init__(self, db_conn: SQLDBConnection):
+        self.db_conn = db_conn
+        self.db_conn.execute_query(CREATE_SNAPSHOT_CATALOG_TABLE)
+
+    def _schema_sql(self, conn: sqlite3.Connection, type_: str, table: str):
+        return [
+            sql
+            for (sql,) in conn.execute(
+                """SELECT sql FROM sqlite_schema
+                    WHERE type = ? AND tbl_name = ? AND sql IS NOT NULL""",
+                (type_, table),
+            )
+        ]
+
+    def _create_staging_table(self, reference: ReferenceTable) -> None:
+        with self.db_conn.connections.writer() as conn:
+            create_sql = self._schema_sql(conn, "table", reference.name)
+            if not create_sql:
+                raise ValueError(f"Table {reference.name} does not exist")
+            staging_sql = re.sub(
+                rf'^CREATE TABLE\s+"?{reference.name}"?',
+                f"CREATE TABLE {reference.staging_table}",
+                create_sql[0],
+                flags=re.IGNORECASE,
+            )
+            conn.execute(f"DROP TABLE IF EXISTS {reference.staging_table}")
+            conn.execute(staging_sql)
+
+    def validate(self, reference: ReferenceTable) -> list[str]:
+        [(staged,)] = self.db_conn.execute_query(
+            f"SELECT COUNT(*) FROM {reference.staging_table}"
+        )
+        [(live,)] = self.db_conn.execute_query(f"SELECT COUNT(*) FROM {reference.name}")
+        errors = []
+        if staged < reference.min_rows:
+            errors.append(f"{staged} rows, expected at least {reference.min_rows}")
+        if live and staged < live * (1 - reference.max_shrink):
+            errors.append(f"{staged} rows would shrink the live {live} rows too far")
+        return errors
+
+    def load(self, reference: ReferenceTable, df: DataFrame) -> str:
+        """Stage, validate and swap in `df` as the new snapshot of `reference`."""
+        snapshot_id = f"{datetime.now():%Y%m%d%H%M%S%f}"
+        self._create_staging_table(reference)
+        try:
+            self.db_conn.bulk_insert(df, reference.staging_table)
+        except sqlite3.IntegrityError as e:
+            self.db_conn.execute_query(f"DROP TABLE {reference.staging_table}")
+            raise SnapshotValidationError(f"{reference.name}: {e}") from e
+        errors = self.validate(reference)
+        if errors:
+            self.db_conn.execute_query(f"DROP TABLE {reference.staging_table}")
+            raise SnapshotValidationError(f"{reference.name}: {'; '.join(errors)}")
+        self._swap(reference, snapshot_id)
+        logging.info(
+            f"Swapped in snapshot {snapshot_id} of {reference.name} ({len(df)} rows)"
+        )
+        return snapshot_id
+
+    def _swap(self, reference: ReferenceTable, snapshot_id: str) -> None:
+        name, staging = reference.name, reference.staging_table
+        snapshot_table = reference.snapshot_table
+        with self.db_conn.connections.writer() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            columns = ", ".join(
+                f'"{row[1]}"' for row in conn.execute(f"PRAGMA table_info({staging})")
+            )
+            conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {snapshot_table} AS
+                    SELECT CAST(NULL AS VARCHAR(40)) AS snapshot_id, {columns}
+                    FROM {staging} WHERE 0"""
+            )
+            conn.execute(
+                f"""CREATE INDEX IF NOT EXISTS ix_{snapshot_table}_snapshot_id
+                    ON {snapshot_table} (snapshot_id)"""
+            )
+            conn.execute(
+                f"""INSERT INTO {snapshot_table} (snapshot_id, {columns})
+                    SELECT ?, {columns} FROM {staging}""",
+                (snapshot_id,),
+            )
+            conn.execute(
+                f"""INSERT INTO {SNAPSHOT_CATALOG_TABLE}
+                    (table_name, snapshot_id, row_count, _ts)
+                    SELECT ?, ?, COUNT(*), CAST(strftime('%s', 'now') AS INTEGER)
+                    FROM {staging}""",
+                (name, snapshot_id),
+            )
+
+            indexes = self._schema_sql(conn, "index", name)
+            conn.execute(f"DROP TABLE {name}")
+            conn.execute(f"ALTER TABLE {staging} RENAME TO {name}")
+            for index_sql in indexes:
+                conn.execute(index_sql)
+            self._prune(conn, reference)
+
+    def _prune(self, conn: sqlite3.Connection, reference: ReferenceTable) -> None:
+        expired = [
+            snapshot_id
+            for (snapshot_id,) in conn.execute(
+                f"""SELECT snapshot_id FROM {SNAPSHOT_CATALOG_TABLE}
+                    WHERE table_name = ?
+                    ORDER BY snapshot_id DESC
+                    LIMIT -1 OFFSET ?""",
+                (reference.name, reference.retention),
+            )
+        ]
+        for snapshot_id in expired:
+            conn.execute(
+                f"DELETE FROM {reference.snapshot_table} WHERE snapshot_id = ?",
+                (snapshot_id,),
+            )
+            conn.execute(
+                f"""DELETE FROM {SNAPSHOT_CATALOG_TABLE}
+                    WHERE table_name = ? AND snapshot_id = ?""",
+                (reference.name, snapshot_id),
+            )
+
+    def snapshot(self, reference: ReferenceTable, snapshot_id: str) -> DataFrame:
+        return self.db_conn.sql_table_to_df(
+            reference.snapshot_table, filters={"snapshot_id": snapshot_id}
+        )
+
+    def snapshot_ids(self, reference: ReferenceTable) -> list[str]:
+        df = self.db_conn.sql_table_to_df(
+            SNAPSHOT_CATALOG_TABLE,
+            columns=["snapshot_id"],
+            filters={"table_name": reference.name},
+        )
+        return sorted(df["snapshot_id"])
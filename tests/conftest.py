@@ -0,0 +1,10 @@
+import pytest
+
+from common.database import SQLDBConnection
+
+
+@pytest.fixture
+def db_conn(tmp_path):
+    db_conn = SQLDBConnection(str(tmp_path / "test.db"))
+    yield db_conn
+    db_conn.connections.close()
@@ -0,0 +1,128 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from common.async_rest_api import AsyncRestAPI, gather_results  # noqa: E402
+
+
+class Gateway:
+    """Local server that throttles the first `throttled` requests with a 429,
+    answers paths containing "broken" with invalid JSON and records the
+    requested paths and how many requests are in flight at once."""
+
+    def __init__(self, throttled: int = 0, delay: float = 0.0):
+        self.throttled = throttled
+        self.delay = delay
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.paths = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("localhost", 0), self._handler_class())
+
+    def _handler_class(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with gateway._lock:
+                    gateway.requests += 1
+                    gateway.paths.append(self.path)
+                    throttle = gateway.requests <= gateway.throttled
+                    gateway.in_flight += 1
+                    gateway.max_in_flight = max(
+                        gateway.max_in_flight, gateway.in_flight
+                    )
+                time.sleep(gateway.delay)
+                with gateway._lock:
+                    gateway.in_flight -= 1
+                body = b"{" if "broken" in self.path else b'{"ok": true}'
+                self.send_response(429 if throttle else 200)
+                self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self) -> "Gateway":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def api(self, **kwargs) -> AsyncRestAPI:
+        api = AsyncRestAPI(min_backoff=0.01, **kwargs)
+        host, port = self._server.server_address[:2]
+        api.base_url = f"http://{host}:{port}/"
+        api.endpoints = {"tickle": "tickle", "positions": "{account}/positions/{page}"}
+        return api
+
+
+def test_throttled_requests_are_retried():
+    async def fetch(api):
+        async with api:
+            return await api.fetch_response_json("tickle")
+
+    with Gateway(throttled=2) as gateway:
+        assert asyncio.run(fetch(gateway.api())) == {"ok": True}
+    assert gateway.requests == 3
+
+
+def test_requests_in_flight_are_bounded():
+    async def fetch_many(api):
+        async with api:
+            return await asyncio.gather(
+                *(api.fetch_status_code("tickle") for _ in range(20))
+            )
+
+    with Gateway(delay=0.02) as gateway:
+        assert asyncio.run(fetch_many(gateway.api(max_in_flight=4))) == [200] * 20
+    assert 1 < gateway.max_in_flight <= 4
+
+
+def test_requests_need_the_context_manager():
+    with pytest.raises(RuntimeError):
+        asyncio.run(AsyncRestAPI().fetch_response("tickle"))
+
+
+def test_path_params_fill_the_endpoint():
+    async def fetch(api):
+        async with api:
+            return await api.fetch_response_json(
+                "positions", path_params={"account": "U1", "page": 2}
+            )
+
+    with Gateway() as gateway:
+        assert asyncio.run(fetch(gateway.api())) == {"ok": True}
+    assert gateway.paths == ["/U1/positions/2"]
+
+
+def test_failed_requests_are_reported_without_cancelling_the_rest():
+    async def fetch(api):
+        async with api:
+            return await gather_results(
+                {
+                    account: api.fetch_response_json(
+                        "positions", path_params={"account": account, "page": 0}
+                    )
+                    for account in ["U1", "broken", "U3"]
+                }
+            )
+
+    with Gateway(delay=0.02) as gateway:
+        result = asyncio.run(fetch(gateway.api()))
+    assert result.data == [{"ok": True}, {"ok": True}]
+    [failed] = result.failed_symbols
+    assert (failed.symbol, failed.error_type) == ("broken", "JSONDecodeError")
+    assert len(gateway.paths) == 3
@@ -0,0 +1,183 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+from pandas import DataFrame
+
+from common.database import Range, build_select
+
+from migration.tables import DatabaseTable, FFFactors, add_primary_key_index
+
+
+def factor_rows(date: int, mkt_rf: float) -> DataFrame:
+    return DataFrame(
+        {
+            "id": [f"ff-{date}", f"ff-{date + 1}"],
+            "date": [date, date + 1],
+            "mkt_rf": [mkt_rf, mkt_rf],
+            "smb": 0.1,
+            "hml": 0.2,
+            "rmw": 0.3,
+            "cma": 0.4,
+            "rf": 0.01,
+        }
+    )
+
+
+def test_upsert_is_idempotent(db_conn):
+    db_conn.execute_query(FFFactors)
+    df = factor_rows(19000, 1.5)
+    db_conn.upsert_df_to_sql_table(df, table="FFFactors")
+    db_conn.upsert_df_to_sql_table(df, table="FFFactors")
+
+    stored = db_conn.sql_table_to_df("FFFactors")
+    assert len(stored) == 2
+    assert list(stored["mkt_rf"]) == [1.5, 1.5]
+
+
+def test_upsert_updates_rows_with_existing_keys(db_conn):
+    db_conn.execute_query(FFFactors)
+    db_conn.upsert_df_to_sql_table(factor_rows(19000, 1.5), table="FFFactors")
+    db_conn.upsert_df_to_sql_table(factor_rows(19001, -2.0), table="FFFactors")
+
+    stored = db_conn.sql_query_to_df("SELECT date, mkt_rf FROM FFFactors ORDER BY date")
+    assert stored.to_dict("list") == {
+        "date": [19000, 19001, 19002],
+        "mkt_rf": [1.5, -2.0, -2.0],
+    }
+
+
+def test_primary_key_index_deduplicates_legacy_tables(db_conn):
+    db_conn.execute_query("CREATE TABLE Legacy (id VARCHAR(40), value INT, _ts INT)")
+    db_conn.execute_query(
+        "INSERT INTO Legacy VALUES ('a', 1, 0), ('a', 2, 0), ('b', 3, 0)"
+    )
+
+    add_primary_key_index(db_conn, DatabaseTable("Legacy", ""))
+    db_conn.upsert_df_to_sql_table(
+        DataFrame({"id": ["a"], "value": [4]}), table="Legacy"
+    )
+
+    stored = db_conn.sql_query_to_df("SELECT id, value FROM Legacy ORDER BY id")
+    assert stored.to_dict("list") == {"id": ["a", "b"], "value": [4, 3]}
+
+
+def test_concurrent_writes_are_serialized(db_conn):
+    db_conn.execute_query("CREATE TABLE Counter (id INTEGER PRIMARY KEY, thread INT)")
+
+    def insert_rows(thread: int) -> None:
+        for _ in range(50):
+            db_conn.execute_query("INSERT INTO Counter (thread) VALUES (?)", (thread,))
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(insert_rows, range(8)))
+
+    counts = db_conn.sql_query_to_df(
+        "SELECT thread, COUNT(*) AS n FROM Counter GROUP BY thread"
+    )
+    assert counts["n"].tolist() == [50] * 8
+
+
+def test_readers_are_per_thread_and_read_only(db_conn):
+    db_conn.execute_query("CREATE TABLE Numbers (n INTEGER)")
+    connections = db_conn.connections
+    reader = connections.reader()
+    assert connections.reader() is reader
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        other = executor.submit(connections.reader).result()
+    assert other is not reader
+    with pytest.raises(sqlite3.OperationalError):
+        reader.execute("INSERT INTO Numbers VALUES (1)")
+
+
+def test_readers_see_the_last_committed_snapshot_during_writes(db_conn):
+    db_conn.execute_query("CREATE TABLE Numbers (n INTEGER)")
+    db_conn.execute_query("INSERT INTO Numbers VALUES (1)")
+
+    def count() -> int:
+        return db_conn.sql_query_to_df("SELECT COUNT(*) AS n FROM Numbers")["n"][0]
+
+    with db_conn.connections.writer() as conn:
+        conn.execute("INSERT INTO Numbers VALUES (2)")
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            assert executor.submit(count).result() == 1
+    assert count() == 2
+
+
+def test_table_reads_push_down_projection_and_filters(db_conn):
+    db_conn.execute_query(FFFactors)
+    db_conn.execute_query("CREATE INDEX ix_FFFactors_date ON FFFactors (date)")
+    db_conn.upsert_df_to_sql_table(
+        pd.concat([factor_rows(day, day / 1000) for day in range(19000, 19010, 2)]),
+        table="FFFactors",
+    )
+
+    df = db_conn.sql_table_to_df(
+        "FFFactors",
+        columns=["date", "mkt_rf"],
+        filters={"id": ["ff-19002", "ff-19003", "ff-19008"], "rf": 0.01},
+        date_range=(date(2022, 1, 9), date(2022, 1, 15)),
+    )
+    assert list(df.columns) == ["date", "mkt_rf"]
+    assert df["date"].tolist() == [19002, 19003]
+    assert db_conn.sql_table_to_df("FFFactors", filters={"smb": None}).empty
+    assert db_conn.sql_table_to_df("FFFactors", filters={"id": []}).empty
+
+    query, params = build_select(
+        "FFFactors", filters={"date": Range(low=19004)}, limit=3
+    )
+    plan = db_conn.sql_query_to_df(f"EXPLAIN QUERY PLAN {query}", params=params)
+    assert plan["detail"].str.startswith("SEARCH FFFactors USING INDEX").any()
+
+
+def test_query_reads_filter_around_the_query(db_conn):
+    db_conn.execute_query(FFFactors)
+    db_conn.upsert_df_to_sql_table(factor_rows(19000, 1.5), table="FFFactors")
+
+    df = db_conn.sql_query_to_df(
+        "SELECT date, mkt_rf * 2 AS doubled FROM FFFactors",
+        columns=["doubled"],
+        filters={"date": 19001},
+        distinct=True,
+    )
+    assert df.to_dict("list") == {"doubled": [3.0]}
+
+
+def test_bulk_insert_round_trips_columnar_data(db_conn):
+    db_conn.execute_query(
+        "CREATE TABLE Bars (id INTEGER, price REAL, label TEXT, at TEXT, _ts INTEGER)"
+    )
+    n_rows = 2_345
+    prices = np.arange(n_rows, dtype=float)
+    prices[7] = np.nan
+    labels = np.array([f"bar-{i}" for i in range(n_rows)], dtype=object)
+    labels[11] = None
+    data = {
+        "id": np.arange(n_rows),
+        "price": prices,
+        "label": labels,
+        "at": pd.date_range("2023-01-01", periods=n_rows, freq="min").to_numpy(),
+    }
+
+    # Batches and statements that do not divide the row count evenly
+    assert db_conn.bulk_insert(data, "Bars", batch_size=1_000) == n_rows
+
+    stored = db_conn.sql_query_to_df("SELECT * FROM Bars ORDER BY id")
+    assert stored["id"].tolist() == list(range(n_rows))
+    assert stored["price"].isna().tolist() == [i == 7 for i in range(n_rows)]
+    assert stored["label"].isna().sum() == 1 and stored["label"][12] == "bar-12"
+    assert stored["at"][61] == "2023-01-01 01:01:00"
+    assert stored["_ts"].nunique() == 1
+
+
+def test_bulk_insert_with_the_journal_off_restores_wal(db_conn):
+    db_conn.execute_query("CREATE TABLE Numbers (n INTEGER, _ts INTEGER)")
+
+    db_conn.bulk_insert(DataFrame({"n": range(10)}), "Numbers", journal_off=True)
+
+    assert db_conn.execute_query("PRAGMA journal_mode") == [("wal",)]
+    assert db_conn.sql_query_to_df("SELECT n FROM Numbers")["n"].sum() == 45
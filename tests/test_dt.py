@@ -0,0 +1,28 @@
+from datetime import datetime
+
+import pandas as pd
+
+from common.dt import format_datetime, format_datetimes
+
+
+def test_format_datetimes_matches_format_datetime_on_timestamps():
+    values = pd.Series(
+        [
+            pd.Timestamp("2022-01-03"),
+            pd.Timestamp("2022-01-03 10:11:12.75"),
+            pd.NaT,
+            pd.Timestamp("1999-12-31 23:59:59"),
+        ]
+    )
+
+    assert list(format_datetimes(values)) == list(values.map(format_datetime))
+
+
+def test_format_datetimes_parses_strings_like_strptime():
+    values = pd.Series(["196307", "199912", "202302"])
+
+    expected = values.apply(lambda x: format_datetime(datetime.strptime(x, "%Y%m")))
+    assert list(format_datetimes(values, format="%Y%m")) == list(expected)
+    assert list(format_datetimes(pd.DatetimeIndex(["2022-01-03"]))) == [
+        "2022-01-03T00:00:00"
+    ]
@@ -0,0 +1,136 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analysis.efficient_frontier import (
+    TRADING_DAYS,
+    efficient_frontier_portfolios,
+    generate_random_portfolios,
+    iter_random_portfolio_chunks,
+    min_variance_portfolio,
+    portfolio_annualized_performance,
+    simulate_frontier,
+    tangency_portfolio,
+)
+
+RISK_FREE_RATE = 0.02
+MEAN_RETURNS = pd.Series([0.12, 0.08, 0.05], index=["A", "B", "C"]) / TRADING_DAYS
+COV_MATRIX = (
+    pd.DataFrame(
+        [[0.09, 0.01, 0.0], [0.01, 0.04, 0.005], [0.0, 0.005, 0.01]],
+        index=MEAN_RETURNS.index,
+        columns=MEAN_RETURNS.index,
+    )
+    / TRADING_DAYS
+)
+
+
+def simplex_grid(step: float = 0.005) -> np.ndarray:
+    """Every long-only weight vector of three assets on a `step` grid."""
+    ticks = np.arange(0, 1 + step / 2, step)
+    a, b = np.meshgrid(ticks, ticks)
+    weights = np.column_stack([a.ravel(), b.ravel(), 1 - a.ravel() - b.ravel()])
+    return weights[weights[:, 2] >= -1e-12]
+
+
+def sharpe(weights: np.ndarray) -> np.ndarray:
+    std, returns = portfolio_annualized_performance(weights, MEAN_RETURNS, COV_MATRIX)
+    return (returns - RISK_FREE_RATE) / std
+
+
+def test_long_only_tangency_matches_brute_force():
+    grid = simplex_grid()
+    best = grid[np.argmax(sharpe(grid))]
+
+    weights = tangency_portfolio(MEAN_RETURNS, COV_MATRIX, RISK_FREE_RATE)
+
+    assert weights.sum() == pytest.approx(1)
+    assert (weights > -1e-9).all()
+    assert sharpe(weights.to_numpy()) >= sharpe(grid).max() - 1e-9
+    np.testing.assert_allclose(weights, best, atol=0.01)
+
+
+def test_unconstrained_tangency_beats_every_grid_portfolio():
+    ticks = np.linspace(-1, 2, 301)
+    a, b = np.meshgrid(ticks, ticks)
+    grid = np.column_stack([a.ravel(), b.ravel(), 1 - a.ravel() - b.ravel()])
+
+    weights = tangency_portfolio(MEAN_RETURNS, COV_MATRIX, RISK_FREE_RATE, bounds=None)
+
+    assert weights.sum() == pytest.approx(1)
+    assert sharpe(weights.to_numpy()) >= sharpe(grid).max() - 1e-9
+
+
+def test_long_only_min_variance_matches_brute_force():
+    grid = simplex_grid()
+    std, _ = portfolio_annualized_performance(grid, MEAN_RETURNS, COV_MATRIX)
+
+    weights = min_variance_portfolio(MEAN_RETURNS, COV_MATRIX)
+
+    np.testing.assert_allclose(weights, grid[np.argmin(std)], atol=0.01)
+
+
+def test_random_portfolios_do_not_beat_the_exact_frontier():
+    frontier = efficient_frontier_portfolios(
+        MEAN_RETURNS, COV_MATRIX, RISK_FREE_RATE, n_points=30
+    )
+    random = generate_random_portfolios(
+        20_000, MEAN_RETURNS, COV_MATRIX, RISK_FREE_RATE, seed=0
+    )
+    random_std, random_return, random_sharpe = random.iloc[:, -3:].to_numpy().T
+
+    assert frontier["sharpe_ratio"].iloc[-1] >= random_sharpe.max() - 1e-9
+    assert frontier["sharpe_ratio"].iloc[-1] == frontier["sharpe_ratio"].max()
+    # No random portfolio reaches a frontier point's return with less risk
+    for _, point in frontier.iloc[:-1].iterrows():
+        reaching = random_return >= point["portfolio_return"]
+        assert (random_std[reaching] >= point["portfolio_std_dev"] - 1e-9).all()
+
+
+def test_random_portfolio_metrics_match_the_per_portfolio_formula():
+    random = generate_random_portfolios(
+        500, MEAN_RETURNS, COV_MATRIX, RISK_FREE_RATE, seed=1
+    ).to_numpy()
+    weights, (std, returns, sharpe_ratio) = random[:, :3], random[:, 3:].T
+
+    mu, cov = MEAN_RETURNS.to_numpy(), COV_MATRIX.to_numpy()
+    for w, s, r, sr in zip(weights, std, returns, sharpe_ratio):
+        assert w.sum() == pytest.approx(1)
+        assert (w >= 0).all()
+        assert r == pytest.approx(w @ mu * TRADING_DAYS)
+        assert s == pytest.approx(np.sqrt(w @ cov @ w * TRADING_DAYS))
+        assert sr == pytest.approx((r - RISK_FREE_RATE) / s)
+
+
+@pytest.mark.parametrize("sampler", ["uniform", "dirichlet", "sobol"])
+def test_chunking_does_not_change_the_portfolios(sampler):
+    args = (1_000, MEAN_RETURNS, COV_MATRIX, RISK_FREE_RATE)
+
+    chunks = list(
+        iter_random_portfolio_chunks(*args, chunk_size=300, seed=2, sampler=sampler)
+    )
+    chunked = generate_random_portfolios(*args, chunk_size=300, seed=2, sampler=sampler)
+    single = generate_random_portfolios(
+        *args, chunk_size=1_000, seed=2, sampler=sampler
+    )
+
+    # Only one chunk of weights and metrics is held at a time
+    assert [len(weights) for weights, _ in chunks] == [300, 300, 300, 100]
+    pd.testing.assert_frame_equal(chunked, single)
+
+
+def test_simulated_frontier_keeps_the_best_portfolio_per_volatility_bin():
+    args = (5_000, MEAN_RETURNS, COV_MATRIX, RISK_FREE_RATE)
+    bins = 50
+
+    frontier = simulate_frontier(*args, bins=bins, chunk_size=700, seed=3)
+    single = simulate_frontier(*args, bins=bins, chunk_size=5_000, seed=3)
+    random = generate_random_portfolios(*args, seed=3)
+
+    pd.testing.assert_frame_equal(frontier, single)
+    std, returns, sharpe_ratio = random.iloc[:, -3:].to_numpy().T
+    max_std = np.sqrt(np.diag(COV_MATRIX).max() * TRADING_DAYS)
+    bin_ids = np.minimum((std / max_std * bins).astype(int), bins - 1)
+    best_returns = pd.Series(returns).groupby(bin_ids).max()
+    np.testing.assert_allclose(frontier.iloc[:-1, -2], best_returns)
+    assert frontier.iloc[-1, -1] == sharpe_ratio.max()
@@ -0,0 +1,333 @@
+from datetime import date, datetime, timedelta
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("yahoo_fin")
+
+from common.fixture_server import FixtureServer  # noqa: E402
+from common.interactive_brokers import AsyncInteractiveBrokersApi  # noqa: E402
+from common.models import FailedSymbol, StockHistory  # noqa: E402
+from common.rate_limit import RateLimiter  # noqa: E402
+from migration import tables  # noqa: E402
+from src import etl  # noqa: E402
+from common.dt import format_datetime, format_datetimes  # noqa: E402
+from src.etl import (  # noqa: E402
+    ETL,
+    get_hashed_id,
+    get_hashed_ids,
+    get_latest_price_dates,
+)
+
+
+def yahoo_bars(
+    symbol: str, start_date, end_date, interval: str = "1mo"
+) -> pd.DataFrame:
+    """A get_data response: one bar per day or month start in the range."""
+    index = pd.date_range(start_date, end_date, freq="D" if interval == "1d" else "MS")
+    prices = [float(i + 1) for i in range(len(index))]
+    return pd.DataFrame(
+        {
+            "open": prices,
+            "high": prices,
+            "low": prices,
+            "close": prices,
+            "adjclose": prices,
+            "volume": [100] * len(index),
+            "ticker": symbol,
+        },
+        index=index,
+    )
+
+
+class CountingRateLimiter(RateLimiter):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def wait(self) -> None:
+        self.calls.append(threading.get_ident())
+
+
+@pytest.fixture
+def history_etl(db_conn):
+    for name in ["DimSymbol", "StockHistory", "StockHistoryMonthly"]:
+        db_conn.execute_query(getattr(tables, name))
+    return ETL(db_conn, api=None)
+
+
+def stored_symbols(db_conn) -> list[str]:
+    df = db_conn.sql_query_to_df(
+        """SELECT DISTINCT s.symbol FROM StockHistory h
+            JOIN DimSymbol s ON s.symbol_id = h.symbol_id ORDER BY 1"""
+    )
+    return list(df["symbol"])
+
+
+def test_failed_symbols_are_reported_and_the_rest_upserted(history_etl, monkeypatch):
+    def get_data(symbol, **kwargs):
+        if symbol == "BAD":
+            raise ValueError("no data for BAD")
+        return yahoo_bars(symbol, **kwargs)
+
+    monkeypatch.setattr(etl, "get_data", get_data)
+    rate_limiter = CountingRateLimiter()
+
+    load = history_etl.stock_price_history(
+        ["AAA", "BAD", "CCC"], years=1, rate_limiter=rate_limiter
+    )
+
+    assert load.failed_symbols == [
+        FailedSymbol(symbol="BAD", error="no data for BAD", error_type="ValueError")
+    ]
+    assert list(load.failed_symbols_as_df["symbol"]) == ["BAD"]
+    assert stored_symbols(history_etl.db_conn) == ["AAA", "CCC"]
+    assert load.data["symbol_id"].nunique() == 2
+    assert len(rate_limiter.calls) == 3
+
+
+def test_symbols_are_fetched_concurrently(history_etl, monkeypatch):
+    # Each fetch waits until all three are in flight at once
+    barrier = threading.Barrier(3, timeout=5)
+
+    def get_data(symbol, **kwargs):
+        barrier.wait()
+        return yahoo_bars(symbol, **kwargs)
+
+    monkeypatch.setattr(etl, "get_data", get_data)
+    rate_limiter = CountingRateLimiter()
+
+    load = history_etl.stock_price_history(
+        ["AAA", "BBB", "CCC"], max_workers=3, rate_limiter=rate_limiter
+    )
+
+    assert load.failed_symbols == []
+    assert stored_symbols(history_etl.db_conn) == ["AAA", "BBB", "CCC"]
+    # The limiter is consulted once per symbol, on the worker threads
+    assert len(rate_limiter.calls) == 3
+    assert threading.get_ident() not in rate_limiter.calls
+
+
+def test_all_symbols_failing_returns_an_empty_load(history_etl, monkeypatch):
+    def get_data(symbol, **kwargs):
+        raise KeyError("chart")
+
+    monkeypatch.setattr(etl, "get_data", get_data)
+
+    load = history_etl.stock_price_history(["AAA", "BBB"], rate_limiter=None)
+
+    assert load.data.empty
+    assert sorted(failed.symbol for failed in load.failed_symbols) == ["AAA", "BBB"]
+    assert {failed.error_type for failed in load.failed_symbols} == {"KeyError"}
+
+
+def seed_daily_history(history_etl, monkeypatch, latest_dates: dict[str, date]):
+    def get_data(symbol, start_date, end_date, interval):
+        return yahoo_bars(
+            symbol,
+            latest_dates[symbol] - timedelta(days=5),
+            latest_dates[symbol],
+            interval,
+        )
+
+    monkeypatch.setattr(etl, "get_data", get_data)
+    history_etl.stock_price_history(
+        list(latest_dates), interval="1d", rate_limiter=None
+    )
+
+
+def test_latest_price_dates_are_the_watermark(history_etl, monkeypatch):
+    latest_dates = {"AAA": date(2022, 3, 4), "BBB": date(2022, 6, 30)}
+    seed_daily_history(history_etl, monkeypatch, latest_dates)
+
+    db_conn = history_etl.db_conn
+    assert get_latest_price_dates(db_conn) == latest_dates
+    assert get_latest_price_dates(db_conn, ["BBB", "CCC"]) == {"BBB": date(2022, 6, 30)}
+
+
+def test_incremental_load_fetches_only_missing_ranges(history_etl, monkeypatch):
+    today = date.today()
+    stale = today - timedelta(days=10)
+    seed_daily_history(history_etl, monkeypatch, {"NEW": today, "OLD": stale})
+    requested = {}
+
+    def get_data(symbol, start_date, end_date, interval):
+        requested[symbol] = (start_date, end_date)
+        return yahoo_bars(symbol, start_date, end_date, interval)
+
+    monkeypatch.setattr(etl, "get_data", get_data)
+
+    load = history_etl.stock_price_history(
+        ["NEW", "OLD", "NONE"],
+        years=1,
+        interval="1d",
+        incremental=True,
+        rate_limiter=None,
+    )
+
+    # NEW is stored up to today, so it is not requested with an empty range
+    assert requested == {
+        "OLD": (stale, today),
+        "NONE": (today - timedelta(days=365), today),
+    }
+    assert load.failed_symbols == []
+    assert get_latest_price_dates(history_etl.db_conn) == {
+        "NEW": today,
+        "OLD": today,
+        "NONE": today,
+    }
+
+
+def test_incremental_load_with_every_symbol_up_to_date(history_etl, monkeypatch):
+    seed_daily_history(history_etl, monkeypatch, {"NEW": date.today()})
+    monkeypatch.setattr(etl, "get_data", pytest.fail)
+
+    load = history_etl.stock_price_history(["NEW"], incremental=True, rate_limiter=None)
+
+    assert load.data.empty
+    assert load.failed_symbols == []
+
+
+def test_hashed_ids_match_row_wise_hashes():
+    df = pd.DataFrame(
+        {
+            "ticker": ["AAPL", "MSFT", None, "BRK-B"],
+            "index": pd.to_datetime(
+                ["2022-01-03", "2022-01-04 09:30", None, "2022-02-01"]
+            ),
+            "conid": np.array([265598, 272093, 0, 72063691], dtype=np.int64),
+            "price": [1.5, np.nan, 3.0, 10.0],
+        }
+    )
+    df["Date"] = df["index"].map(format_datetime)
+
+    # The row-wise hashing the transforms used before
+    expected = df.apply(lambda x: get_hashed_id(x["ticker"], x["Date"]), axis=1)
+    ids = get_hashed_ids(df["ticker"], format_datetimes(df["index"]))
+    assert ids == list(expected)
+    assert get_hashed_ids(df["conid"], df["price"]) == [
+        get_hashed_id(conid, price) for conid, price in zip(df["conid"], df["price"])
+    ]
+
+
+def test_hashed_ids_broadcast_scalars():
+    securities = pd.Series(["Apple Inc.", "Microsoft", "3M"])
+    today = date.today()
+
+    expected = [get_hashed_id(security, today) for security in securities]
+    assert get_hashed_ids(securities, today) == expected
+    assert get_hashed_ids(today) == [get_hashed_id(today)]
+    assert get_hashed_ids("AAPL", 1, None, np.nan) == [
+        get_hashed_id("AAPL", 1, None, np.nan)
+    ]
+
+
+def ib_history(conid: int, bars: int, start_ms: int = 1_640_995_200_000):
+    return StockHistory(
+        conid=conid,
+        symbol=f"S{conid}",
+        text=f"Stock {conid}",
+        serverId="20477",
+        barLength=60,
+        points=bars,
+        data=[
+            {
+                "o": 1.0 + i,
+                "h": 2.0 + i,
+                "l": 0.5 + i,
+                "c": 1.5 + i,
+                "v": 10.0 * i,
+                "t": start_ms + 60_000 * i,
+            }
+            for i in range(bars)
+        ],
+    )
+
+
+class HistoryApi:
+    def __init__(self, bars: dict[int, int]):
+        self.bars = bars
+
+    def iter_stock_price_history(self, conids, period, bar):
+        for conid in conids:
+            yield ib_history(conid, self.bars[conid])
+
+
+def test_contract_history_is_written_in_bounded_batches(db_conn, monkeypatch):
+    for name in ["StockContractHistory", "StockContractHistorySeries"]:
+        db_conn.execute_query(getattr(tables, name))
+    bars = {1: 40, 2: 25, 3: 50}
+    history_etl = ETL(db_conn, api=HistoryApi(bars))
+    writes = []
+    write = history_etl._write_stock_history_batches
+    monkeypatch.setattr(
+        history_etl,
+        "_write_stock_history_batches",
+        lambda batches, *args: writes.append(len(batches)) or write(batches, *args),
+    )
+
+    assert history_etl.stock_contract_price_history(list(bars), chunk_size=60) == 115
+
+    # Batches are flushed once they reach chunk_size bars, plus the remainder
+    assert writes == [2, 1]
+    stored = db_conn.sql_query_to_df(
+        "SELECT id, conid, datetime, price_open, price_close, volume "
+        "FROM StockContractHistory ORDER BY conid, datetime"
+    )
+    expected = [
+        (conid, bar) for conid in bars for bar in ib_history(conid, bars[conid]).data
+    ]
+    assert list(stored["conid"]) == [conid for conid, _ in expected]
+    assert list(stored["price_open"]) == [bar["o"] for _, bar in expected]
+    assert list(stored["price_close"]) == [bar["c"] for _, bar in expected]
+    # Ids and datetimes match the per-bar conversion they replaced
+    datetimes = [
+        format_datetime(datetime.fromtimestamp(bar["t"] / 1000)) for _, bar in expected
+    ]
+    assert list(stored["datetime"]) == datetimes
+    assert list(stored["id"]) == [
+        get_hashed_id(conid, dt) for (conid, _), dt in zip(expected, datetimes)
+    ]
+    series = db_conn.sql_query_to_df(
+        "SELECT conid, symbol, serverId, barLength, points "
+        "FROM StockContractHistorySeries ORDER BY conid"
+    )
+    assert series.to_dict("list") == {
+        "conid": [1, 2, 3],
+        "symbol": ["S1", "S2", "S3"],
+        "serverId": ["20477"] * 3,
+        "barLength": [60] * 3,
+        "points": [40, 25, 50],
+    }
+
+
+def test_stock_contracts_are_fetched_with_the_async_api(db_conn, tmp_path):
+    db_conn.execute_query(tables.StockContract)
+    (tmp_path / "trsrv").mkdir()
+    stocks = {
+        "AAPL": [
+            {
+                "name": "APPLE INC",
+                "chineseName": None,
+                "assetClass": "STK",
+                "contracts": [{"conid": 265598, "exchange": "NASDAQ", "isUS": True}],
+            }
+        ]
+    }
+    (tmp_path / "trsrv" / "stocks.json").write_text(json.dumps(stocks))
+
+    with FixtureServer(str(tmp_path)) as server:
+        async_api = AsyncInteractiveBrokersApi(base_url=server.base_url)
+        load = ETL(db_conn, api=None, async_api=async_api).stock_contract(
+            ["AAPL", "NOPE"]
+        )
+
+    # The fixture answers every symbol with AAPL, so NOPE fails to parse
+    assert [f.symbol for f in load.failed_symbols] == ["NOPE"]
+    assert load.failed_symbols[0].error_type == "KeyError"
+    stored = db_conn.sql_table_to_df("StockContract")
+    assert list(stored["symbol"]) == ["AAPL"]
+    assert list(stored["conid"]) == [265598]
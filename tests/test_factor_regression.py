@@ -0,0 +1,84 @@
+from io import StringIO
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analysis.factor_regression import SUMMARY_COLUMNS, fit_ols
+
+sm = pytest.importorskip("statsmodels.api")
+
+
+@pytest.fixture
+def factors():
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(rng.normal(0, 1e-3, (200, 3)), columns=["mkt", "smb", "hml"])
+
+
+@pytest.fixture
+def series(factors):
+    rng = np.random.default_rng(1)
+    noise = rng.normal(size=(200, 3))
+    y = pd.DataFrame(
+        {
+            "small": factors @ [2e-3, 1e-5, 3.0] + noise[:, 0] * 1e-6,
+            "large": noise[:, 1] * 1e5,
+            "gappy": factors @ [1.0, -0.5, 0.2] + noise[:, 2] * 1e-3,
+        }
+    )
+    y.loc[[3, 50, 51], "gappy"] = np.nan
+    return y
+
+
+def statsmodels_fit(y: pd.Series, factors: pd.DataFrame):
+    X = sm.add_constant(factors, prepend=False)
+    return sm.OLS(y, X, missing="drop").fit()
+
+
+def statsmodels_summary(fit) -> pd.DataFrame:
+    html = fit.summary().tables[1].as_html()
+    df = pd.read_html(StringIO(html), header=0, index_col=0)[0]
+    return df.rename_axis("var").reset_index().astype({"var": str})
+
+
+def test_estimates_match_statsmodels(factors, series):
+    result = fit_ols(series, factors)
+
+    for j, name in enumerate(series.columns):
+        fit = statsmodels_fit(series[name], factors)
+        assert result.nobs[j] == fit.nobs
+        assert result.df_resid[j] == fit.df_resid
+        np.testing.assert_allclose(result.params[:, j], fit.params, rtol=1e-8)
+        np.testing.assert_allclose(result.bse[:, j], fit.bse, rtol=1e-8)
+        np.testing.assert_allclose(result.pvalues[:, j], fit.pvalues, rtol=1e-6)
+        conf_int = fit.conf_int().to_numpy()
+        np.testing.assert_allclose(result.conf_low[:, j], conf_int[:, 0], rtol=1e-8)
+        np.testing.assert_allclose(result.conf_high[:, j], conf_int[:, 1], rtol=1e-8)
+
+
+def test_summary_matches_the_statsmodels_table(factors, series):
+    result = fit_ols(series, factors)
+
+    for name in series.columns:
+        expected = statsmodels_summary(statsmodels_fit(series[name], factors))
+        summary = result.summary(name)
+        assert list(summary.columns) == SUMMARY_COLUMNS
+        pd.testing.assert_frame_equal(summary, expected, check_dtype=False)
+
+
+def test_series_without_residual_dof_stay_nan(factors, series):
+    series["empty"] = np.nan
+    series["short"] = np.nan
+    series.loc[:2, "short"] = 1.0
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = fit_ols(series, factors)
+
+    for name in ["empty", "short"]:
+        j = series.columns.get_loc(name)
+        assert np.isnan(result.params[:, j]).all()
+        assert np.isnan(result.pvalues[:, j]).all()
+    assert result.nobs[series.columns.get_loc("short")] == 3
+    assert not np.isnan(result.params[:, 0]).any()
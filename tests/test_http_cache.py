@@ -0,0 +1,76 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+import pytest
+
+from common.http_cache import HttpCache
+
+
+@pytest.fixture
+def server():
+    """Serves a JSON body with an ETag, answering 304 to a matching
+    If-None-Match, and records the requests it receives."""
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append((self.path, self.headers.get("If-None-Match")))
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+                return
+            body = b'{"price": 1}'
+            self.send_response(200)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("localhost", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    host, port = httpd.server_address[:2]
+    yield f"http://{host}:{port}/quote", requests
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_fresh_entries_are_served_from_disk(server, tmp_path):
+    url, requests = server
+    cache = HttpCache(str(tmp_path))
+
+    first = cache.get(url, params={"symbol": "AAPL"}, ttl=60)
+    second = cache.get(url, params={"symbol": "AAPL"}, ttl=60)
+
+    assert first.json() == second.json() == {"price": 1}
+    assert not first.from_cache and second.from_cache
+    assert len(requests) == 1
+
+
+def test_stale_entries_are_revalidated(server, tmp_path):
+    url, requests = server
+    cache = HttpCache(str(tmp_path))
+
+    cache.get(url, ttl=0)
+    revalidated = cache.get(url, ttl=0)
+
+    assert revalidated.from_cache
+    assert revalidated.status_code == 200
+    assert revalidated.json() == {"price": 1}
+    assert [etag for _, etag in requests] == [None, '"v1"']
+
+
+def test_entries_are_keyed_by_query_parameters(server, tmp_path):
+    url, requests = server
+    cache = HttpCache(str(tmp_path))
+
+    cache.get(url, params={"symbol": "AAPL"}, ttl=60)
+    cache.get(url, params={"symbol": "MSFT"}, ttl=60)
+
+    assert [path for path, _ in requests] == [
+        "/quote?symbol=AAPL",
+        "/quote?symbol=MSFT",
+    ]
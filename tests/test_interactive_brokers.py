@@ -0,0 +1,67 @@
+from dataclasses import MISSING, fields
+import json
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from common.fixture_server import FixtureServer  # noqa: E402
+from common.interactive_brokers import (  # noqa: E402
+    IB_POSITIONS_PAGE_SIZE,
+    InteractiveBrokersApi,
+)
+from common.models import Account, Position  # noqa: E402
+
+PLACEHOLDERS = {str: "", int: 0, bool: False, list: [], dict: {}}
+
+
+def make(cls, **values) -> dict:
+    """Fill every required field of `cls` with a placeholder of its type."""
+    record = {
+        f.name: PLACEHOLDERS.get(f.type, None)
+        for f in fields(cls)
+        if f.default is MISSING and f.default_factory is MISSING
+    }
+    return {**record, **values}
+
+
+@pytest.fixture
+def positions_server(tmp_path):
+    page = IB_POSITIONS_PAGE_SIZE
+    counts = {"U1": 2 * page + 50, "U2": 3, "U3": 0, "U4": 2 * page}
+    positions = [
+        make(Position, acctId=account, conid=conid)
+        for account, count in counts.items()
+        for conid in range(count)
+    ]
+    (tmp_path / "positions.json").write_text(json.dumps(positions))
+    with FixtureServer(str(tmp_path)) as server:
+        yield server, counts
+
+
+def test_positions_are_fetched_across_pages(positions_server):
+    server, counts = positions_server
+    api = InteractiveBrokersApi(base_url=server.base_url)
+    accounts = [Account(**make(Account, accountId=account)) for account in counts]
+
+    accounts = api.fetch_account_positions(accounts)
+
+    for account in accounts:
+        conids = [position.conid for position in account.positions]
+        assert conids == list(range(counts[account.accountId]))
+        assert {p.acctId for p in account.positions} <= {account.accountId}
+
+
+def test_paging_stops_after_a_short_page(positions_server):
+    server, counts = positions_server
+    api = InteractiveBrokersApi(base_url=server.base_url)
+
+    pages = list(
+        api.iter_account_position_pages(Account(**make(Account, accountId="U1")))
+    )
+    assert [len(page) for page in pages] == [IB_POSITIONS_PAGE_SIZE] * 2 + [50]
+    # A full last page costs one extra, empty request that is not yielded
+    pages = list(
+        api.iter_account_position_pages(Account(**make(Account, accountId="U4")))
+    )
+    assert [len(page) for page in pages] == [IB_POSITIONS_PAGE_SIZE] * 2
@@ -0,0 +1,228 @@
+from datetime import date, datetime, timezone
+import time
+
+import pytest
+
+from migration import tables
+from migration.migrations import (
+    MIGRATIONS,
+    apply_migrations,
+    integer_ts_columns,
+    reference_table_snapshots,
+    typed_stock_history_and_ff_factors,
+)
+
+LEGACY_STOCK_HISTORY = """
+CREATE TABLE StockHistory (
+id VARCHAR(40) NOT NULL PRIMARY KEY,
+date VARCHAR(20) NOT NULL,
+symbol VARCHAR(15) NOT NULL,
+price_open DECIMAL(6,5) NOT NULL,
+price_low DECIMAL(6,5) NOT NULL,
+price_high DECIMAL(6,5) NOT NULL,
+price_close DECIMAL(6,5) NOT NULL,
+price_adjclose DECIMAL(6,5) NOT NULL,
+volume DECIMAL(6,5) NOT NULL,
+_ts VARCHAR(20) NOT NULL
+);"""
+
+LEGACY_FF_FACTORS = """
+CREATE TABLE FFFactors (
+id VARCHAR(40) NOT NULL PRIMARY KEY,
+date VARCHAR(20) NOT NULL,
+mkt_rf DECIMAL(10,2) NOT NULL,
+smb DECIMAL(10,2) NOT NULL,
+hml DECIMAL(10,2) NOT NULL,
+rmw DECIMAL(10,2) NOT NULL,
+cma DECIMAL(10,2) NOT NULL,
+rf DECIMAL(10,2) NOT NULL,
+_ts VARCHAR(30) NOT NULL
+);"""
+
+TS = "2023-02-01 12:00:00"
+# Legacy `_ts` values were written with datetime.now(), i.e. in local time
+EPOCH_TS = int(datetime(2023, 2, 1, 12).timestamp())
+
+
+def epoch_days(day: date) -> int:
+    return (day - date(1970, 1, 1)).days
+
+
+def create_legacy_tables(db_conn) -> None:
+    db_conn.execute_query(LEGACY_STOCK_HISTORY)
+    db_conn.execute_query(LEGACY_FF_FACTORS)
+    db_conn.execute_query(
+        f"""INSERT INTO StockHistory VALUES
+            ('h1', '2023-01-31 00:00', 'AAPL', '1.5', 1, 2, '1.75', 1.7, '100', '{TS}'),
+            ('h2', '2023-01-31', 'MSFT', 2.5, 2, 3, 2.75, 2.7, 200, '{TS}')"""
+    )
+    db_conn.execute_query(
+        f"""INSERT INTO FFFactors VALUES
+            ('f1', '2023-01-01', '0.5', 0.1, 0.2, 0.3, 0.4, '0.01', '{TS}')"""
+    )
+
+
+def test_typed_schema_converts_legacy_rows(db_conn):
+    create_legacy_tables(db_conn)
+    with db_conn.connections.writer() as conn:
+        typed_stock_history_and_ff_factors(conn)
+
+    history = db_conn.sql_query_to_df(
+        """SELECT h.id, s.symbol, h.date, h.price_open, h.price_close, h.volume,
+            h._ts, typeof(h.price_open) AS price_type
+            FROM StockHistory h
+            JOIN DimSymbol s ON s.symbol_id = h.symbol_id
+            ORDER BY h.id"""
+    )
+    assert history.to_dict("list") == {
+        "id": ["h1", "h2"],
+        "symbol": ["AAPL", "MSFT"],
+        "date": [epoch_days(date(2023, 1, 31))] * 2,
+        "price_open": [1.5, 2.5],
+        "price_close": [1.75, 2.75],
+        "volume": [100, 200],
+        "_ts": [EPOCH_TS] * 2,
+        "price_type": ["real", "real"],
+    }
+    factors = db_conn.sql_query_to_df("SELECT date, mkt_rf, rf, _ts FROM FFFactors")
+    assert factors.to_dict("records") == [
+        {
+            "date": epoch_days(date(2023, 1, 1)),
+            "mkt_rf": 0.5,
+            "rf": 0.01,
+            "_ts": EPOCH_TS,
+        }
+    ]
+
+
+@pytest.fixture
+def new_york_time(monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_legacy_timestamps_are_read_as_local_time(db_conn, new_york_time):
+    create_legacy_tables(db_conn)
+    with db_conn.connections.writer() as conn:
+        typed_stock_history_and_ff_factors(conn)
+
+    stored = db_conn.sql_query_to_df("SELECT DISTINCT _ts FROM StockHistory")
+    # 12:00 in New York (EST) is 17:00 UTC
+    noon_in_new_york = datetime(2023, 2, 1, 17, tzinfo=timezone.utc)
+    assert list(stored["_ts"]) == [int(noon_in_new_york.timestamp())]
+
+
+def test_typed_schema_migration_is_idempotent(db_conn):
+    create_legacy_tables(db_conn)
+    for _ in range(2):
+        with db_conn.connections.writer() as conn:
+            typed_stock_history_and_ff_factors(conn)
+
+    assert db_conn.sql_query_to_df("SELECT * FROM StockHistory").shape[0] == 2
+    assert db_conn.sql_query_to_df("SELECT * FROM DimSymbol").shape[0] == 2
+
+
+def create_current_tables(db_conn) -> None:
+    for name in ["StockContract", "DimSymbol", "StockHistory", "FFFactors"]:
+        db_conn.execute_query(getattr(tables, name))
+
+
+def schema_versions(db_conn) -> list[int]:
+    df = db_conn.sql_query_to_df("SELECT version FROM SchemaVersion ORDER BY 1")
+    return list(df["version"])
+
+
+def test_migrations_are_recorded_and_applied_once(db_conn):
+    create_current_tables(db_conn)
+    versions = [migration.version for migration in MIGRATIONS]
+
+    assert apply_migrations(db_conn) == versions
+    assert apply_migrations(db_conn) == []
+    assert schema_versions(db_conn) == versions
+    indexes = db_conn.sql_query_to_df(
+        "SELECT name FROM sqlite_schema WHERE type = 'index' AND name LIKE 'ix_%'"
+    )
+    assert set(indexes["name"]) == {
+        "ix_StockHistory_symbol_id_date",
+        "ix_StockHistory_date_symbol_id",
+        "ix_StockContract_isUS_symbol",
+        "ix_FFFactors_date",
+    }
+
+
+def test_index_migration_fails_without_its_tables(db_conn):
+    db_conn.execute_query(tables.FFFactors)
+
+    with pytest.raises(RuntimeError, match="StockHistory, StockContract"):
+        apply_migrations(db_conn)
+    assert schema_versions(db_conn) == [1]
+
+    create_current_tables(db_conn)
+    assert apply_migrations(db_conn) == [2, 3, 4, 5, 6]
+
+
+def test_reference_tables_keep_one_snapshot(db_conn):
+    db_conn.execute_query("CREATE TABLE Symbol (symbol TEXT, source TEXT, _ts INT)")
+    db_conn.execute_query(
+        """INSERT INTO Symbol VALUES
+            ('AAPL', 'nasdaq', 1), ('AAPL', 'nasdaq', 2), ('MSFT', 'nasdaq', 1),
+            ('AAPL', 'other', 1), (NULL, 'nasdaq', 1)"""
+    )
+    db_conn.execute_query(tables.SP500)
+    db_conn.execute_query(
+        """INSERT INTO SP500 (id, symbol, security, _ts) VALUES
+            ('a1', 'AAPL', 'Apple', '1'), ('a2', 'AAPL', 'Apple Inc.', '2'),
+            ('m1', 'MSFT', 'Microsoft', '1')"""
+    )
+    with db_conn.connections.writer() as conn:
+        reference_table_snapshots(conn)
+
+    symbols = db_conn.sql_query_to_df("SELECT * FROM Symbol ORDER BY symbol, source")
+    assert symbols.to_dict("list") == {
+        "symbol": ["AAPL", "AAPL", "MSFT"],
+        "source": ["nasdaq", "other", "nasdaq"],
+        "_ts": [2, 1, 1],
+    }
+    sp500 = db_conn.sql_query_to_df("SELECT symbol, security FROM SP500 ORDER BY 1")
+    assert sp500.to_dict("list") == {
+        "symbol": ["AAPL", "MSFT"],
+        "security": ["Apple Inc.", "Microsoft"],
+    }
+
+
+def test_ts_columns_are_rebuilt_as_integers(db_conn):
+    db_conn.execute_query(
+        """CREATE TABLE StockContract (
+            id VARCHAR(40) NOT NULL PRIMARY KEY,
+            conid INT NOT NULL,
+            symbol VARCHAR(5) NOT NULL,
+            isUS INT NULL,
+            _ts VARCHAR(30) NOT NULL
+        )"""
+    )
+    db_conn.execute_query(
+        "CREATE INDEX ix_StockContract_isUS_symbol ON StockContract (isUS, symbol)"
+    )
+    db_conn.execute_query(
+        f"""INSERT INTO StockContract VALUES
+            ('a', 1, 'AAPL', 1, 1675252800), ('m', 2, 'MSFT', 1, '{TS}')"""
+    )
+    with db_conn.connections.writer() as conn:
+        integer_ts_columns(conn)
+
+    stored = db_conn.sql_query_to_df(
+        "SELECT id, symbol, _ts, typeof(_ts) AS ts_type FROM StockContract ORDER BY id"
+    )
+    assert stored.to_dict("list") == {
+        "id": ["a", "m"],
+        "symbol": ["AAPL", "MSFT"],
+        "_ts": [1675252800, EPOCH_TS],
+        "ts_type": ["integer", "integer"],
+    }
+    columns = db_conn.sql_query_to_df("PRAGMA table_info(StockContract)")
+    assert columns.set_index("name").loc["_ts", "type"] == "INTEGER"
+    indexes = db_conn.sql_query_to_df("PRAGMA index_list(StockContract)")
+    assert "ix_StockContract_isUS_symbol" in set(indexes["name"])
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analysis.monte_carlo import (
+    PathStatistics,
+    iter_return_chunks,
+    monte_carlo,
+    monte_carlo_parallel,
+)
+
+WEIGHTS = np.array([0.5, 0.3, 0.2])
+MEAN_RETURNS = pd.Series([0.0005, 0.0003, 0.0002])
+COV_MATRIX = pd.DataFrame([[4e-4, 1e-4, 0.0], [1e-4, 2.5e-4, 5e-5], [0.0, 5e-5, 1e-4]])
+
+
+@pytest.mark.parametrize("sampler", ["pseudo", "antithetic", "sobol", "halton"])
+def test_results_do_not_depend_on_the_chunk_size(sampler):
+    def returns(chunk_size):
+        chunks = iter_return_chunks(
+            WEIGHTS, MEAN_RETURNS, COV_MATRIX, 64, 20, 7, chunk_size, sampler
+        )
+        return np.vstack(list(chunks))
+
+    np.testing.assert_array_equal(returns(6), returns(64))
+
+
+@pytest.mark.parametrize("sampler", ["pseudo", "antithetic", "sobol", "halton"])
+def test_terminal_value_matches_the_expected_growth(sampler):
+    T = 50
+    result = monte_carlo(
+        WEIGHTS, MEAN_RETURNS, COV_MATRIX, 4_000, T, 10_000, seed=1, sampler=sampler
+    )
+    expected = 10_000 * (1 + WEIGHTS @ MEAN_RETURNS) ** T
+
+    mean, standard_error = result.expected_terminal_value()
+    assert abs(mean - expected) < 4 * standard_error
+    assert result.paths.shape == (4_000, T)
+
+
+@pytest.mark.parametrize("sampler", ["antithetic", "sobol", "halton"])
+def test_variance_reduction_lowers_the_estimate_spread(sampler):
+    def spread(sampler):
+        # Standard deviation of the mean terminal value across seeds
+        means = [
+            monte_carlo(
+                WEIGHTS, MEAN_RETURNS, COV_MATRIX, 512, 50, seed=seed, sampler=sampler
+            ).terminal_values.mean()
+            for seed in range(10)
+        ]
+        return np.std(means, ddof=1)
+
+    assert spread(sampler) < spread("pseudo") / 2
+
+
+@pytest.mark.parametrize("sampler", ["sobol", "halton"])
+def test_quasi_random_paths_beyond_the_dimension_cap(sampler):
+    # 3 assets over 8,000 days is 24,000 dimensions, above Sobol's 21,201
+    chunks = iter_return_chunks(
+        WEIGHTS, MEAN_RETURNS, COV_MATRIX, 4, 8_000, 0, sampler=sampler
+    )
+    returns = np.vstack(list(chunks))
+
+    assert returns.shape == (4, 8_000)
+    assert np.isfinite(returns).all()
+
+
+def test_unknown_samplers_are_rejected():
+    with pytest.raises(ValueError, match="Unknown sampler"):
+        monte_carlo(WEIGHTS, MEAN_RETURNS, COV_MATRIX, sampler="latin")
+
+
+def test_parallel_runs_are_reproducible_and_merge_statistics():
+    def run():
+        return monte_carlo_parallel(
+            WEIGHTS, MEAN_RETURNS, COV_MATRIX, 101, 30, seed=3, workers=2
+        )
+
+    first, second = run(), run()
+
+    np.testing.assert_array_equal(first.paths, second.paths)
+    expected = PathStatistics.from_paths(first.paths)
+    assert first.statistics.count == 101
+    np.testing.assert_allclose(first.statistics.mean, expected.mean)
+    np.testing.assert_allclose(first.statistics.m2, expected.m2)
+
+
+@pytest.mark.parametrize("simulate", [monte_carlo, monte_carlo_parallel])
+def test_non_positive_path_counts_are_rejected(simulate):
+    with pytest.raises(ValueError, match="mc_sims"):
+        simulate(WEIGHTS, MEAN_RETURNS, COV_MATRIX, mc_sims=0)
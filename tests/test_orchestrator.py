@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.orchestrator import (
+    COMPLETED,
+    FAILED,
+    PARTIAL,
+    SKIPPED,
+    CheckpointStore,
+    Orchestrator,
+    Stage,
+)
+
+
+def test_stages_run_in_dependency_order(db_conn):
+    calls = []
+    stages = [
+        Stage("transform", lambda: calls.append("transform"), depends_on=["load"]),
+        Stage("load", lambda: calls.append("load")),
+    ]
+    orchestrator = Orchestrator(stages, CheckpointStore(db_conn), max_workers=2)
+
+    assert orchestrator.run() == {"transform": COMPLETED, "load": COMPLETED}
+    assert calls == ["load", "transform"]
+
+
+def test_resume_reruns_failed_and_skipped_stages(db_conn):
+    calls, failing = [], [True]
+
+    def load():
+        calls.append("load")
+        if failing[0]:
+            raise RuntimeError("gateway down")
+
+    stages = [
+        Stage("symbols", lambda: calls.append("symbols")),
+        Stage("load", load, depends_on=["symbols"]),
+        Stage("transform", lambda: calls.append("transform"), depends_on=["load"]),
+    ]
+    orchestrator = Orchestrator(stages, CheckpointStore(db_conn))
+    statuses = orchestrator.run(run_id="run-1")
+    assert statuses == {"symbols": COMPLETED, "load": FAILED, "transform": SKIPPED}
+
+    failing[0] = False
+    statuses = orchestrator.run(resume=True)
+    assert set(statuses.values()) == {COMPLETED}
+    assert calls == ["symbols", "load", "load", "transform"]
+
+
+def test_stage_with_failed_symbols_is_not_checkpointed_completed(db_conn):
+    failed = [SimpleNamespace(symbol="AAPL"), SimpleNamespace(symbol="MSFT")]
+    results = [SimpleNamespace(failed_symbols=failed), SimpleNamespace()]
+    checkpoints = CheckpointStore(db_conn)
+    orchestrator = Orchestrator([Stage("prices", lambda: results.pop(0))], checkpoints)
+
+    assert orchestrator.run(run_id="run-1") == {"prices": PARTIAL}
+    checkpoint = db_conn.sql_table_to_df("EtlCheckpoint").iloc[0]
+    assert checkpoint["error"] == "2 failed: AAPL, MSFT"
+    assert checkpoints.latest_unfinished_run() == "run-1"
+
+    assert orchestrator.run(resume=True) == {"prices": COMPLETED}
+    assert checkpoints.completed_stages("run-1") == {"prices"}
+
+
+def test_unknown_dependencies_are_rejected(db_conn):
+    stages = [Stage("load", lambda: None, depends_on=["missing"])]
+    with pytest.raises(ValueError):
+        Orchestrator(stages, CheckpointStore(db_conn))
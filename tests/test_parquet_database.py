@@ -0,0 +1,186 @@
+from datetime import date
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+from pandas import DataFrame
+
+from common import parquet_database
+from common.parquet_database import ParquetDBConnection
+from migration.tables import StockHistory
+
+
+def stock_history(symbol_ids, start: int = 18_900, days: int = 200) -> DataFrame:
+    """Daily bars from 2021-09-30 into 2022, so every symbol spans two years."""
+    symbol_id = np.repeat(symbol_ids, days)
+    day = np.tile(np.arange(start, start + days), len(symbol_ids))
+    price = symbol_id * 100.0 + (day - start)
+    return DataFrame(
+        {
+            "id": [f"{s}-{d}" for s, d in zip(symbol_id, day)],
+            "symbol_id": symbol_id,
+            "date": day,
+            "price_open": price,
+            "price_low": price,
+            "price_high": price,
+            "price_close": price,
+            "price_adjclose": price,
+            "volume": symbol_id * 10,
+        }
+    )
+
+
+@pytest.fixture
+def parquet_conn(tmp_path):
+    return ParquetDBConnection(str(tmp_path / "parquet"))
+
+
+def sorted_rows(df: DataFrame, columns) -> DataFrame:
+    return df[columns].sort_values(["symbol_id", "date"]).reset_index(drop=True)
+
+
+def test_stock_history_is_partitioned_by_symbol_and_year(parquet_conn):
+    parquet_conn.upsert_df_to_sql_table(stock_history([1, 2]), "StockHistory")
+
+    partitions = sorted(
+        os.path.relpath(directory, parquet_conn._table_path("StockHistory"))
+        for directory, _, files in os.walk(parquet_conn.root)
+        if files
+    )
+    assert partitions == [
+        "symbol_id=1/year=2021",
+        "symbol_id=1/year=2022",
+        "symbol_id=2/year=2021",
+        "symbol_id=2/year=2022",
+    ]
+    assert parquet_conn.fetch_tables_in_db() == [("StockHistory",)]
+
+
+def test_reads_push_down_projection_and_filters(parquet_conn):
+    df = stock_history([1, 2, 3])
+    parquet_conn.upsert_df_to_sql_table(df, "StockHistory")
+    columns = ["symbol_id", "date", "price_adjclose"]
+
+    stored = parquet_conn.sql_table_to_df(
+        "StockHistory",
+        columns=columns,
+        filters={"symbol_id": [1, 3]},
+        date_range=(date(2022, 1, 1), date(2022, 1, 31)),
+    )
+
+    expected = df[df["symbol_id"].isin([1, 3]) & df["date"].between(18993, 19023)]
+    assert list(stored.columns) == columns
+    pd.testing.assert_frame_equal(
+        sorted_rows(stored, columns), sorted_rows(expected, columns)
+    )
+    # The date range prunes the 2021 partitions before any file is opened
+    dataset = parquet_conn._dataset("StockHistory")
+    expression = parquet_conn._filter(
+        "StockHistory", {"symbol_id": 1}, (date(2022, 1, 1), date(2022, 1, 31))
+    )
+    fragments = list(dataset.get_fragments(filter=expression))
+    assert [os.path.basename(os.path.dirname(f.path)) for f in fragments] == [
+        "year=2022"
+    ]
+
+
+def test_upsert_replaces_rows_and_leaves_other_partitions_alone(parquet_conn):
+    parquet_conn.upsert_df_to_sql_table(stock_history([1, 2]), "StockHistory")
+    untouched = os.path.join(
+        parquet_conn._table_path("StockHistory"),
+        "symbol_id=2/year=2021",
+        "part-0.parquet",
+    )
+    before = os.stat(untouched).st_mtime_ns
+
+    update = stock_history([1], start=19_050, days=100).assign(price_close=-1.0)
+    parquet_conn.upsert_df_to_sql_table(update, "StockHistory")
+
+    stored = parquet_conn.sql_table_to_df("StockHistory", filters={"symbol_id": 1})
+    assert len(stored) == 250
+    assert stored["id"].is_unique
+    assert (stored.loc[stored["date"] >= 19_050, "price_close"] == -1.0).all()
+    assert (stored.loc[stored["date"] < 19_050, "price_close"] > 0).all()
+    assert os.stat(untouched).st_mtime_ns == before
+
+
+def test_failed_partition_write_keeps_the_previous_rows(parquet_conn, monkeypatch):
+    parquet_conn.upsert_df_to_sql_table(stock_history([1]), "StockHistory")
+
+    def fail(table, where, **kwargs):
+        with open(where, "wb") as f:
+            f.write(b"partial")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pq, "write_table", fail)
+    with pytest.raises(OSError):
+        parquet_conn.upsert_df_to_sql_table(
+            stock_history([1]).assign(price_close=-1.0), "StockHistory"
+        )
+    with pytest.raises(OSError):
+        parquet_conn.df_to_sql_table(
+            stock_history([1]), "StockHistory", if_exists="replace"
+        )
+    monkeypatch.undo()
+
+    stored = parquet_conn.sql_table_to_df("StockHistory")
+    assert len(stored) == 200
+    assert (stored["price_close"] > 0).all()
+    leftovers = [
+        name
+        for _, directories, files in os.walk(parquet_conn.root)
+        for name in directories + files
+        if name.startswith(".")
+    ]
+    assert leftovers == []
+
+
+def test_replace_append_and_fail(parquet_conn):
+    parquet_conn.df_to_sql_table(stock_history([1]), "StockHistory")
+    parquet_conn.df_to_sql_table(stock_history([2]), "StockHistory")
+    assert len(parquet_conn.sql_table_to_df("StockHistory")) == 400
+
+    parquet_conn.df_to_sql_table(
+        stock_history([3]), "StockHistory", if_exists="replace"
+    )
+    stored = parquet_conn.sql_table_to_df("StockHistory", columns=["symbol_id"])
+    assert set(stored["symbol_id"]) == {3}
+    with pytest.raises(ValueError):
+        parquet_conn.df_to_sql_table(
+            stock_history([3]), "StockHistory", if_exists="fail"
+        )
+
+
+def test_copy_table_from_sqlite(parquet_conn, db_conn):
+    df = stock_history([1, 2, 3])
+    db_conn.execute_query(StockHistory)
+    db_conn.bulk_insert(df, "StockHistory")
+
+    assert parquet_conn.copy_table(db_conn, "StockHistory", chunksize=150) == 600
+
+    columns = list(df.columns) + ["_ts"]
+    pd.testing.assert_frame_equal(
+        sorted_rows(parquet_conn.sql_table_to_df("StockHistory"), columns),
+        sorted_rows(db_conn.sql_table_to_df("StockHistory"), columns),
+    )
+
+
+def test_deduplicate_table_keeps_the_last_row(parquet_conn):
+    df = stock_history([1], days=10)
+    parquet_conn.df_to_sql_table(df, "StockHistory")
+    parquet_conn.df_to_sql_table(df.assign(volume=-1), "StockHistory")
+
+    parquet_conn.deduplicate_table("StockHistory")
+
+    stored = parquet_conn.sql_table_to_df("StockHistory")
+    assert len(stored) == 10
+    assert (stored["volume"] == -1).all()
+
+
+def test_sql_is_not_supported(parquet_conn):
+    with pytest.raises(NotImplementedError):
+        parquet_conn.sql_query_to_df("SELECT 1")
+    with pytest.raises(NotImplementedError):
+        list(parquet_conn.iter_sql_table_chunks("StockHistory", order_by=["date"]))
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analysis.rolling import rolling_moments
+
+
+@pytest.fixture
+def returns():
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range("2022-01-03", periods=120)
+    return pd.DataFrame(rng.normal(0, 0.02, (120, 3)), index=dates, columns=list("abc"))
+
+
+def pandas_covariances(rolled_cov: pd.DataFrame, returns: pd.DataFrame) -> np.ndarray:
+    return rolled_cov.to_numpy().reshape(len(returns), returns.shape[1], -1)
+
+
+def test_sliding_window_matches_pandas_rolling(returns):
+    moments = rolling_moments(returns, window=20)
+
+    expected_means = returns.rolling(20).mean()
+    expected_covariances = pandas_covariances(returns.rolling(20).cov(), returns)
+    np.testing.assert_allclose(moments.means, expected_means, rtol=1e-10)
+    np.testing.assert_allclose(
+        moments.covariances, expected_covariances, rtol=1e-8, atol=1e-15
+    )
+    assert moments.valid_dates()[0] == returns.index[19]
+    pd.testing.assert_frame_equal(
+        moments.covariance(), returns.iloc[-20:].cov(), check_exact=False
+    )
+
+
+def test_missing_rows_are_skipped_within_the_window(returns):
+    returns.iloc[[5, 30, 31], 1] = np.nan
+    moments = rolling_moments(returns, window=20)
+
+    for position in [24, 40, 119]:
+        window = returns.iloc[position - 19 : position + 1].dropna()
+        assert moments.counts[position] == len(window)
+        np.testing.assert_allclose(moments.means[position], window.mean())
+        np.testing.assert_allclose(moments.covariances[position], window.cov())
+
+
+def test_exponential_window_matches_pandas_ewm(returns):
+    moments = rolling_moments(returns, halflife=10)
+
+    ewm = returns.ewm(halflife=10, adjust=False)
+    expected_covariances = pandas_covariances(ewm.cov(bias=True), returns)
+    np.testing.assert_allclose(moments.means[1:], ewm.mean()[1:], rtol=1e-10)
+    np.testing.assert_allclose(
+        moments.covariances[1:], expected_covariances[1:], rtol=1e-8, atol=1e-15
+    )
+
+
+def test_exactly_one_window_kind_is_required(returns):
+    with pytest.raises(ValueError):
+        rolling_moments(returns)
+    with pytest.raises(ValueError):
+        rolling_moments(returns, window=20, halflife=10)
@@ -0,0 +1,77 @@
+import pytest
+from pandas import DataFrame
+
+from migration import tables
+from src.snapshots import ReferenceSnapshots, ReferenceTable, SnapshotValidationError
+
+SYMBOL = ReferenceTable("Symbol", min_rows=2, max_shrink=0.5, retention=2)
+
+
+def symbols(*names: str) -> DataFrame:
+    return DataFrame({"symbol": list(names), "source": "nasdaq"})
+
+
+def live_symbols(db_conn) -> list[str]:
+    df = db_conn.sql_query_to_df("SELECT symbol FROM Symbol ORDER BY symbol")
+    return list(df["symbol"])
+
+
+@pytest.fixture
+def snapshots(db_conn):
+    db_conn.execute_query(tables.Symbol)
+    db_conn.execute_query("CREATE INDEX ix_Symbol_source ON Symbol (source)")
+    return ReferenceSnapshots(db_conn)
+
+
+def test_load_swaps_in_the_new_snapshot(db_conn, snapshots):
+    first = snapshots.load(SYMBOL, symbols("AAPL", "MSFT"))
+    second = snapshots.load(SYMBOL, symbols("AAPL", "MSFT", "NVDA"))
+
+    assert live_symbols(db_conn) == ["AAPL", "MSFT", "NVDA"]
+    assert snapshots.snapshot_ids(SYMBOL) == [first, second]
+    assert list(snapshots.snapshot(SYMBOL, first)["symbol"]) == ["AAPL", "MSFT"]
+    assert db_conn.table_exists("Symbol")
+    assert not db_conn.table_exists(SYMBOL.staging_table)
+    indexes = db_conn.execute_query(
+        "SELECT name FROM sqlite_schema WHERE type = 'index' AND tbl_name = 'Symbol'"
+    )
+    assert ("ix_Symbol_source",) in indexes
+
+
+@pytest.mark.parametrize(
+    "rejected",
+    [symbols("AAPL"), symbols("AAPL", "AAPL")],
+    ids=["too_few_rows", "duplicate_key"],
+)
+def test_rejected_snapshot_leaves_live_table_untouched(db_conn, snapshots, rejected):
+    snapshots.load(SYMBOL, symbols("AAPL", "MSFT", "NVDA", "TSLA"))
+
+    with pytest.raises(SnapshotValidationError):
+        snapshots.load(SYMBOL, rejected)
+
+    assert live_symbols(db_conn) == ["AAPL", "MSFT", "NVDA", "TSLA"]
+    assert len(snapshots.snapshot_ids(SYMBOL)) == 1
+    assert not db_conn.table_exists(SYMBOL.staging_table)
+
+
+def test_failed_swap_rolls_back(db_conn, snapshots, monkeypatch):
+    first = snapshots.load(SYMBOL, symbols("AAPL", "MSFT"))
+
+    def fail(conn, reference):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(snapshots, "_prune", fail)
+    with pytest.raises(RuntimeError):
+        snapshots.load(SYMBOL, symbols("AAPL", "MSFT", "NVDA"))
+
+    assert live_symbols(db_conn) == ["AAPL", "MSFT"]
+    assert snapshots.snapshot_ids(SYMBOL) == [first]
+    stored = db_conn.sql_query_to_df(f"SELECT * FROM {SYMBOL.snapshot_table}")
+    assert set(stored["snapshot_id"]) == {first}
+
+
+def test_old_snapshots_are_pruned(snapshots):
+    loaded = [snapshots.load(SYMBOL, symbols("AAPL", "MSFT")) for _ in range(4)]
+
+    assert snapshots.snapshot_ids(SYMBOL) == loaded[-2:]
+    assert snapshots.snapshot(SYMBOL, loaded[0]).empty
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+from common.sql_queries import STOCK_HISTORY_MONTHLY_ROLLUP
+from migration import tables
+from migration.check_query_plans import find_full_scans, find_temp_sorts
+from migration.migrations import apply_migrations
+
+MONTHLY_COLUMNS = [
+    "symbol_id",
+    "month",
+    "price_open",
+    "price_high",
+    "price_low",
+    "price_close",
+    "price_adjclose",
+    "volume",
+]
+
+
+def daily_bars(symbol_ids: list[int], start: str, end: str) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range(start, end)
+    frames = [
+        pd.DataFrame(
+            {
+                "id": [f"{symbol_id}-{day:%Y%m%d}" for day in dates],
+                "symbol_id": symbol_id,
+                "date": (dates - pd.Timestamp(0)).days,
+                "price_open": rng.random(len(dates)),
+                "price_low": rng.random(len(dates)),
+                "price_high": rng.random(len(dates)),
+                "price_close": rng.random(len(dates)),
+                "price_adjclose": rng.random(len(dates)),
+                "volume": rng.integers(0, 1_000, len(dates)),
+            }
+        )
+        for symbol_id in symbol_ids
+    ]
+    return pd.concat(frames, ignore_index=True)
+
+
+def resample_monthly(bars: pd.DataFrame) -> pd.DataFrame:
+    dates = pd.to_datetime(bars["date"], unit="D")
+    monthly = (
+        bars.set_index(dates)
+        .groupby("symbol_id")
+        .resample("MS")
+        .agg(
+            {
+                "price_open": "first",
+                "price_high": "max",
+                "price_low": "min",
+                "price_close": "last",
+                "price_adjclose": "last",
+                "volume": "sum",
+            }
+        )
+        .reset_index()
+    )
+    monthly["month"] = (monthly["date"] - pd.Timestamp(0)).dt.days
+    return monthly[MONTHLY_COLUMNS]
+
+
+def stored_monthly(db_conn) -> pd.DataFrame:
+    return db_conn.sql_query_to_df(
+        f"""SELECT {", ".join(MONTHLY_COLUMNS)} FROM StockHistoryMonthly
+            ORDER BY symbol_id, month"""
+    )
+
+
+def migrated_database(db_conn, bars: pd.DataFrame) -> None:
+    for name in ["StockContract", "DimSymbol", "StockHistory", "FFFactors"]:
+        db_conn.execute_query(getattr(tables, name))
+    db_conn.bulk_insert(bars, "StockHistory")
+    apply_migrations(db_conn)
+
+
+def test_backfilled_rollup_matches_pandas_resample(db_conn):
+    bars = daily_bars([1, 2], "2021-11-15", "2022-03-10")
+    migrated_database(db_conn, bars)
+
+    pd.testing.assert_frame_equal(
+        stored_monthly(db_conn), resample_monthly(bars), check_dtype=False
+    )
+
+
+def epoch_days(day: str) -> int:
+    return (pd.Timestamp(day) - pd.Timestamp(0)).days
+
+
+def test_rollup_refreshes_only_touched_months(db_conn):
+    bars = daily_bars([1, 2], "2021-11-15", "2022-03-10")
+    migrated_database(db_conn, bars)
+    revised = bars.assign(price_close=bars["price_close"] + 10)
+    db_conn.upsert_df_to_sql_table(revised, table="StockHistory")
+
+    february = [1, epoch_days("2022-02-01"), epoch_days("2022-03-01")]
+    with db_conn.connections.writer() as conn:
+        conn.executemany(STOCK_HISTORY_MONTHLY_ROLLUP, [february])
+
+    expected = resample_monthly(bars)
+    touched = (expected["symbol_id"] == 1) & (expected["month"] == february[1])
+    expected.loc[touched] = resample_monthly(revised).loc[touched]
+    pd.testing.assert_frame_equal(stored_monthly(db_conn), expected, check_dtype=False)
+
+
+def test_query_plans_use_index_searches(db_conn):
+    migrated_database(db_conn, daily_bars([1], "2022-01-03", "2022-01-31"))
+
+    assert find_full_scans(db_conn) == {}
+    assert find_temp_sorts(db_conn) == {}
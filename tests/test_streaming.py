@@ -0,0 +1,117 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+
+from migration import tables
+from migration.migrations import apply_migrations
+from src.analysis.streaming import (
+    RunningCovariance,
+    iter_stock_history,
+    per_symbol_returns,
+    running_covariance,
+)
+
+
+def price_panel(n_dates: int = 60, n_symbols: int = 3) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0.001, 0.02, (n_dates, n_symbols))
+    prices = 100 * np.cumprod(1 + returns, axis=0)
+    return pd.DataFrame(prices, columns=range(1, n_symbols + 1))
+
+
+def stored_stock_history(db_conn, prices: pd.DataFrame) -> None:
+    db_conn.execute_query(tables.StockHistory)
+    long = (
+        prices.rename_axis("date")
+        .reset_index()
+        .melt(id_vars="date", var_name="symbol_id", value_name="price_close")
+    )
+    db_conn.bulk_insert(
+        long.assign(
+            id=long["symbol_id"].astype(str) + "-" + long["date"].astype(str),
+            date=long["date"] + 19000,
+            price_open=0.0,
+            price_low=0.0,
+            price_high=0.0,
+            price_adjclose=long["price_close"],
+            volume=0,
+        ),
+        "StockHistory",
+    )
+
+
+def test_running_covariance_matches_np_cov():
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame(rng.normal(size=(100, 4)), columns=list("abcd"))
+    df.iloc[[3, 40, 77], [0, 2, 3]] = np.nan
+
+    covariance = RunningCovariance()
+    for start in range(0, len(df), 7):
+        covariance.update(df.iloc[start : start + 7])
+
+    complete = df.dropna().to_numpy()
+    assert covariance.count == len(complete)
+    np.testing.assert_allclose(covariance.mean, complete.mean(axis=0))
+    np.testing.assert_allclose(covariance.covariance(), np.cov(complete.T))
+    np.testing.assert_allclose(
+        covariance.covariance(ddof=0), np.cov(complete.T, ddof=0)
+    )
+
+
+def test_streamed_covariance_matches_in_memory_returns(db_conn):
+    prices = price_panel()
+    stored_stock_history(db_conn, prices)
+
+    chunks = iter_stock_history(db_conn, by_date=True, chunksize=17)
+    covariance = running_covariance(chunks)
+
+    returns = prices.pct_change().dropna()
+    np.testing.assert_allclose(covariance.covariance(), np.cov(returns.T))
+
+
+def test_per_symbol_returns_across_chunks(db_conn):
+    prices = price_panel()
+    stored_stock_history(db_conn, prices)
+
+    stats = per_symbol_returns(iter_stock_history(db_conn, chunksize=25))
+
+    returns = prices.pct_change().dropna()
+    assert stats["periods"].tolist() == [len(returns)] * 3
+    np.testing.assert_allclose(stats["mean_return"], returns.mean())
+    np.testing.assert_allclose(stats["volatility"], returns.std())
+    np.testing.assert_allclose(
+        stats["total_return"], prices.iloc[-1] / prices.iloc[0] - 1
+    )
+
+
+def test_query_chunks_are_bounded(db_conn):
+    stored_stock_history(db_conn, price_panel(n_dates=10))
+    query = "SELECT symbol_id, date FROM StockHistory"
+
+    frames = list(db_conn.iter_sql_query_chunks(query, chunksize=8))
+    batches = list(db_conn.iter_sql_query_chunks(query, chunksize=8, arrow=True))
+
+    assert [len(df) for df in frames] == [8, 8, 8, 6]
+    assert all(isinstance(batch, pa.RecordBatch) for batch in batches)
+    assert sum(batch.num_rows for batch in batches) == 30
+
+
+@pytest.mark.parametrize("by_date", [True, False])
+def test_streams_are_read_in_index_order(db_conn, monkeypatch, by_date):
+    for name in ["StockContract", "DimSymbol", "FFFactors"]:
+        db_conn.execute_query(getattr(tables, name))
+    stored_stock_history(db_conn, price_panel())
+    apply_migrations(db_conn)
+    queries = []
+    monkeypatch.setattr(
+        db_conn,
+        "iter_sql_query_chunks",
+        lambda query, params, *args: queries.append((query, params)),
+    )
+
+    iter_stock_history(db_conn, by_date=by_date)
+
+    [(query, params)] = queries
+    plan = db_conn.sql_query_to_df(f"EXPLAIN QUERY PLAN {query}", params=params)
+    assert "USE TEMP B-TREE FOR ORDER BY" not in list(plan["detail"])